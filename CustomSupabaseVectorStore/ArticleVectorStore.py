@@ -1,13 +1,61 @@
 import os
-import psycopg2
-from typing import List, Tuple, Any, Dict, Iterable
+from typing import List, Tuple, Any, Dict, Iterable, Optional
 from langchain.docstore.document import Document
 from langchain.vectorstores.base import VectorStore
 from langchain.embeddings.base import Embeddings
+from psycopg.rows import dict_row
+from database import get_db_connection
+from .VectorIndex import set_ef_search, set_filtered_scan
+from .SearchFilters import SearchFilters
+
+# Columns a search result can be projected to.
+ARTICLE_FIELDS = {
+    "id": "sa.id",
+    "url": "sa.url",
+    "title": "sa.title",
+    "author": "sa.author",
+    "cleaned_text": "sa.cleaned_text",
+    "description": "sa.cleaned_text",
+    "source": "sa.source",
+    "publication_date": "sa.publication_date",
+    "distance": "n.distance",
+    # Higher is better: cosine similarity, or the fused RRF score in hybrid search.
+    "score": "n.score",
+    "analysis_mode": "aa.mode",
+    "countries": "aa.countries",
+    "commodities": "aa.commodities",
+    "contract_value": "aa.contract_value",
+    "deadline": "aa.deadline",
+}
+DEFAULT_RECORD_FIELDS = ("id", "url", "title", "source", "publication_date", "distance")
+# Reciprocal rank fusion constant: a result's score is sum(1 / (RRF_K + rank)).
+RRF_K = 60
+# Candidates each hybrid branch contributes to the fusion, per requested row.
+HYBRID_CANDIDATES_PER_RESULT = 4
+MIN_HYBRID_CANDIDATES = 40
+MAX_HYBRID_CANDIDATES = 200
+# Full-text configuration; must match the scraped_articles.search_tsv column.
+TEXT_SEARCH_CONFIG = "english"
+
+
+def _projection(fields):
+    """Returns (select list, article_analysis join) for the requested fields."""
+    fields = list(fields)
+    unknown = [name for name in fields if name not in ARTICLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown article fields: {unknown}")
+    projection = ",\n              ".join(f"{ARTICLE_FIELDS[name]} AS {name}" for name in fields)
+    # article_analysis is only joined when an analysis column is asked for.
+    analysis_join = (
+        "LEFT JOIN article_analysis AS aa ON aa.article_id = sa.id"
+        if any(ARTICLE_FIELDS[name].startswith("aa.") for name in fields) else ""
+    )
+    return projection, analysis_join
+
 
 class ArticleVectorStore(VectorStore):
     def __init__(self, db_connection_string: str, embedding_function: Embeddings):
-        self._conn = psycopg2.connect(db_connection_string)
+        # Queries check a connection out of the shared pool per call.
         self._embedding_function = embedding_function
 
     def add_texts(
@@ -24,35 +72,146 @@ class ArticleVectorStore(VectorStore):
         self, query: str, k: int = 4, **kwargs: Any
     ) -> List[Document]:
         query_embedding = self._embedding_function.embed_query(query)
-        return self.similarity_search_by_vector(query_embedding, k)
+        return self.similarity_search_by_vector(query_embedding, k, **kwargs)
 
-    def similarity_search_by_vector(
-        self, embedding: List[float], k: int = 4, **kwargs: Any
-    ) -> List[Document]:
-        with self._conn.cursor() as cur:
-            sql = """
+    def _filters(self, filters: Optional[SearchFilters]) -> Optional[SearchFilters]:
+        return filters
+
+    def search_records(
+        self, embedding: List[float], k: int = 4, fields: Iterable[str] = DEFAULT_RECORD_FIELDS,
+        filters: Optional[SearchFilters] = None, ef_search: Optional[int] = None
+    ) -> List[dict]:
+        """
+        Top-`k` articles by cosine distance, restricted by `filters`, returned
+        as dicts holding just `fields` (keys of ARTICLE_FIELDS), in one query.
+        The predicates run inside the HNSW scan (iterative scan keeps it going
+        until k rows pass), a per-mode partial index serves mode filters, and
+        the planner can instead pre-filter through the btree/GIN indexes when
+        that is cheaper, so selective filters still return k exact results.
+        """
+        projection, analysis_join = _projection(fields)
+        filters = self._filters(filters)
+        where, params = filters.to_sql("ae") if filters else ("", {})
+        params.update({"embedding": embedding, "k": k})
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            # `ef_search` trades recall for speed on the HNSW index.
+            set_ef_search(cur, ef_search, k)
+            if where:
+                set_filtered_scan(cur)
+            sql = f"""
+            WITH nearest AS MATERIALIZED (
+              SELECT ae.article_id, ae.embedding <=> %(embedding)s::vector AS distance
+              FROM article_embeddings AS ae
+              WHERE ae.embedding IS NOT NULL{where}
+              ORDER BY ae.embedding <=> %(embedding)s::vector
+              LIMIT %(k)s
+            )
+            SELECT
+              {projection}
+            FROM
+              (SELECT *, 1 - distance AS score FROM nearest) AS n
+            JOIN
+              scraped_articles AS sa ON n.article_id = sa.id
+            {analysis_join}
+            ORDER BY
+              n.distance ASC;
+            """
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def hybrid_search_records(
+        self, embedding: List[float], query_text: str, k: int = 4, fields: Iterable[str] = DEFAULT_RECORD_FIELDS,
+        filters: Optional[SearchFilters] = None, ef_search: Optional[int] = None
+    ) -> List[dict]:
+        """
+        Like search_records, but fuses the vector ranking with a lexical one
+        in the same statement. The lexical branch matches scraped_articles.search_tsv
+        (title weighted above body) and trigram similarity on the title, so
+        exact tokens such as tender numbers, tickers and place names surface
+        even when the embedding misses them. Both branches take the top
+        candidates under the same filters; results are ordered by reciprocal
+        rank fusion and `distance` is the vector distance.
+        """
+        projection, analysis_join = _projection(fields)
+        filters = self._filters(filters)
+        where, params = filters.to_sql("ae") if filters else ("", {})
+        candidates = min(max(HYBRID_CANDIDATES_PER_RESULT * k, MIN_HYBRID_CANDIDATES), MAX_HYBRID_CANDIDATES)
+        params.update({"embedding": embedding, "query_text": query_text, "k": k, "candidates": candidates, "rrf_k": RRF_K})
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            set_ef_search(cur, ef_search, candidates)
+            if where:
+                set_filtered_scan(cur)
+            sql = f"""
+            WITH vector_hits AS MATERIALIZED (
+              SELECT ae.article_id, ae.embedding <=> %(embedding)s::vector AS distance
+              FROM article_embeddings AS ae
+              WHERE ae.embedding IS NOT NULL{where}
+              ORDER BY ae.embedding <=> %(embedding)s::vector
+              LIMIT %(candidates)s
+            ),
+            lexical_hits AS MATERIALIZED (
+              SELECT
+                sa.id AS article_id,
+                ae.embedding <=> %(embedding)s::vector AS distance,
+                ts_rank_cd(sa.search_tsv, q.query) + similarity(sa.title, %(query_text)s) AS lexical_score
+              FROM scraped_articles AS sa
+              CROSS JOIN websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %(query_text)s) AS q(query)
+              JOIN article_embeddings AS ae ON ae.article_id = sa.id
+              WHERE (sa.search_tsv @@ q.query OR sa.title %% %(query_text)s){where}
+              ORDER BY lexical_score DESC
+              LIMIT %(candidates)s
+            ),
+            ranked AS (
+              SELECT article_id, distance, row_number() OVER (ORDER BY distance) AS rank FROM vector_hits
+              UNION ALL
+              SELECT article_id, distance, row_number() OVER (ORDER BY lexical_score DESC) AS rank FROM lexical_hits
+            ),
+            fused AS (
+              SELECT article_id, MIN(distance) AS distance, SUM(1.0 / (%(rrf_k)s + rank)) AS score
+              FROM ranked
+              GROUP BY article_id
+              ORDER BY score DESC, distance ASC
+              LIMIT %(k)s
+            )
             SELECT
-              sa.id,
-              sa.url,
-              sa.cleaned_text,
-              ae.embedding <=> %s::vector AS distance
+              {projection}
             FROM
-              article_embeddings AS ae
+              fused AS n
             JOIN
-              scraped_articles AS sa ON ae.article_id = sa.id
+              scraped_articles AS sa ON n.article_id = sa.id
+            {analysis_join}
             ORDER BY
-              distance ASC
-            LIMIT %s;
+              n.score DESC, n.distance ASC;
             """
-            cur.execute(sql, (embedding, k))
-            results = cur.fetchall()
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def similarity_search_records(
+        self, query: str, k: int = 4, hybrid: bool = False, **kwargs: Any
+    ) -> List[dict]:
+        """Embeds `query` and returns `search_records` (or `hybrid_search_records`) for it."""
+        query_embedding = self._embedding_function.embed_query(query)
+        if hybrid:
+            return self.hybrid_search_records(query_embedding, query, k, **kwargs)
+        return self.search_records(query_embedding, k, **kwargs)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filters: Optional[SearchFilters] = None,
+        ef_search: Optional[int] = None, **kwargs: Any
+    ) -> List[Document]:
+        results = self.search_records(
+            embedding, k, ("id", "url", "cleaned_text", "distance", "source", "publication_date"),
+            filters=filters, ef_search=ef_search,
+        )
 
         documents = []
         for row in results:
-            documents.append(Document(page_content=row[2], metadata={
-                "id": row[0],
-                "url": row[1],
-                "distance": row[3]}))
+            documents.append(Document(page_content=row["cleaned_text"], metadata={
+                "id": row["id"],
+                "url": row["url"],
+                "distance": row["distance"],
+                "source": row["source"],
+                "publication_date": row["publication_date"]}))
         
         print(f"✅ Found {len(documents)} similar articles for the query.")
 
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import List, Optional, Tuple
+from database import get_db_connection
+
+
+class CompanyEmbeddingIndex:
+    """
+    All company name embeddings held in process as one contiguous float32
+    matrix of unit vectors, so a nearest-company lookup is a single matrix
+    product instead of a sequential `<=>` scan over the companies table.
+    Rows are appended (or replaced) in place as companies are inserted.
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self._lock = threading.Lock()
+        self._dimensions = dimensions
+        self._matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._names: List[str] = []
+        self._rows = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def load(self) -> "CompanyEmbeddingIndex":
+        """Reads every stored company embedding in one query."""
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, real_name, embedding FROM companies WHERE embedding IS NOT NULL ORDER BY id;")
+            rows = cur.fetchall()
+        with self._lock:
+            count = len(rows)
+            self._matrix = self._normalize([row[2] for row in rows]) if rows else np.zeros((0, self._dimensions), dtype=np.float32)
+            self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+            self._names = [row[1] for row in rows]
+            self._rows = {row[0]: i for i, row in enumerate(rows)}
+            self._size = count
+        print(f"Company embedding index loaded {count} companies.")
+        return self
+
+    def signature(self) -> Tuple[int, Optional[int]]:
+        """(company count, highest id) of the indexed companies, comparable with stored_signature()."""
+        with self._lock:
+            return self._size, (int(self._ids[:self._size].max()) if self._size else None)
+
+    def add(self, company_id: int, name: str, embedding):
+        """Adds a company, or replaces its row when the id is already indexed."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            row = self._rows.get(company_id)
+            if row is None:
+                if self._size == len(self._matrix):
+                    # Grow geometrically so repeated inserts stay amortised O(1).
+                    capacity = max(16, 2 * len(self._matrix))
+                    matrix = np.zeros((capacity, self._dimensions), dtype=np.float32)
+                    matrix[:self._size] = self._matrix[:self._size]
+                    ids = np.zeros(capacity, dtype=np.int64)
+                    ids[:self._size] = self._ids[:self._size]
+                    self._matrix, self._ids = matrix, ids
+                row = self._size
+                self._size += 1
+                self._rows[company_id] = row
+                self._ids[row] = company_id
+                self._names.append(name)
+            else:
+                self._names[row] = name
+            self._matrix[row] = vector
+
+    def search(self, embeddings, k: int = 1) -> List[List[Tuple[int, str, float]]]:
+        """
+        Returns, for each query vector, up to `k` (id, real_name, cosine_distance)
+        tuples ordered by distance; the distance matches pgvector's `<=>`.
+        """
+        queries = self._normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        with self._lock:
+            size = self._size
+            matrix, ids, names = self._matrix[:size], self._ids[:size], self._names[:size]
+        if size == 0:
+            return [[] for _ in range(len(queries))]
+
+        similarities = queries @ matrix.T
+        k = min(k, size)
+        results = []
+        for row in similarities:
+            top = np.argpartition(-row, k - 1)[:k] if k < size else np.arange(size)
+            top = top[np.argsort(-row[top])]
+            results.append([(int(ids[i]), names[i], float(1.0 - row[i])) for i in top])
+        return results
+
+
+def load_company_index() -> Optional[CompanyEmbeddingIndex]:
+    """Loads the index, or returns None (SQL search is used instead) if that fails."""
+    try:
+        return CompanyEmbeddingIndex().load()
+    except Exception as e:
+        print(f"Warning: company embedding index unavailable, using SQL search: {e}")
+        return None
+
+
+def stored_signature() -> Tuple[int, Optional[int]]:
+    """(company count, highest id) of the companies with an embedding in the table."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), MAX(id) FROM companies WHERE embedding IS NOT NULL;")
+        count, max_id = cur.fetchone()
+    return count, max_id
+
+
+# One index per process: every CompanyNameVectorStore reads and updates it,
+# so companies inserted by the pipeline and merges by the dedup job are seen
+# by the search endpoints of the same process. Other processes (each
+# gunicorn worker holds its own copy) notice those writes through a cheap
+# count/max-id comparison with the table, made at most every
+# COMPANY_INDEX_CHECK_SECONDS, and reload. A failed load leaves the process
+# on SQL search and is retried after COMPANY_INDEX_RETRY_SECONDS.
+COMPANY_INDEX_CHECK_SECONDS = float(os.getenv("COMPANY_INDEX_CHECK_SECONDS", "30"))
+COMPANY_INDEX_RETRY_SECONDS = float(os.getenv("COMPANY_INDEX_RETRY_SECONDS", "60"))
+
+_company_index: Optional[CompanyEmbeddingIndex] = None
+_company_index_lock = threading.Lock()
+# time.monotonic() deadlines for the next load attempt / staleness check.
+_next_load_attempt = 0.0
+_next_staleness_check = 0.0
+
+
+def _is_stale(index: CompanyEmbeddingIndex) -> bool:
+    try:
+        return stored_signature() != index.signature()
+    except Exception as e:
+        print(f"Warning: could not check the company embedding index for staleness: {e}")
+        return False
+
+
+def get_company_index(refresh: bool = False) -> Optional[CompanyEmbeddingIndex]:
+    """
+    Returns the shared index, loading it on first use; None while it cannot
+    be loaded. The index is reloaded when the companies table no longer
+    matches it, or on `refresh`; a failed reload keeps the current index.
+    """
+    global _company_index, _next_load_attempt, _next_staleness_check
+    now = time.monotonic()
+    if not refresh:
+        if _company_index is not None and now < _next_staleness_check:
+            return _company_index
+        if _company_index is None and now < _next_load_attempt:
+            return None
+    with _company_index_lock:
+        now = time.monotonic()
+        if _company_index is None:
+            if refresh or now >= _next_load_attempt:
+                _company_index = load_company_index()
+                if _company_index is None:
+                    _next_load_attempt = now + COMPANY_INDEX_RETRY_SECONDS
+                else:
+                    _next_staleness_check = now + COMPANY_INDEX_CHECK_SECONDS
+            return _company_index
+        if refresh or now >= _next_staleness_check:
+            if refresh or _is_stale(_company_index):
+                index = load_company_index()
+                if index is not None:
+                    _company_index = index
+            _next_staleness_check = time.monotonic() + COMPANY_INDEX_CHECK_SECONDS
+        return _company_index
@@ -1,14 +1,43 @@
 import os
-import psycopg2
 from typing import List, Tuple, Any, Dict, Iterable, Optional
 from langchain.docstore.document import Document
 from langchain.vectorstores.base import VectorStore
 from langchain.embeddings.base import Embeddings
+from database import get_db_connection
+from .CompanyEmbeddingIndex import CompanyEmbeddingIndex, get_company_index
+from .VectorIndex import set_ef_search
 
 class CompanyNameVectorStore(VectorStore):
-    def __init__(self, db_connection_string: str, embedding_function: Embeddings):
-        self._conn = psycopg2.connect(db_connection_string)
+    def __init__(self, db_connection_string: str, embedding_function: Embeddings, use_local_index: bool = True):
+        # Queries check a connection out of the shared pool per call.
         self._embedding_function = embedding_function
+        # Nearest-neighbour lookups are served from memory when the index loads.
+        # The index is shared by every store in the process.
+        self._use_local_index = use_local_index
+        if use_local_index:
+            get_company_index()
+
+    @property
+    def _index(self) -> Optional[CompanyEmbeddingIndex]:
+        return get_company_index() if self._use_local_index else None
+
+    def reload_index(self):
+        """Rebuilds the shared in-process index from the table, e.g. after companies were merged."""
+        if self._use_local_index:
+            get_company_index(refresh=True)
+
+    def add_to_index(self, company_id: int, real_name: str, embedding: List[float]):
+        """Keeps the shared in-process index in step with a company row just inserted or updated."""
+        index = self._index
+        if index is not None:
+            index.add(company_id, real_name, embedding)
+
+    @staticmethod
+    def _to_document(id_, real_name, distance) -> Document:
+        return Document(page_content=real_name, metadata={
+            "id": id_,
+            "real_name": real_name,
+            "distance": distance})
 
     def add_texts(
         self,
@@ -50,7 +79,15 @@ class CompanyNameVectorStore(VectorStore):
         and the 'k' limit will be ignored. Otherwise, the top 'k' results
         will be returned.
         """
-        with self._conn.cursor() as cur:
+        filters = kwargs.get("filters")
+        if filters is not None and not filters.is_empty():
+            raise ValueError("Company search does not take article filters")
+        if self._index is not None:
+            matches = self._index.search([embedding], k=len(self._index) if score_threshold is not None else k)[0]
+            return [self._to_document(*match) for match in matches if score_threshold is None or match[2] < score_threshold]
+
+        with get_db_connection() as conn, conn.cursor() as cur:
+            set_ef_search(cur, kwargs.get("ef_search"), k)
             sql_template = """
             SELECT
               id,
@@ -95,6 +132,113 @@ class CompanyNameVectorStore(VectorStore):
 
         return documents
 
+    def nearest_companies_sql(self, embedding: List[float], k: int = 4):
+        """
+        Returns (sql, params) for a subquery of the `k` nearest companies as
+        rows (id, rank), rank 1 being the closest, so callers can join their
+        hydration query onto it and search in one round trip. The ids are
+        bound directly when the in-process index answers the lookup.
+        """
+        if self._index is not None:
+            company_ids = [match[0] for match in self._index.search([embedding], k=k)[0]]
+            return (
+                "SELECT id, rank FROM unnest(%(nearest_ids)s::int[]) WITH ORDINALITY AS n(id, rank)",
+                {"nearest_ids": company_ids},
+            )
+        return (
+            """
+            SELECT id, row_number() OVER () AS rank
+            FROM (
+              SELECT id FROM companies
+              WHERE embedding IS NOT NULL
+              ORDER BY embedding <=> %(nearest_embedding)s::vector
+              LIMIT %(nearest_k)s
+            ) nearest_companies
+            """,
+            {"nearest_embedding": str(embedding), "nearest_k": k},
+        )
+
+    def nearest_companies_batch_sql(self, embeddings: List[List[float]], k: int = 4):
+        """
+        Like nearest_companies_sql for several query vectors: a subquery of
+        rows (query_ord, id, rank, distance), query_ord being the 1-based
+        position of the vector in `embeddings`. Served from the in-process
+        index when loaded, otherwise by one LATERAL HNSW lookup per vector.
+        """
+        if self._index is not None:
+            rows = [
+                (query_ord, match[0], rank, match[2])
+                for query_ord, matches in enumerate(self._index.search(embeddings, k=k), start=1)
+                for rank, match in enumerate(matches, start=1)
+            ]
+            return (
+                """
+                SELECT * FROM unnest(%(nearest_ords)s::int[], %(nearest_ids)s::int[], %(nearest_ranks)s::int[],
+                                     %(nearest_distances)s::float8[]) AS n(query_ord, id, rank, distance)
+                """,
+                {
+                    "nearest_ords": [row[0] for row in rows],
+                    "nearest_ids": [row[1] for row in rows],
+                    "nearest_ranks": [row[2] for row in rows],
+                    "nearest_distances": [row[3] for row in rows],
+                },
+            )
+        return (
+            """
+            SELECT q.query_ord, c.id, row_number() OVER (PARTITION BY q.query_ord ORDER BY c.distance) AS rank, c.distance
+            FROM unnest(%(nearest_embeddings)s::vector[]) WITH ORDINALITY AS q(embedding, query_ord)
+            CROSS JOIN LATERAL (
+              SELECT id, companies.embedding <=> q.embedding AS distance
+              FROM companies
+              WHERE companies.embedding IS NOT NULL
+              ORDER BY companies.embedding <=> q.embedding
+              LIMIT %(nearest_k)s
+            ) c
+            """,
+            {"nearest_embeddings": [str(embedding) for embedding in embeddings], "nearest_k": k},
+        )
+
+    def similarity_search_by_vectors(
+        self, embeddings: List[List[float]], k: int = 1, score_threshold: Optional[float] = None, ef_search: Optional[int] = None
+    ) -> List[List[Document]]:
+        """
+        Nearest companies for several query vectors in one round trip.
+        Returns one list of up to `k` documents per input vector, in input
+        order, keeping only matches closer than `score_threshold` when given.
+        """
+        if not embeddings:
+            return []
+        if self._index is not None:
+            return [
+                [self._to_document(*match) for match in matches if score_threshold is None or match[2] < score_threshold]
+                for matches in self._index.search(embeddings, k=k)
+            ]
+
+        with get_db_connection() as conn, conn.cursor() as cur:
+            set_ef_search(cur, ef_search, k)
+            cur.execute(
+                """
+                SELECT q.ord, c.id, c.real_name, c.distance
+                FROM unnest(%(embeddings)s::vector[]) WITH ORDINALITY AS q(embedding, ord)
+                CROSS JOIN LATERAL (
+                    SELECT id, real_name, companies.embedding <=> q.embedding AS distance
+                    FROM companies
+                    ORDER BY companies.embedding <=> q.embedding
+                    LIMIT %(k)s
+                ) c
+                ORDER BY q.ord, c.distance;
+                """,
+                {'embeddings': [str(embedding) for embedding in embeddings], 'k': k},
+            )
+            results = cur.fetchall()
+
+        documents = [[] for _ in embeddings]
+        for ord_, id_, real_name, distance in results:
+            if score_threshold is not None and distance >= score_threshold:
+                continue
+            documents[ord_ - 1].append(self._to_document(id_, real_name, distance))
+        return documents
+
     @classmethod
     def from_texts(
         cls,
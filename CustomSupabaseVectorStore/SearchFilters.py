@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+# analysis_mode enum values; a mode is inlined into the SQL (not bound) so
+# the planner can match the per-mode partial HNSW indexes in tables.sql.
+ANALYSIS_MODES = ("Tender", "Sentiment", "Ignore")
+
+
+def _split(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [item.strip() for item in value if item and item.strip()]
+
+
+def _parse_date(value, end: bool = False):
+    """ISO date or datetime. A bare end date covers that whole day."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        parsed = value
+    else:
+        text = str(value).strip()
+        if "T" in text or " " in text:
+            return datetime.fromisoformat(text.replace("Z", "+00:00"))
+        parsed = date.fromisoformat(text)
+    return parsed + timedelta(days=1) if end else parsed
+
+
+@dataclass
+class SearchFilters:
+    """
+    Structured restrictions for article vector search. Every field is
+    optional; list fields match any of their values. The columns live on
+    article_embeddings itself (mode/countries/commodities are copied there
+    from article_analysis by trigger), so no join is needed before the
+    distance ordering.
+    """
+    sources: List[str] = field(default_factory=list)
+    date_from: Optional[date] = None
+    # Exclusive upper bound.
+    date_to: Optional[date] = None
+    countries: List[str] = field(default_factory=list)
+    commodities: List[str] = field(default_factory=list)
+    mode: Optional[str] = None
+
+    def __post_init__(self):
+        if self.mode is not None and self.mode not in ANALYSIS_MODES:
+            raise ValueError(f"mode must be one of {', '.join(ANALYSIS_MODES)}")
+
+    @classmethod
+    def from_args(cls, args, mode: Optional[str] = None) -> "SearchFilters":
+        """
+        Builds filters from request arguments: source, country and commodity
+        (comma separated), date_from, date_to (inclusive dates or datetimes)
+        and mode. Raises ValueError on malformed values.
+        """
+        return cls(
+            sources=_split(args.get("source")),
+            date_from=_parse_date(args.get("date_from")),
+            date_to=_parse_date(args.get("date_to"), end=True),
+            countries=_split(args.get("country")),
+            commodities=_split(args.get("commodity")),
+            mode=mode or args.get("mode") or None,
+        )
+
+    def is_empty(self) -> bool:
+        return not (self.sources or self.date_from or self.date_to or self.countries or self.commodities or self.mode)
+
+    def to_sql(self, alias: str = "ae"):
+        """Returns (" AND ..." clause string, params dict) over article_embeddings."""
+        clauses, params = [], {}
+        if self.mode:
+            clauses.append(f"{alias}.mode = '{self.mode}'")
+        if self.sources:
+            clauses.append(f"{alias}.source = ANY(%(filter_sources)s::text[])")
+            params["filter_sources"] = self.sources
+        if self.date_from:
+            clauses.append(f"{alias}.publication_date >= %(filter_date_from)s")
+            params["filter_date_from"] = self.date_from
+        if self.date_to:
+            clauses.append(f"{alias}.publication_date < %(filter_date_to)s")
+            params["filter_date_to"] = self.date_to
+        if self.countries:
+            clauses.append(f"{alias}.countries && %(filter_countries)s::text[]")
+            params["filter_countries"] = self.countries
+        if self.commodities:
+            clauses.append(f"{alias}.commodities && %(filter_commodities)s::text[]")
+            params["filter_commodities"] = self.commodities
+        return "".join(f" AND {clause}" for clause in clauses), params
@@ -0,0 +1,144 @@
+import os
+from psycopg.rows import dict_row
+from database import get_db_connection, DB_STATEMENT_TIMEOUT_MS
+
+# =======================================================================
+# HNSW vector index management
+# =======================================================================
+# Every vector store orders by `<=>` (cosine distance). An index is only
+# usable when its operator class matches that operator, so article and
+# company embeddings get HNSW indexes built with vector_cosine_ops. The
+# original ivfflat index used vector_l2_ops and was never picked.
+#
+# hnsw.ef_search is the size of the candidate list walked per query:
+# higher means better recall and slower searches. It is set per
+# transaction so each caller can trade one for the other.
+
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# pgvector accepts 1..1000.
+MAX_EF_SEARCH = 1000
+
+# name -> (table, column, partial index predicate)
+VECTOR_INDEXES = {
+    "article_embeddings_embedding_hnsw_idx": ("article_embeddings", "embedding", None),
+    "companies_embedding_hnsw_idx": ("companies", "embedding", None),
+    # Mode-filtered searches (e.g. tenders only) walk a graph of just that mode.
+    "article_embeddings_tender_hnsw_idx": ("article_embeddings", "embedding", "mode = 'Tender'"),
+    "article_embeddings_sentiment_hnsw_idx": ("article_embeddings", "embedding", "mode = 'Sentiment'"),
+}
+# Indexes replaced by the ones above.
+LEGACY_VECTOR_INDEXES = ["article_embeddings_vector_idx"]
+# Upper bound on tuples a filtered (iterative) HNSW scan may visit.
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES", "20000"))
+
+_iterative_scan_supported = None
+
+
+def set_ef_search(cur, ef_search: int = None, k: int = 0):
+    """
+    Sets hnsw.ef_search (default HNSW_EF_SEARCH) for the cursor's current
+    transaction; call it inside the same `get_db_connection()` block as the
+    search. It is raised to `k`, since an HNSW scan returns at most
+    ef_search rows.
+    """
+    value = HNSW_EF_SEARCH if ef_search is None else int(ef_search)
+    value = min(max(1, int(k or 0), value), MAX_EF_SEARCH)
+    cur.execute("SELECT set_config('hnsw.ef_search', %s, true);", (str(value),))
+
+
+def _supports_iterative_scan(cur) -> bool:
+    """Iterative index scans need pgvector 0.8; the answer is cached per process."""
+    global _iterative_scan_supported
+    if _iterative_scan_supported is None:
+        row = cur.connection.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';").fetchone()
+        version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+        _iterative_scan_supported = version >= (0, 8)
+    return _iterative_scan_supported
+
+
+def set_filtered_scan(cur):
+    """
+    Lets a filtered HNSW scan keep walking the graph until enough rows pass
+    the WHERE clause (hnsw.iterative_scan), instead of filtering only the
+    first ef_search candidates and returning fewer than k rows. Results can
+    then come back slightly out of order, so callers re-sort by distance.
+    A no-op before pgvector 0.8.
+    """
+    if not _supports_iterative_scan(cur):
+        return
+    cur.execute("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true);")
+    cur.execute("SELECT set_config('hnsw.max_scan_tuples', %s, true);", (str(HNSW_MAX_SCAN_TUPLES),))
+
+
+def index_definition(name: str, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, concurrently: bool = True) -> str:
+    table, column, predicate = VECTOR_INDEXES[name]
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {table} USING hnsw ({column} vector_cosine_ops) "
+        f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+        f"{f' WHERE {predicate}' if predicate else ''};"
+    )
+
+
+def build_vector_indexes(m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, rebuild: bool = False, maintenance_work_mem: str = None):
+    """
+    Creates any missing HNSW index with CREATE INDEX CONCURRENTLY (writes keep
+    flowing during the build) and drops the legacy ivfflat index. An INVALID
+    index left behind by an interrupted concurrent build is dropped and built
+    again. With `rebuild`, existing indexes are dropped first so new m /
+    ef_construction values take effect. Returns the names of the indexes built.
+    """
+    built = []
+    with get_db_connection() as conn:
+        # CONCURRENTLY cannot run inside a transaction block.
+        conn.autocommit = True
+        try:
+            # A build can take far longer than the request timeout.
+            conn.execute("SET statement_timeout = 0")
+            if maintenance_work_mem:
+                conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+            for name in VECTOR_INDEXES:
+                if rebuild:
+                    conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+                existing = conn.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s);", (name,)).fetchone()
+                if existing and existing[0]:
+                    continue
+                if existing:
+                    print(f"Vector index {name} is INVALID (interrupted build), dropping it to rebuild...")
+                    conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+                print(f"Building vector index {name} (m={m}, ef_construction={ef_construction})...")
+                conn.execute(index_definition(name, m, ef_construction))
+                built.append(name)
+            for name in LEGACY_VECTOR_INDEXES:
+                conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        finally:
+            conn.execute("RESET maintenance_work_mem")
+            conn.execute(f"SET statement_timeout = {int(DB_STATEMENT_TIMEOUT_MS)}")
+            conn.autocommit = False
+    return built
+
+
+def vector_index_status() -> list:
+    """Lists the vector indexes with their method, size, validity and scan count."""
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            """
+            SELECT
+              i.indexrelname AS name,
+              i.relname AS table_name,
+              am.amname AS method,
+              pg_get_indexdef(i.indexrelid) AS definition,
+              pg_relation_size(i.indexrelid) AS size_bytes,
+              ix.indisvalid AS is_valid,
+              i.idx_scan AS scans
+            FROM pg_stat_user_indexes i
+            JOIN pg_index ix ON ix.indexrelid = i.indexrelid
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY i.relname, i.indexrelname;
+            """
+        )
+        return cur.fetchall()
@@ -10,6 +10,10 @@ from routes.embedding import analysis_bp
 from routes.agent_manager import agent_bp
 from routes.chat import chat_bp
 from routes.stats import stats_bp
+from routes.companies import companies_bp
+from routes.vector_indexes import vector_indexes_bp
+from routes.query_embeddings import start_query_cache_warmup
+from routes.response_cache import init_response_cache
 
 load_dotenv()
 
@@ -23,6 +27,16 @@ app.register_blueprint(analysis_bp)
 app.register_blueprint(agent_bp)
 app.register_blueprint(chat_bp)
 app.register_blueprint(stats_bp)
+app.register_blueprint(companies_bp)
+app.register_blueprint(vector_indexes_bp)
+
+start_query_cache_warmup()
+init_response_cache(app, warm_paths=[
+    '/api/stats/insights',
+    '/api/stats/company-sentiment-summary',
+    '/api/stats/tenders',
+    '/api/stats/risk-factors/counts',
+])
 
 @app.route('/')
 def index():
@@ -1,5 +1,9 @@
 from supabase import create_client, Client
+from contextlib import contextmanager
 import os
+import threading
+from psycopg_pool import ConnectionPool
+from pgvector.psycopg import register_vector
 
 # Initialize Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -12,3 +16,68 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Supabase credentials not found in .env file")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+# =======================================================================
+# Shared Postgres connection pool
+# =======================================================================
+# Every direct SQL read and write checks a connection out of this pool for
+# the duration of one `with get_db_connection() as conn:` block instead of
+# opening its own. Connections are health-checked on checkout, recycled
+# when idle too long, and every statement is bounded by statement_timeout.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+# Seconds a caller waits for a free connection before PoolTimeout is raised.
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Supabase's transaction pooler (port 6543) hands each transaction to any
+# backend, so a server-side prepared statement may not exist on the next
+# one ("prepared statement ... already exists / does not exist"). Prepared
+# statements are disabled there; the direct or session connection (port
+# 5432) keeps them. Set DB_TRANSACTION_POOLER to override the detection.
+DB_TRANSACTION_POOLER = os.getenv(
+    "DB_TRANSACTION_POOLER", str(os.getenv("SUPABASE_DB_PORT_CONN") == "6543")
+).strip().lower() in ("1", "true", "yes")
+
+
+def _configure_connection(conn):
+    register_vector(conn)
+    conn.execute(f"SET statement_timeout = {int(DB_STATEMENT_TIMEOUT_MS)}")
+    conn.commit()
+
+
+db_pool = ConnectionPool(
+    DB_CONNECTION_STRING,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT_SECONDS,
+    max_idle=300,
+    configure=_configure_connection,
+    check=ConnectionPool.check_connection,
+    name="procureintel",
+    open=False,
+    # prepare_threshold=None also turns `execute(..., prepare=True)` into a plain execute.
+    kwargs={"prepare_threshold": None} if DB_TRANSACTION_POOLER else {},
+)
+_pool_lock = threading.Lock()
+_pool_opened = False
+
+
+@contextmanager
+def get_db_connection(statement_timeout_ms: int = None):
+    """
+    Checks a connection out of the shared pool. The block's transaction is
+    committed when it exits normally and rolled back on an exception, then
+    the connection goes back to the pool. `statement_timeout_ms` overrides
+    the default timeout for the current transaction only (for batch jobs).
+    """
+    global _pool_opened
+    if not _pool_opened:
+        with _pool_lock:
+            if not _pool_opened:
+                db_pool.open()
+                _pool_opened = True
+    with db_pool.connection() as conn:
+        if statement_timeout_ms is not None:
+            conn.execute("SELECT set_config('statement_timeout', %s, true)", (str(int(statement_timeout_ms)),))
+        yield conn
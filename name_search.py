@@ -1,5 +1,3 @@
-import psycopg2
-from pgvector.psycopg2 import register_vector
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -9,7 +7,7 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import os
 import numpy as np
-from database import DB_CONNECTION_STRING
+from database import DB_CONNECTION_STRING, get_db_connection
 from CustomSupabaseVectorStore.CompanyNameVectorStore import CompanyNameVectorStore
 
 load_dotenv()
@@ -40,9 +38,7 @@ def check_entities_with_ai(user_question: str) -> int:
     return int(response.strip())
 
 def insert_company_data(company_name: str, embedding_vector: list):
-    conn = psycopg2.connect(DB_CONNECTION_STRING)
-    register_vector(conn)
-    with conn.cursor() as cur:
+    with get_db_connection() as conn, conn.cursor() as cur:
         # Try to insert, return id if inserted
         insert_sql = """
         INSERT INTO companies (real_name, embedding)
@@ -51,10 +47,8 @@ def insert_company_data(company_name: str, embedding_vector: list):
           SET embedding = EXCLUDED.embedding
         RETURNING id;
         """
-        cur.execute(insert_sql, (company_name, embedding_vector))
+        cur.execute(insert_sql, (company_name, np.asarray(embedding_vector, dtype=np.float32)))
         inserted_id = cur.fetchone()[0]  # Get the returned id
-        conn.commit()
-    conn.close()
     return inserted_id
         
 def check_name_exists(name: str) -> bool:
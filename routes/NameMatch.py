@@ -1,5 +1,4 @@
-import psycopg2
-from pgvector.psycopg2 import register_vector
+import re
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -9,15 +8,18 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import os
 import numpy as np
-from database import DB_CONNECTION_STRING
+from database import DB_CONNECTION_STRING, get_db_connection
 from CustomSupabaseVectorStore.CompanyNameVectorStore import CompanyNameVectorStore
+from .company_resolver import get_company_resolver, normalize_company_name
+from .match_verdicts import get_verdicts, store_verdicts
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 embedding_model = "text-embedding-3-small"
 embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
+VERIFY_MODEL = "gpt-4o-mini"
+llm = ChatOpenAI(temperature=0, model_name=VERIFY_MODEL)
 vector_store = CompanyNameVectorStore(db_connection_string=DB_CONNECTION_STRING, embedding_function=embeddings)
 
 prompt_template = """
@@ -34,54 +36,134 @@ prompt = ChatPromptTemplate.from_template(prompt_template)
 output_parser = StrOutputParser()
 chain = ({"question": RunnablePassthrough()} | prompt | llm | output_parser)
 
+batch_prompt_template = """
+You are an expert in entity recognition. For each numbered pair below, determine if the two company names refer to the same company.
+
+{pairs}
+
+Respond with exactly one line per pair, in order, formatted as "<number>: <answer>" where the answer is:
+- '1' if they are the same.
+- '0' if they are not the same or if you cannot determine it.
+"""
+batch_prompt = ChatPromptTemplate.from_template(batch_prompt_template)
+batch_chain = batch_prompt | llm | output_parser
+_BATCH_ANSWER_PATTERN = re.compile(r"^\s*(\d+)\s*[:.)-]\s*([01])\s*$", re.MULTILINE)
+
 def check_entities_with_ai(user_question: str) -> int:
     print(f"\n-> Analyzing question: \"{user_question}\"")
     response = chain.invoke(user_question)
     return int(response.strip())
 
-def insert_company_data(company_name: str, embedding_vector: list):
-    conn = psycopg2.connect(DB_CONNECTION_STRING)
-    register_vector(conn)
-    with conn.cursor() as cur:
-        # Try to insert, return id if inserted
-        insert_sql = """
-        INSERT INTO companies (real_name, embedding)
-        VALUES (%s, %s)
-        ON CONFLICT (real_name) DO UPDATE
-          SET embedding = EXCLUDED.embedding
-        RETURNING id;
-        """
-        cur.execute(insert_sql, (company_name, embedding_vector))
-        inserted_id = cur.fetchone()[0]  # Get the returned id
-        conn.commit()
-    conn.close()
-    return inserted_id
-        
-def check_name_exists(name: str) -> bool:
-    similar_companies = vector_store.similarity_search(query=name, k=1, score_threshold=0.35)
-    doc = similar_companies[0] if similar_companies else None
-    if doc:
-        company_name = doc.page_content
-        id_ = doc.metadata.get('id', 'N/A')
-        print(f"VectorFound Company Name: {company_name} | ID: {id_}")
-        return {"company_name": company_name, "id": id_, "status": True}
-    print(f"No similar company found for '{name}'.")
-    return {"status": False}
-
-def decide(company_name: str):
-    res = check_name_exists(company_name)
-    
-    if res['status']:
-        s_company_name = res['company_name']
-        id_ = res['id']
-        ai_res = check_entities_with_ai(f"is the company '{company_name}' the same as '{s_company_name}'?")
-        print(f"AI Response: {ai_res}")
-        if ai_res == 1:
-            return {"status": "exists", "id": id_}
-    embedding_response = client.embeddings.create(model=embedding_model, input=company_name)
-    embedding = embedding_response.data[0].embedding
-    print(f"Interting company '{company_name}'")
-    id_ = insert_company_data(company_name, embedding_vector=embedding)
-    print(f"Inserted company with ID: {id_}")
-    return {"status": "created", "id": id_}
+def check_entity_pairs_with_ai(pairs: list) -> list:
+    """
+    Verifies several (mention, candidate) name pairs in one LLM call and
+    returns a 0/1 verdict per pair. Falls back to one call per pair if the
+    answer does not cover every pair.
+    """
+    if not pairs:
+        return []
+    if len(pairs) == 1:
+        mention, candidate = pairs[0]
+        return [check_entities_with_ai(f"is the company '{mention}' the same as '{candidate}'?")]
+    listing = "\n".join(f"{i}. '{mention}' vs '{candidate}'" for i, (mention, candidate) in enumerate(pairs, start=1))
+    print(f"\n-> Verifying {len(pairs)} company pairs in one call")
+    response = batch_chain.invoke({"pairs": listing})
+    answers = {int(number): int(verdict) for number, verdict in _BATCH_ANSWER_PATTERN.findall(response)}
+    if set(answers) != set(range(1, len(pairs) + 1)):
+        print(f"Batch verification answered {sorted(answers)} for {len(pairs)} pairs, verifying one by one.")
+        return [check_entities_with_ai(f"is the company '{mention}' the same as '{candidate}'?") for mention, candidate in pairs]
+    return [answers[i] for i in range(1, len(pairs) + 1)]
+
+def insert_companies(companies: list) -> dict:
+    """
+    Upserts several (company_name, embedding_vector) pairs in one statement.
+    Returns {company_name: id}.
+    """
+    if not companies:
+        return {}
+    # Concurrent workers lock the rows in the same (name) order, so two
+    # batches sharing names cannot deadlock.
+    companies = sorted(dict(companies).items())
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO companies (real_name, embedding)
+            SELECT v.real_name, v.embedding
+            FROM unnest(%s::text[], %s::vector[]) AS v(real_name, embedding)
+            ORDER BY v.real_name
+            ON CONFLICT (real_name) DO UPDATE
+              SET embedding = EXCLUDED.embedding
+            RETURNING id, real_name;
+            """,
+            ([name for name, _ in companies], [np.asarray(embedding, dtype=np.float32) for _, embedding in companies]),
+        )
+        rows = cur.fetchall()
+    embeddings_by_name = dict(companies)
+    for id_, real_name in rows:
+        vector_store.add_to_index(id_, real_name, embeddings_by_name[real_name])
+    return {real_name: id_ for id_, real_name in rows}
+
+def decide_many(company_names: list) -> dict:
+    """
+    Resolves all company mentions of one article together: duplicates are
+    resolved once, unknown names are embedded in one request and matched in
+    one vector query, ambiguous matches are verified in one LLM call and new
+    companies are inserted in one statement.
+    Returns {company_name: {"status": "exists" | "created", "id": id}}.
+    """
+    resolver = get_company_resolver()
+    decisions = {}
+    # One representative spelling per normalised name.
+    groups = {}
+    for name in company_names:
+        if not name:
+            continue
+        groups.setdefault(normalize_company_name(name) or name, []).append(name)
+
+    unresolved = []
+    for names in groups.values():
+        local = resolver.resolve(names[0])
+        if local:
+            print(f"Resolved '{names[0]}' locally ({local['method']}) to '{local['company_name']}' | ID: {local['id']}")
+            for name in names:
+                decisions[name] = {"status": "exists", "id": local['id']}
+        else:
+            unresolved.append(names)
+    if not unresolved:
+        return decisions
+
+    mentions = [names[0] for names in unresolved]
+    embedding_response = client.embeddings.create(model=embedding_model, input=mentions)
+    vectors = [item.embedding for item in sorted(embedding_response.data, key=lambda item: item.index)]
+    matches = vector_store.similarity_search_by_vectors(vectors, k=1, score_threshold=0.35)
+
+    candidates = {i: matches[i][0] for i, docs in enumerate(matches) if docs}
+    # Pairs the LLM has judged before are answered from the verdict memo.
+    memo = get_verdicts([(mentions[i], doc.metadata['id']) for i, doc in candidates.items()])
+    verdicts = {i: int(memo[(mentions[i], doc.metadata['id'])]) for i, doc in candidates.items() if (mentions[i], doc.metadata['id']) in memo}
+    to_verify = [i for i in candidates if i not in verdicts]
+    answers = check_entity_pairs_with_ai([(mentions[i], candidates[i].page_content) for i in to_verify])
+    verdicts.update(zip(to_verify, answers))
+    store_verdicts([(mentions[i], candidates[i].metadata['id'], verdicts[i]) for i in to_verify], VERIFY_MODEL)
+
+    matched = {}
+    for i, verdict in verdicts.items():
+        source = "AI Response" if i in to_verify else "Stored verdict"
+        print(f"{source} for '{mentions[i]}' vs '{candidates[i].page_content}': {verdict}")
+        if verdict == 1:
+            matched[i] = candidates[i].metadata['id']
+
+    to_insert = [(mentions[i], vectors[i]) for i in range(len(mentions)) if i not in matched]
+    inserted = insert_companies(to_insert)
+    if to_insert:
+        print(f"Inserted {len(inserted)} companies: {inserted}")
 
+    for i, names in enumerate(unresolved):
+        if i in matched:
+            decision = {"status": "exists", "id": matched[i]}
+        else:
+            decision = {"status": "created", "id": inserted[mentions[i]]}
+        resolver.add(decision["id"], mentions[i])
+        for name in names:
+            decisions[name] = decision
+    return decisions
@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 from typing import List, Literal, Optional
 
 from langchain_openai import ChatOpenAI
@@ -6,6 +8,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from flask import Blueprint, jsonify
 from langchain_groq import ChatGroq
+from .cost_calculator import extract_usage
+from .llm_router import router_stats
 
 
 agent_bp = Blueprint('agent', __name__, url_prefix='/api')
@@ -122,11 +126,16 @@ class ArticleAnalysis(BaseModel):
         )
     )
 
+    confidence: Optional[float] = Field(
+        None,
+        description=(
+            "Your confidence, between 0 and 1, that the mode and the extracted fields above are correct and complete. "
+            "Use a low value when the article is ambiguous, truncated, or you had to guess."
+        )
+    )
+
     
-prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        """You are an expert AI analyst for a global supply chain team. Your task is to meticulously analyze a news article and extract structured data.
+EXTRACTION_SYSTEM_PROMPT = """You are an expert AI analyst for a global supply chain team. Your task is to meticulously analyze a news article and extract structured data.
 
         **Your process must be:**
         1.  **Classify the `mode`**: First, determine if the article is about a 'Tender' (contracts, bids, deals), general business 'Sentiment' (earnings, disruptions, partnerships, competition), or 'Ignore' (irrelevant).
@@ -137,14 +146,69 @@ prompt = ChatPromptTemplate.from_messages([
         
         3.  **Always Extract General Info**: Regardless of the mode, always try to extract the `countries` and `commodities` involved.
         """
-    ),
+
+prompt = ChatPromptTemplate.from_messages([
+    ("system", EXTRACTION_SYSTEM_PROMPT),
     ("human", "{article_text}")
 ])
 
 
-def get_extraction_chain(model_type: str, model_name: str):
+class BatchedArticleAnalysis(ArticleAnalysis):
     """
-    Creates and returns a LangChain extraction chain with a dynamically specified provider and model.
+    The analysis of one article inside a multi-article request, tagged with the id of the article it belongs to.
+    """
+    article_id: int = Field(
+        ...,
+        description="The id of the article this analysis belongs to, copied exactly from the article's header."
+    )
+
+
+class ArticleBatchAnalysis(BaseModel):
+    """
+    The structured analyses of several news articles submitted together in one request.
+    """
+    analyses: List[BatchedArticleAnalysis] = Field(
+        ...,
+        description="Exactly one analysis per input article, each tagged with that article's id."
+    )
+
+
+batch_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        EXTRACTION_SYSTEM_PROMPT + """
+        **Multiple articles:** The input contains several independent articles, each starting with a header line
+        `### ARTICLE <id>`. Analyze every article on its own, following the process above, and return exactly one
+        analysis per article with `article_id` set to the id from its header. Never merge or skip articles.
+        """
+    ),
+    ("human", "{articles}")
+])
+
+
+def format_article_batch(articles) -> str:
+    """Renders (article_id, text) pairs into the input expected by `batch_prompt`."""
+    return "\n\n".join(f"### ARTICLE {article_id}\n{text}" for article_id, text in articles)
+
+
+def _compute_prompt_version() -> str:
+    """
+    Fingerprints the extraction prompt and output schema so cached results are
+    invalidated automatically whenever either of them is edited.
+    """
+    payload = json.dumps({
+        "messages": [[type(message).__name__, message.prompt.template] for message in prompt.messages + batch_prompt.messages],
+        "schema": ArticleAnalysis.schema(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+PROMPT_VERSION = _compute_prompt_version()
+
+
+def _get_llm(model_type: str, model_name: str):
+    """
+    Creates a chat model for the given provider and model name.
     """
     model_type = model_type.lower()
     llm = None
@@ -155,10 +219,39 @@ def get_extraction_chain(model_type: str, model_name: str):
         llm = ChatGroq(model_name=model_name, temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"))
     else:
         raise ValueError(f"Unsupported model type: '{model_type}'. Supported types are 'openai', 'groq'.")
-    
-    structured_llm = llm.with_structured_output(ArticleAnalysis)
+    return llm
+
+
+def get_extraction_chain(model_type: str, model_name: str):
+    """
+    Creates and returns a LangChain extraction chain with a dynamically specified provider and model.
+    The chain keeps the raw model message so token usage can be read from it;
+    use `unpack_extraction_output` on its result.
+    """
+    structured_llm = _get_llm(model_type, model_name).with_structured_output(ArticleAnalysis, include_raw=True)
     return prompt | structured_llm
 
+
+def get_batch_extraction_chain(model_type: str, model_name: str):
+    """
+    Creates a chain that analyzes several articles in one structured-output call.
+    Its input is {"articles": format_article_batch(...)}; `unpack_extraction_output`
+    turns its result into an ArticleBatchAnalysis and the usage.
+    """
+    structured_llm = _get_llm(model_type, model_name).with_structured_output(ArticleBatchAnalysis, include_raw=True)
+    return batch_prompt | structured_llm
+
+
+def unpack_extraction_output(output):
+    """
+    Splits the output of an extraction chain into (parsed_result, usage), where
+    usage is the provider-reported token count or None. Raises ValueError when
+    the model response could not be parsed into the schema.
+    """
+    if output.get("parsing_error") is not None or output.get("parsed") is None:
+        raise ValueError(f"Model output did not match the extraction schema: {output.get('parsing_error')}")
+    return output["parsed"], extract_usage(output.get("raw"))
+
 @agent_bp.route('/models', methods=['GET'])
 def get_available_models():
     """
@@ -179,3 +272,10 @@ def get_available_models():
     }
     return jsonify(available_models)
 
+
+@agent_bp.route('/models/routing-stats', methods=['GET'])
+def get_routing_stats():
+    """
+    Hedging and failover counters per routed model pair since the server started.
+    """
+    return jsonify(router_stats())
@@ -0,0 +1,66 @@
+import hashlib
+
+from psycopg.types.json import Jsonb
+
+from database import get_db_connection
+from .agent_manager import ArticleAnalysis, PROMPT_VERSION
+
+# =======================================================================
+# PERSISTENT EXTRACTION RESULT CACHE
+# =======================================================================
+# Structured ArticleAnalysis results are stored in the `analysis_cache` table,
+# keyed by (hash of the article text, model type, model name, prompt version).
+# Re-analysing text that has already been seen with the same model and prompt
+# is then served from the database instead of paying for another model call.
+# Both lookups run on every extraction, so they use the pooled connections
+# (prepared once per connection) rather than a REST round trip.
+
+def hash_text(text: str) -> str:
+    """Creates a SHA256 hash of the article text used as the cache key."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_cached_analysis(text: str, model_type: str, model_name: str):
+    """
+    Returns the cached ArticleAnalysis for this text/model/prompt combination,
+    or None on a miss. Cache errors are treated as misses.
+    """
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT result FROM analysis_cache "
+                "WHERE text_hash = %s AND model_type = %s AND model_name = %s AND prompt_version = %s;",
+                (hash_text(text), model_type.lower(), model_name, PROMPT_VERSION),
+                prepare=True,
+            )
+            row = cur.fetchone()
+    except Exception as e:
+        print(f"Warning: analysis cache lookup failed: {e}")
+        return None
+
+    if not row:
+        return None
+    try:
+        return ArticleAnalysis.parse_obj(row[0])
+    except Exception as e:
+        # The stored payload no longer fits the schema; treat it as a miss.
+        print(f"Warning: discarding unreadable cached analysis: {e}")
+        return None
+
+
+def store_cached_analysis(text: str, model_type: str, model_name: str, analysis_result):
+    """Saves an extraction result so identical future requests skip the model call."""
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO analysis_cache (text_hash, model_type, model_name, prompt_version, result)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (text_hash, model_type, model_name, prompt_version)
+                DO UPDATE SET result = EXCLUDED.result;
+                """,
+                (hash_text(text), model_type.lower(), model_name, PROMPT_VERSION, Jsonb(analysis_result.dict())),
+                prepare=True,
+            )
+    except Exception as e:
+        print(f"Warning: failed to store analysis in cache: {e}")
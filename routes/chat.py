@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify
-from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.chat_models import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain_groq import ChatGroq  # Optional: if using Groq
 from CustomSupabaseVectorStore.ArticleVectorStore import ArticleVectorStore
 from database import DB_CONNECTION_STRING
+from .llm_router import get_router, default_fallback
+from .query_embeddings import query_embeddings
 import os
 
 chat_bp = Blueprint('chat',__name__, url_prefix='/api/chat')
@@ -15,9 +16,29 @@ STATE = {
     "embeddings": None,
     "vector_store": None,
     "llm": None,
-    "qa_chain": None
+    "qa_chain": None,
+    "fallback_qa_chain": None,
+    "router": None
 }
 
+# Chat answers are interactive, so give up much sooner than pipeline calls.
+CHAT_CALL_DEADLINE_SECONDS = float(os.getenv("CHAT_CALL_DEADLINE_SECONDS", "30"))
+
+
+def _build_llm(provider, model_name, temperature):
+    if provider.lower() == "openai":
+        return ChatOpenAI(
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=model_name,
+            temperature=temperature
+        )
+    elif provider.lower() == "groq":
+        return ChatGroq(
+            api_key=os.getenv("GROQ_API_KEY"),
+            model_name=model_name,
+            temperature=temperature
+        )
+    raise ValueError(f"Unknown provider: {provider}")
 
 
 @chat_bp.route('/initialize', methods=['POST'])
@@ -27,8 +48,13 @@ def initialize():
     {
         "provider": "openai" | "groq",
         "model_name": "...",
-        "temperature": 0.0
+        "temperature": 0.0,
+        "fallback_provider": "openai" | "groq",   (optional)
+        "fallback_model_name": "...",             (optional)
+        "failover": true                          (optional)
     }
+    Queries are hedged to the fallback model when the primary is slow and
+    fail over to it on errors or rate limits.
     """
     data = request.json
     if not data:
@@ -40,27 +66,17 @@ def initialize():
 
     try:
         # (Re)build components
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        embeddings = query_embeddings
 
         vector_store = ArticleVectorStore(
             db_connection_string=DB_CONNECTION_STRING,
             embedding_function=embeddings
         )
 
-        if provider.lower() == "openai":
-            llm = ChatOpenAI(
-                openai_api_key=os.getenv("OPENAI_API_KEY"),
-                model_name=model_name,
-                temperature=temperature
-            )
-        elif provider.lower() == "groq":
-            llm = ChatGroq(
-                api_key=os.getenv("GROQ_API_KEY"),
-                model_name=model_name,
-                temperature=temperature
-            )
-        else:
-            return jsonify({"error": f"Unknown provider: {provider}"}), 400
+        try:
+            llm = _build_llm(provider, model_name, temperature)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
@@ -68,12 +84,30 @@ def initialize():
             retriever=vector_store.as_retriever()
         )
 
+        fallback = None
+        if data.get("failover", True):
+            if data.get("fallback_provider") and data.get("fallback_model_name"):
+                fallback = (data["fallback_provider"], data["fallback_model_name"])
+            else:
+                fallback = default_fallback(provider)
+        if fallback and fallback[0].lower() == provider.lower() and fallback[1] == model_name:
+            fallback = None
+        fallback_qa_chain = None
+        if fallback:
+            fallback_qa_chain = RetrievalQA.from_chain_type(
+                llm=_build_llm(fallback[0], fallback[1], temperature),
+                chain_type="stuff",
+                retriever=vector_store.as_retriever()
+            )
+
         # Save to global state
         STATE["initialized"] = True
         STATE["embeddings"] = embeddings
         STATE["vector_store"] = vector_store
         STATE["llm"] = llm
         STATE["qa_chain"] = qa_chain
+        STATE["fallback_qa_chain"] = fallback_qa_chain
+        STATE["router"] = get_router("chat", (provider, model_name), fallback, deadline=CHAT_CALL_DEADLINE_SECONDS)
 
         return jsonify({"message": f"Initialized with {provider} model {model_name}."}), 200
 
@@ -94,11 +128,18 @@ def query_chat():
     query = data['query']
 
     try:
-        answer = STATE["qa_chain"].run(query)
+        fallback_qa_chain = STATE["fallback_qa_chain"]
+        answer, (provider, model_name) = STATE["router"].call(
+            lambda: STATE["qa_chain"].run(query),
+            (lambda: fallback_qa_chain.run(query)) if fallback_qa_chain else None
+        )
         response = {
             "query": query,
-            "response": answer
+            "response": answer,
+            "model": f"{provider}:{model_name}"
         }
         return jsonify(response), 200
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,79 @@
+from flask import Blueprint, jsonify, request
+from .match_verdicts import list_verdicts, invalidate_verdicts
+from .company_resolver import get_company_resolver
+from .company_dedup import _do_company_dedup
+from .embedding import _run_single_stage
+
+companies_bp = Blueprint('companies', __name__, url_prefix='/api/companies')
+
+
+def _verdict_filters(source):
+    company_id = source.get("company_id")
+    return {
+        "company_name": source.get("company_name") or None,
+        "company_id": int(company_id) if company_id not in (None, "") else None,
+        "model": source.get("model") or None,
+    }
+
+
+@companies_bp.route('/match-verdicts', methods=['GET'])
+def get_match_verdicts():
+    """
+    GET /api/companies/match-verdicts?company_name=...&company_id=...&model=...&limit=100
+    Lists stored LLM same-company verdicts, newest first.
+    """
+    try:
+        filters = _verdict_filters(request.args)
+        limit = max(1, min(int(request.args.get("limit", 100)), 1000))
+    except ValueError:
+        return jsonify({"error": "company_id and limit must be integers"}), 400
+    try:
+        return jsonify(list_verdicts(limit=limit, **filters)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@companies_bp.route('/match-verdicts', methods=['DELETE'])
+def delete_match_verdicts():
+    """
+    DELETE /api/companies/match-verdicts
+    {
+        "company_name": "...",   (optional, matched after normalisation)
+        "company_id": 123,       (optional)
+        "model": "gpt-4o-mini",  (optional)
+        "all": true              (required when no filter is given)
+    }
+    Invalidated pairs are re-verified by the LLM the next time they appear.
+    """
+    data = request.json or {}
+    try:
+        filters = _verdict_filters(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "company_id must be an integer"}), 400
+    if not any(value is not None for value in filters.values()) and not data.get("all"):
+        return jsonify({"error": "Give company_name, company_id or model, or set 'all' to true"}), 400
+    try:
+        deleted = invalidate_verdicts(**filters)
+        # Drop spellings the in-memory resolver learned from earlier verdicts.
+        get_company_resolver(refresh=True)
+        return jsonify({"deleted": deleted}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@companies_bp.route('/dedup', methods=['POST'])
+def run_company_dedup():
+    """
+    POST /api/companies/dedup
+    { "dry_run": true }
+    Embeds company names that have no embedding, clusters duplicate companies
+    and merges each cluster into one canonical company. Merges delete company
+    rows and cannot be undone, so by default (dry_run) the planned merges are
+    only logged; send "dry_run": false to apply them.
+    """
+    data = request.json or {}
+    return _run_single_stage(
+        task_function=_do_company_dedup,
+        stage_name="Deduplicating Companies",
+        task_args={"dry_run": bool(data.get("dry_run", True))},
+    )
@@ -0,0 +1,318 @@
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+from openai import OpenAI
+
+from database import get_db_connection
+from .status import pipeline_status_tracker, status_lock
+from .cost_calculator import calculate_embedding_cost
+from .company_resolver import normalize_company_name, name_trigrams, get_company_resolver
+from .NameMatch import vector_store
+from .pipeline_repository import increment_run_counters
+
+# =======================================================================
+# OFFLINE COMPANY DEDUPLICATION
+# =======================================================================
+# decide_many() creates a new company whenever the nearest stored name is
+# rejected, and the tables.sql backfill inserted names without embeddings,
+# so the companies table collects near-duplicates ("Emirates NBD",
+# "Emirates NBD PJSC", "ENBD"). This job embeds the missing names, links
+# candidate pairs found by cheap blocking (same normalised name, acronym,
+# close embedding plus similar spelling), clusters them with union-find and
+# folds every cluster into one canonical company. The other spellings are
+# kept in company_aliases and company_analysis rows are repointed.
+
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 500
+
+# Embeddings this close are merged on their own.
+DEDUP_VECTOR_DISTANCE = float(os.getenv("DEDUP_VECTOR_DISTANCE", "0.1"))
+# Embeddings this close are merged when the spellings also agree.
+DEDUP_CANDIDATE_DISTANCE = float(os.getenv("DEDUP_CANDIDATE_DISTANCE", "0.25"))
+DEDUP_MIN_NAME_SIMILARITY = 0.5
+# An acronym only merges with a name whose embedding is at least this close.
+DEDUP_ACRONYM_DISTANCE = 0.5
+SIMILARITY_CHUNK_ROWS = 1024
+# The full-table scan and the merge run longer than a request may.
+DEDUP_STATEMENT_TIMEOUT_MS = 600000
+
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+            return True
+        return False
+
+    def groups(self):
+        clusters = defaultdict(list)
+        for item in self.parent:
+            clusters[self.find(item)].append(item)
+        return list(clusters.values())
+
+
+def acronym(name: str) -> str:
+    """
+    "Emirates NBD PJSC" -> "ENBD": initials of the normalised words, keeping
+    short all-caps words (already acronyms) whole. Empty for one-word names.
+    """
+    normalized_words = normalize_company_name(name).split()
+    if len(normalized_words) < 2:
+        return ""
+    original = {word.lower(): word for word in _WORD_PATTERN.findall(name)}
+    parts = []
+    for word in normalized_words:
+        if word == "and":
+            continue
+        source = original.get(word, word)
+        parts.append(word if source.isupper() and len(source) <= 4 else word[0])
+    return "".join(parts)
+
+
+def _name_similarity(key_a: str, key_b: str) -> float:
+    # Plain trigram Jaccard: a shared word ("Dubai" / "Dubai Islamic Bank")
+    # is not evidence of the same company.
+    grams_a, grams_b = name_trigrams(key_a), name_trigrams(key_b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def embed_missing_companies(stop_event=None):
+    """Embeds every company without an embedding in batched requests. Returns (count, cost)."""
+    embedded, total_cost = 0, 0.0
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, real_name FROM companies WHERE embedding IS NULL ORDER BY id;")
+        missing = cur.fetchall()
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        if stop_event is not None and stop_event.is_set():
+            raise InterruptedError("Stop requested")
+        batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+        with status_lock:
+            pipeline_status_tracker["details"]["message"] = f"Embedding company names {start + len(batch)}/{len(missing)}"
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=[name for _, name in batch])
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        usage_tokens = response.usage.prompt_tokens if response.usage else None
+        total_cost += calculate_embedding_cost(" ".join(name for _, name in batch), EMBEDDING_MODEL, usage_tokens)
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE companies c SET embedding = v.embedding::vector
+                FROM unnest(%s::int[], %s::text[]) AS v(id, embedding)
+                WHERE c.id = v.id;
+                """,
+                ([company_id for company_id, _ in batch], [str(vector) for vector in vectors]),
+            )
+        embedded += len(batch)
+    return embedded, total_cost
+
+
+def _load_companies():
+    with get_db_connection(statement_timeout_ms=DEDUP_STATEMENT_TIMEOUT_MS) as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.id, c.real_name, c.embedding, COUNT(ca.id) AS mentions
+            FROM companies c
+            LEFT JOIN company_analysis ca ON ca.company_id = c.id
+            GROUP BY c.id
+            ORDER BY c.id;
+            """
+        )
+        return cur.fetchall()
+
+
+def find_duplicate_clusters(companies):
+    """
+    Links candidate duplicates among (id, real_name, embedding, mentions) rows
+    and returns the clusters of more than one company as lists of ids.
+    """
+    union_find = UnionFind()
+    keys = {company_id: normalize_company_name(name) for company_id, name, _, _ in companies}
+    for company_id in keys:
+        union_find.find(company_id)
+
+    # Block 1: identical normalised names.
+    by_key = defaultdict(list)
+    for company_id, key in keys.items():
+        if key:
+            by_key[key].append(company_id)
+    for ids in by_key.values():
+        for other in ids[1:]:
+            union_find.union(ids[0], other)
+
+    with_embedding = [(company_id, embedding) for company_id, _, embedding, _ in companies if embedding is not None]
+    ids = np.array([company_id for company_id, _ in with_embedding], dtype=np.int64)
+    row_of = {company_id: i for i, company_id in enumerate(ids)}
+    matrix = np.array([embedding for _, embedding in with_embedding], dtype=np.float32).reshape(len(ids), -1)
+    if len(ids):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+    def distance(a, b):
+        if a not in row_of or b not in row_of:
+            return None
+        return float(1.0 - matrix[row_of[a]] @ matrix[row_of[b]])
+
+    # Block 2: one-word names that are the acronym of exactly one longer name.
+    by_acronym = defaultdict(list)
+    for company_id, name, _, _ in companies:
+        code = acronym(name)
+        if len(code) >= 2:
+            by_acronym[code].append(company_id)
+    for company_id, key in keys.items():
+        expansions = by_acronym.get(key, []) if key and " " not in key else []
+        # Spellings already linked by block 1 count as one expansion.
+        if len({union_find.find(expansion) for expansion in expansions}) == 1:
+            close = [d for d in (distance(company_id, expansion) for expansion in expansions) if d is not None]
+            if close and min(close) < DEDUP_ACRONYM_DISTANCE:
+                union_find.union(company_id, expansions[0])
+
+    # Block 3: embedding neighbourhood, scanned in chunks of rows.
+    for start in range(0, len(ids), SIMILARITY_CHUNK_ROWS):
+        distances = 1.0 - matrix[start:start + SIMILARITY_CHUNK_ROWS] @ matrix.T
+        rows, cols = np.nonzero(distances < DEDUP_CANDIDATE_DISTANCE)
+        for row, col in zip(rows + start, cols):
+            if col <= row:
+                continue
+            a, b = int(ids[row]), int(ids[col])
+            if distances[row - start, col] < DEDUP_VECTOR_DISTANCE or _name_similarity(keys[a], keys[b]) >= DEDUP_MIN_NAME_SIMILARITY:
+                union_find.union(a, b)
+
+    return [cluster for cluster in union_find.groups() if len(cluster) > 1]
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def plan_merges(clusters, companies):
+    """
+    Picks each cluster's canonical company (most mentions, lowest id on ties)
+    and keeps only the members directly close to it: the same normalised
+    name, an embedding within DEDUP_CANDIDATE_DISTANCE, or its acronym within
+    DEDUP_ACRONYM_DISTANCE. Members joined only through a chain of links are
+    left alone. Returns [(canonical_id, [duplicate_ids])].
+    """
+    info = {company_id: (name, embedding, mentions) for company_id, name, embedding, mentions in companies}
+    merges = []
+    for cluster in clusters:
+        canonical = max(cluster, key=lambda company_id: (info[company_id][2], -company_id))
+        canonical_name, canonical_embedding, _ = info[canonical]
+        canonical_key = normalize_company_name(canonical_name)
+        canonical_vector = _unit(canonical_embedding) if canonical_embedding is not None else None
+        duplicates = []
+        for company_id in sorted(cluster):
+            if company_id == canonical:
+                continue
+            name, embedding, _ = info[company_id]
+            key = normalize_company_name(name)
+            distance = None
+            if canonical_vector is not None and embedding is not None:
+                distance = float(1.0 - canonical_vector @ _unit(embedding))
+            if key == canonical_key or (distance is not None and (
+                distance < DEDUP_CANDIDATE_DISTANCE
+                or (distance < DEDUP_ACRONYM_DISTANCE and acronym(canonical_name) == key)
+            )):
+                duplicates.append(company_id)
+            else:
+                print(f"Not merging '{name}' into '{canonical_name}': not close enough to the canonical name.")
+        if duplicates:
+            merges.append((canonical, duplicates))
+    return merges
+
+
+def merge_clusters(merges, companies):
+    """
+    Applies [(canonical_id, [duplicate_ids])] from plan_merges in one
+    transaction. Returns the merges.
+    """
+    info = {company_id: (name, mentions) for company_id, name, _, mentions in companies}
+    mapping = [(duplicate, canonical) for canonical, duplicates in merges for duplicate in duplicates]
+    if not mapping:
+        return merges
+
+    duplicates = [duplicate for duplicate, _ in mapping]
+    canonicals = [canonical for _, canonical in mapping]
+    # One transaction: the whole merge is applied or nothing is.
+    with get_db_connection(statement_timeout_ms=DEDUP_STATEMENT_TIMEOUT_MS) as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO company_aliases (alias_name, company_id, merged_from_id)
+            SELECT * FROM unnest(%s::text[], %s::int[], %s::int[])
+            ON CONFLICT (alias_name) DO UPDATE
+              SET company_id = EXCLUDED.company_id, merged_from_id = EXCLUDED.merged_from_id;
+            """,
+            ([info[duplicate][0] for duplicate in duplicates], canonicals, duplicates),
+        )
+        cur.execute(
+            "UPDATE company_aliases a SET company_id = m.canonical FROM unnest(%s::int[], %s::int[]) AS m(duplicate, canonical) WHERE a.company_id = m.duplicate;",
+            (duplicates, canonicals),
+        )
+        cur.execute(
+            "UPDATE company_analysis ca SET company_id = m.canonical FROM unnest(%s::int[], %s::int[]) AS m(duplicate, canonical) WHERE ca.company_id = m.duplicate;",
+            (duplicates, canonicals),
+        )
+        cur.execute("DELETE FROM companies WHERE id = ANY(%s::int[]);", (duplicates,))
+    return merges
+
+
+def _do_company_dedup(pipeline_id, stop_event, dry_run=False):
+    """Pipeline stage: embed missing names, cluster duplicates and merge them."""
+    with status_lock:
+        pipeline_status_tracker["details"]["message"] = "Embedding company names without embeddings..."
+    embedded, embedding_cost = embed_missing_companies(stop_event)
+    if embedded:
+        print(f"Embedded {embedded} company names (${embedding_cost:.6f}).")
+        increment_run_counters(pipeline_id, embedding_cost=embedding_cost, total_cost=embedding_cost)
+
+    if stop_event.is_set():
+        raise InterruptedError("Stop requested")
+    with status_lock:
+        pipeline_status_tracker["details"]["message"] = "Finding duplicate companies..."
+    companies = _load_companies()
+    clusters = find_duplicate_clusters(companies)
+    with status_lock:
+        pipeline_status_tracker["total"] = len(clusters)
+        pipeline_status_tracker["progress"] = 0
+
+    names = {company_id: name for company_id, name, _, _ in companies}
+    merges = plan_merges(clusters, companies)
+    for canonical, duplicates in merges:
+        print(f"Duplicate cluster: '{names[canonical]}' <- {[names[company_id] for company_id in duplicates]}")
+    if dry_run or stop_event.is_set():
+        return 0, 0
+
+    with status_lock:
+        pipeline_status_tracker["details"]["message"] = f"Merging {len(merges)} duplicate clusters..."
+    merges = merge_clusters(merges, companies)
+    merged = sum(len(duplicates) for _, duplicates in merges)
+    with status_lock:
+        pipeline_status_tracker["progress"] = len(clusters)
+    print(f"Merged {merged} duplicate companies into {len(merges)} canonical companies.")
+
+    # The resolver and the shared nearest-neighbour index (used by NameMatch
+    # and the search endpoints alike) must stop returning merged ids.
+    get_company_resolver(refresh=True)
+    vector_store.reload_index()
+    return merged, 0
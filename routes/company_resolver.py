@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Optional
+
+from database import get_db_connection
+
+# =======================================================================
+# IN-PROCESS COMPANY NAME RESOLVER
+# =======================================================================
+# Most company mentions are names we have already stored, often differing
+# only in case, punctuation or a legal suffix ("Aramco" / "Saudi Aramco" is
+# still ambiguous, "ADNOC" / "ADNOC PJSC" is not). Those are resolved here
+# from an in-memory index over companies.real_name: first by exact match on
+# the normalised name, then by trigram similarity. Only names that match
+# nothing confidently go on to the vector search and the LLM check.
+
+# Minimum trigram Jaccard similarity for a local match.
+TRIGRAM_MATCH_THRESHOLD = float(os.getenv("TRIGRAM_MATCH_THRESHOLD", "0.8"))
+# The best trigram candidate must beat the runner-up (a different company) by this much.
+TRIGRAM_MIN_MARGIN = 0.1
+# Normalised names shorter than this only ever match exactly.
+MIN_TRIGRAM_NAME_LENGTH = 5
+
+# Legal-form suffixes only. Words such as "group", "holding" or "company",
+# and short tokens that also occur as name words ("sa", "as", "ab", "co"),
+# are kept: "Dubai Holding" and "Dubai Group" are different companies, so
+# such variants go through the trigram and LLM checks instead.
+LEGAL_SUFFIXES = {
+    "llc", "ltd", "limited", "plc", "pjsc", "psc", "qpsc", "qsc", "saog", "saoc", "bsc", "kscp", "ksc",
+    "sae", "sas", "ag", "gmbh", "nv", "bv", "spa", "srl", "oy", "kk",
+    "inc", "incorporated", "corp", "corporation", "fze", "fzco", "fzc", "fzllc", "wll",
+    "jsc", "ojsc", "pvt", "pty",
+}
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_company_name(name: str) -> str:
+    """
+    Lowercases, strips accents and punctuation, drops a leading "the" and any
+    trailing legal-form suffixes, e.g. "The Abu Dhabi National Oil Company P.J.S.C."
+    becomes "abu dhabi national oil company".
+    """
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower().replace("&", " and ")
+    # "P.J.S.C." and "L.L.C." collapse to "pjsc"/"llc" rather than single letters.
+    text = re.sub(r"\b(?:[a-z]\.){2,}", lambda m: m.group(0).replace(".", ""), text)
+    text = _WHITESPACE_PATTERN.sub(" ", _PUNCTUATION_PATTERN.sub(" ", text)).strip()
+    words = text.split()
+    if words and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def name_trigrams(normalized: str) -> frozenset:
+    """Word-padded trigrams, the same shape pg_trgm uses."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class CompanyResolver:
+    """Exact and trigram lookups over known company names."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exact = {}
+        self._names = {}
+        self._trigrams = {}
+        self._index = defaultdict(set)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, company_id, name: str):
+        """Registers a company name (or a confirmed alias) for `company_id`."""
+        key = normalize_company_name(name)
+        if not key:
+            return
+        with self._lock:
+            # Keep the oldest id when two stored names normalise to the same key.
+            existing = self._exact.get(key)
+            if existing is None or company_id < existing:
+                self._exact[key] = company_id
+            self._names.setdefault(company_id, name)
+            if len(key) >= MIN_TRIGRAM_NAME_LENGTH and (company_id, key) not in self._trigrams:
+                grams = name_trigrams(key)
+                self._trigrams[(company_id, key)] = grams
+                for gram in grams:
+                    self._index[gram].add((company_id, key))
+
+    def load(self):
+        """(Re)loads every company name and merged alias from the database."""
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, real_name FROM companies WHERE real_name IS NOT NULL;")
+            rows = cur.fetchall()
+            # Spellings folded into a canonical company by the dedup job.
+            cur.execute("SELECT company_id, alias_name FROM company_aliases;")
+            rows += cur.fetchall()
+        with self._lock:
+            self._exact, self._names, self._trigrams = {}, {}, {}
+            self._index = defaultdict(set)
+        for company_id, real_name in rows:
+            self.add(company_id, real_name)
+        print(f"Company resolver loaded {len(self._names)} companies.")
+        return self
+
+    def resolve(self, name: str) -> Optional[dict]:
+        """
+        Returns {"id", "company_name", "method", "score"} for an unambiguous
+        local match, or None when the name needs the vector + LLM path.
+        """
+        key = normalize_company_name(name)
+        if not key:
+            return None
+        with self._lock:
+            company_id = self._exact.get(key)
+            if company_id is not None:
+                return {"id": company_id, "company_name": self._names[company_id], "method": "exact", "score": 1.0}
+            if len(key) < MIN_TRIGRAM_NAME_LENGTH:
+                return None
+            grams = name_trigrams(key)
+            candidates = set()
+            for gram in grams:
+                candidates.update(self._index.get(gram, ()))
+            best_per_company = {}
+            for candidate in candidates:
+                other = self._trigrams[candidate]
+                score = len(grams & other) / len(grams | other)
+                if score > best_per_company.get(candidate[0], 0.0):
+                    best_per_company[candidate[0]] = score
+            names = self._names
+
+        ranked = sorted(best_per_company.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < TRIGRAM_MATCH_THRESHOLD:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < TRIGRAM_MIN_MARGIN:
+            return None
+        company_id, score = ranked[0]
+        return {"id": company_id, "company_name": names[company_id], "method": "trigram", "score": round(score, 4)}
+
+
+_resolver: Optional[CompanyResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_company_resolver(refresh: bool = False) -> CompanyResolver:
+    """Returns the shared resolver, loading it from the database on first use."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None or refresh:
+            _resolver = CompanyResolver().load()
+        return _resolver
@@ -1,4 +1,6 @@
 import json
+from functools import lru_cache
+
 import tiktoken
 
 # =======================================================================
@@ -30,52 +32,75 @@ PRICING_CONFIG = {
 # TOKEN COUNTING UTILITIES
 # =======================================================================
 
-def num_tokens_from_string(string: str, model_name: str) -> int:
-    """Returns the number of tokens in a text string for a given OpenAI model."""
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    """Looks up (and caches) the tiktoken encoding for a model."""
     try:
-        encoding = tiktoken.encoding_for_model(model_name)
+        return tiktoken.encoding_for_model(model_name)
     except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
+        return tiktoken.get_encoding("cl100k_base")
+
+def num_tokens_from_string(string: str, model_name: str) -> int:
+    """Returns the number of tokens in a text string for a given OpenAI model."""
+    return len(_get_encoding(model_name).encode(string))
 
 def approximate_groq_tokens(string: str) -> int:
     """Approximates token count for Groq models (1 token ~= 4 chars)."""
     return len(string) // 4
 
+def _count_tokens(string: str, model_type: str, model_name: str) -> int:
+    if model_type.lower() == 'openai':
+        return num_tokens_from_string(string, model_name)
+    return approximate_groq_tokens(string)
+
+def extract_usage(message):
+    """
+    Reads provider-reported token usage from a chat model response.
+    Returns {"input_tokens": int, "output_tokens": int}, or None when the
+    provider did not report usage.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage and usage.get("input_tokens") is not None:
+        return {"input_tokens": usage["input_tokens"], "output_tokens": usage.get("output_tokens", 0)}
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage.get("prompt_tokens") is not None:
+        return {"input_tokens": token_usage["prompt_tokens"], "output_tokens": token_usage.get("completion_tokens", 0)}
+    return None
+
 # =======================================================================
 # PUBLIC COST CALCULATION FUNCTIONS
 # =======================================================================
 
-def calculate_analysis_cost(analysis_result, input_text, model_type, model_name):
-    """Calculates the cost for a single article analysis."""
-    cost = 0
+def calculate_analysis_cost(analysis_result, input_text, model_type, model_name, usage=None, input_tokens=None):
+    """
+    Calculates the cost for a single article analysis.
+    Provider-reported `usage` is used when available. Otherwise tokens are
+    counted locally; pass `input_tokens` when the input was already tokenised
+    to avoid encoding it a second time.
+    """
     pricing = PRICING_CONFIG.get(model_type.lower(), {}).get("models", {}).get(model_name)
     if not pricing:
         return 0
 
-    # Input cost
-    if model_type.lower() == 'openai':
-        input_tokens = num_tokens_from_string(input_text, model_name)
-    else:  # groq
-        input_tokens = approximate_groq_tokens(input_text)
-    cost += (input_tokens / 1_000_000) * pricing['input']
+    if usage:
+        input_tokens = usage["input_tokens"]
+        output_tokens = usage["output_tokens"]
+    else:
+        if input_tokens is None:
+            input_tokens = _count_tokens(input_text, model_type, model_name)
+        output_tokens = _count_tokens(json.dumps(analysis_result.dict()), model_type, model_name)
 
-    # Output cost
-    output_json = json.dumps(analysis_result.dict())
-    if model_type.lower() == 'openai':
-        output_tokens = num_tokens_from_string(output_json, model_name)
-    else:  # groq
-        output_tokens = approximate_groq_tokens(output_json)
-    cost += (output_tokens / 1_000_000) * pricing['output']
-    
-    return cost
+    return (input_tokens / 1_000_000) * pricing['input'] + (output_tokens / 1_000_000) * pricing['output']
 
-def calculate_embedding_cost(text_to_embed, model_name):
-    """Calculates the cost for a single article embedding."""
+def calculate_embedding_cost(text_to_embed, model_name, usage_tokens=None):
+    """
+    Calculates the cost for a single article embedding. `usage_tokens` is the
+    provider-reported prompt token count; the text is only tokenised when it is missing.
+    """
     pricing = PRICING_CONFIG.get("openai", {}).get("embedding", {}).get(model_name)
     if not pricing:
         return 0
     
-    tokens = num_tokens_from_string(text_to_embed, model_name)
+    tokens = usage_tokens if usage_tokens is not None else num_tokens_from_string(text_to_embed, model_name)
     cost = (tokens / 1_000_000) * pricing['usage']
     return cost
@@ -1,113 +1,652 @@
 from flask import jsonify, Blueprint,request
 from openai import OpenAI
 import os
+import json
 import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone
-from database import supabase
-from .agent_manager import get_extraction_chain
+from .agent_manager import ArticleAnalysis, get_extraction_chain, get_batch_extraction_chain, format_article_batch, unpack_extraction_output
 from .status import pipeline_status_tracker, status_lock
+from .response_cache import bump_generation
 from .cost_calculator import calculate_analysis_cost, calculate_embedding_cost
-from .NameMatch import decide
+from .NameMatch import decide_many
+from .analysis_cache import get_cached_analysis, store_cached_analysis
+from .relevance_filter import RELEVANCE_SKIP_THRESHOLD, get_relevance_classifier, evaluate_relevance_classifier
+from .text_pruner import EXTRACTION_TOKEN_BUDGET, PRUNING_AB_TOKEN_BUDGET, prune_article_text, compare_extractions
+from .llm_router import get_router, default_fallback
+from .pipeline_repository import (
+    create_pipeline_run, update_pipeline_run, increment_run_counters, persist_article_analysis, save_article_embeddings,
+    fetch_articles_pending_analysis, fetch_articles_pending_embedding, set_analysis_status, set_embedding_status,
+    fetch_analysed_articles_sample, insert_pruning_ab_result, fetch_pruning_ab_results,
+)
 
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def _do_entity_extraction(pipeline_id, stop_event, model_type: str, model_name: str):
-    total_processed, total_failed = 0, 0
-    articles_res = supabase.table("scraped_articles").select("id, cleaned_text").eq("analysis_status", "pending").not_.is_("cleaned_text", "null").execute()
-    articles_to_analyze = articles_res.data
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+MAX_ANALYSIS_CONCURRENCY = 32
+# Total article tokens packed into one multi-article extraction request. 0 disables batching.
+ANALYSIS_BATCH_TOKEN_BUDGET = int(os.getenv("ANALYSIS_BATCH_TOKEN_BUDGET", "0"))
+MAX_ARTICLES_PER_BATCH = 8
+# Fast-tier results with a self-reported confidence below this are escalated.
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))
+# Article embeddings are buffered and written with one COPY per this many rows.
+EMBEDDING_WRITE_BATCH_SIZE = int(os.getenv("EMBEDDING_WRITE_BATCH_SIZE", "50"))
+
+
+def parse_analysis_options(data):
+    """
+    Extracts the optional analysis tuning parameters from a request body.
+    Unknown or invalid values fall back to the defaults.
+    """
+    options = {
+        "concurrency": ANALYSIS_CONCURRENCY,
+        "use_cache": True,
+        "relevance_threshold": RELEVANCE_SKIP_THRESHOLD,
+        "max_input_tokens": EXTRACTION_TOKEN_BUDGET,
+        "batch_token_budget": ANALYSIS_BATCH_TOKEN_BUDGET,
+        "cascade_model_type": None,
+        "cascade_model_name": None,
+        "cascade_min_confidence": CASCADE_MIN_CONFIDENCE,
+        "failover": True,
+        "fallback_model_type": None,
+        "fallback_model_name": None,
+    }
+    if not data:
+        return options
+    if data.get("cascade_model_type") and data.get("cascade_model_name"):
+        options["cascade_model_type"] = data["cascade_model_type"]
+        options["cascade_model_name"] = data["cascade_model_name"]
+    if data.get("fallback_model_type") and data.get("fallback_model_name"):
+        options["fallback_model_type"] = data["fallback_model_type"]
+        options["fallback_model_name"] = data["fallback_model_name"]
+    options["use_cache"] = bool(data.get("use_cache", True))
+    options["failover"] = bool(data.get("failover", True))
+    try:
+        concurrency = int(data.get("concurrency", ANALYSIS_CONCURRENCY))
+        options["concurrency"] = max(1, min(concurrency, MAX_ANALYSIS_CONCURRENCY))
+    except (TypeError, ValueError):
+        pass
+    try:
+        threshold = float(data.get("relevance_threshold", RELEVANCE_SKIP_THRESHOLD))
+        options["relevance_threshold"] = max(0.0, min(threshold, 1.0))
+    except (TypeError, ValueError):
+        pass
+    try:
+        options["max_input_tokens"] = max(0, int(data.get("max_input_tokens", EXTRACTION_TOKEN_BUDGET)))
+    except (TypeError, ValueError):
+        pass
+    try:
+        options["batch_token_budget"] = max(0, int(data.get("batch_token_budget", ANALYSIS_BATCH_TOKEN_BUDGET)))
+    except (TypeError, ValueError):
+        pass
+    try:
+        options["cascade_min_confidence"] = float(data.get("cascade_min_confidence", CASCADE_MIN_CONFIDENCE))
+    except (TypeError, ValueError):
+        pass
+    return options
+
+
+def _record_token_usage(run, article):
+    """Counts an article's input tokens once, even when it is retried on its own after a batch."""
+    with run["lock"]:
+        if article.get("tokens_recorded"):
+            return
+        article["tokens_recorded"] = True
+        run["token_stats"]["original"] += article["prune_stats"]["original_tokens"]
+        run["token_stats"]["sent"] += article["prune_stats"]["pruned_tokens"]
+
+
+def _prepare_article(article, run):
+    """
+    Prunes the article text to the run's token budget and resolves the article
+    without a model call when possible. Sets article["prompt_text"] and
+    article["prune_stats"], and returns (outcome, analysis_result):
+    ("cached", result) on a cache hit, ("skipped", None) when the relevance
+    pre-classifier scores it below the threshold, or (None, None) when the
+    article has to be sent to the model.
+    """
+    options = run["options"]
+    if "prompt_text" not in article:
+        article["prompt_text"], article["prune_stats"] = prune_article_text(article['cleaned_text'], options["max_input_tokens"], run["model_name"])
+
+    if options["use_cache"]:
+        cached = get_cached_analysis(article["prompt_text"], run["model_type"], run["model_name"])
+        if cached is not None:
+            print(f"Article {article['id']} served from analysis cache")
+            return "cached", cached
+
+    classifier = run["relevance_classifier"]
+    if classifier is not None:
+        relevance = classifier.score(article['cleaned_text'])
+        if relevance < options["relevance_threshold"]:
+            print(f"Article {article['id']} skipped by relevance pre-classifier (score {relevance:.3f})")
+            return "skipped", None
+    return None, None
+
+
+def _record_tier_call(run, tier, seconds, calls=1):
+    with run["lock"]:
+        run["tier_stats"][tier]["calls"] += calls
+        run["tier_stats"][tier]["seconds"] += seconds
+
+
+def _escalation_reason(analysis_result, run):
+    """
+    Returns why a fast-tier result must be re-done by the main model, or None
+    when it can be accepted as is.
+    """
+    confidence = analysis_result.confidence
+    if confidence is None or confidence < run["options"]["cascade_min_confidence"]:
+        return "low_confidence"
+    if analysis_result.mode == "Tender":
+        return "tender"
+    if any(sent.sentiment == "Negative" for sent in (analysis_result.company_sentiments or [])):
+        return "negative"
+    return None
+
+
+def _record_escalation(run, reason):
+    with run["lock"]:
+        run["tier_stats"]["escalations"][reason] += 1
+
+
+def _accept_fast_result(run):
+    with run["lock"]:
+        run["tier_stats"]["fast"]["accepted"] += 1
+
+
+def _build_route(model, chain_factory, fallback=None):
+    """
+    Builds the chain for `model`, the chain for its `fallback` model if any,
+    and the shared router that hedges and fails over between them.
+    """
+    fallback_chain = None
+    if fallback and fallback != model:
+        try:
+            fallback_chain = chain_factory(*fallback)
+        except Exception as e:
+            print(f"Warning: fallback model {fallback} unavailable, {model} runs without failover: {e}")
+    if fallback_chain is None:
+        fallback = None
+    return {
+        "chain": chain_factory(*model),
+        "fallback_chain": fallback_chain,
+        "router": get_router("extraction", model, fallback),
+    }
+
+
+def _routed_invoke(run, key, inputs):
+    """
+    Invokes run["routes"][key] through its hedging/failover router. Invalid
+    structured output counts as a failure so it also fails over.
+    Returns (parsed, usage, (model_type, model_name)) for the model that answered.
+    """
+    route = run["routes"][key]
+    fallback_chain = route["fallback_chain"]
+    (parsed, usage), served_model = route["router"].call(
+        lambda: unpack_extraction_output(route["chain"].invoke(inputs)),
+        (lambda: unpack_extraction_output(fallback_chain.invoke(inputs))) if fallback_chain else None,
+        on_discarded=lambda result, model: _record_discarded_call(run, inputs, result, model),
+    )
+    return parsed, usage, served_model
+
+
+def _record_discarded_call(run, inputs, result, model):
+    """
+    Adds the cost of a hedged call whose answer was not used to the run: the
+    provider bills it even though no article is stored from it.
+    """
+    parsed, usage = result
+    # Every extraction prompt has a single input variable.
+    input_text = next(iter(inputs.values()))
+    cost = calculate_analysis_cost(parsed, input_text, model[0], model[1], usage=usage)
+    with run["lock"]:
+        run["discarded_calls"]["calls"] += 1
+        run["discarded_calls"]["cost"] += cost
+    increment_run_counters(run["pipeline_id"], analysis_cost=cost, total_cost=cost)
+
+
+def _invoke_tier(article, run, tier):
+    """
+    Runs one model tier on an article. Returns (analysis_result, cost, model)
+    where model is the model that actually answered (the tier's fallback on failover).
+    """
+    start = time.perf_counter()
+    analysis_result, usage, (model_type, model_name) = _routed_invoke(run, tier, {"article_text": article["prompt_text"]})
+    _record_tier_call(run, tier, time.perf_counter() - start)
+    analysis_cost = calculate_analysis_cost(
+        analysis_result, article["prompt_text"], model_type, model_name,
+        usage=usage, input_tokens=article["prune_stats"]["pruned_tokens"]
+    )
+    store_cached_analysis(article["prompt_text"], model_type, model_name, analysis_result)
+    return analysis_result, analysis_cost, (model_type, model_name)
+
+
+def _extract_single(article, run, fast_result=None, fast_cost=0, fast_model=None):
+    """
+    Runs the extraction for one article. In cascade mode the fast model goes
+    first (unless `fast_result` was already produced by a batched fast call,
+    served by `fast_model`) and the main model only runs when the fast output
+    fails validation or `_escalation_reason` rejects it.
+    Returns (analysis_result, cost, (model_type, model_name)).
+    """
+    _record_token_usage(run, article)
+    if "fast" in run["models"]:
+        if fast_model is None:
+            fast_model = run["models"]["fast"]
+        try:
+            if fast_result is None:
+                fast_result = get_cached_analysis(article["prompt_text"], *fast_model)
+            if fast_result is None:
+                fast_result, fast_cost, fast_model = _invoke_tier(article, run, "fast")
+            reason = _escalation_reason(fast_result, run)
+        except Exception as e:
+            print(f"Fast tier produced invalid output for article {article['id']}: {e}")
+            reason = "invalid_output"
+        if reason is None:
+            _accept_fast_result(run)
+            return fast_result, fast_cost, fast_model
+        print(f"Escalating article {article['id']} to {run['model_type']}:{run['model_name']} ({reason})")
+        _record_escalation(run, reason)
+
+    analysis_result, analysis_cost, model = _invoke_tier(article, run, "main")
+    return analysis_result, fast_cost + analysis_cost, model
+
+
+def _extract_batch(articles, run):
+    """
+    Analyzes several short articles in one structured-output call, using the
+    fast tier when a cascade is configured. Returns
+    {article_id: (analysis_result, cost, model)} for every article; in cascade
+    mode rejected results are escalated individually. Raises ValueError when
+    the response does not contain exactly one analysis per requested article id.
+    """
+    tier = "fast" if "fast" in run["models"] else "main"
+    batch_input = format_article_batch([(article['id'], article["prompt_text"]) for article in articles])
+    start = time.perf_counter()
+    batch_result, usage, (model_type, model_name) = _routed_invoke(run, "batch", {"articles": batch_input})
+    _record_tier_call(run, tier, time.perf_counter() - start)
+
+    requested_ids = [article['id'] for article in articles]
+    returned_ids = [item.article_id for item in batch_result.analyses]
+    if sorted(returned_ids) != sorted(requested_ids):
+        raise ValueError(f"Batch response ids {returned_ids} do not match requested ids {requested_ids}")
+
+    # The single request is billed once; share its cost by each article's input size.
+    total_tokens = sum(article["prune_stats"]["pruned_tokens"] for article in articles) or 1
+    batch_cost = calculate_analysis_cost(batch_result, batch_input, model_type, model_name, usage=usage, input_tokens=total_tokens)
+    articles_by_id = {article['id']: article for article in articles}
+
+    results = {}
+    for item in batch_result.analyses:
+        article = articles_by_id[item.article_id]
+        analysis_result = ArticleAnalysis.parse_obj(item.dict(exclude={"article_id"}))
+        share = batch_cost * article["prune_stats"]["pruned_tokens"] / total_tokens
+        _record_token_usage(run, article)
+        store_cached_analysis(article["prompt_text"], model_type, model_name, analysis_result)
+        if tier == "fast":
+            try:
+                results[item.article_id] = _extract_single(
+                    article, run, fast_result=analysis_result, fast_cost=share, fast_model=(model_type, model_name)
+                )
+            except Exception as e:
+                # Leaving the id out makes the caller retry this article on its own.
+                print(f"Escalation failed for article {article['id']}: {e}")
+        else:
+            results[item.article_id] = (analysis_result, share, (model_type, model_name))
+    return results
+
+
+def _cascade_summary(run):
+    """Per-tier traffic and an estimate of the latency the fast tier saved."""
+    tier_stats = run["tier_stats"]
+    fast, main = tier_stats["fast"], tier_stats["main"]
+    summary = {
+        "fast_model": "{}:{}".format(*run["models"]["fast"]),
+        "main_model": "{}:{}".format(*run["models"]["main"]),
+        "fast_calls": fast["calls"],
+        "accepted_by_fast": fast["accepted"],
+        "main_calls": main["calls"],
+        "escalations": dict(tier_stats["escalations"]),
+        "avg_fast_seconds": round(fast["seconds"] / fast["calls"], 3) if fast["calls"] else None,
+        "avg_main_seconds": round(main["seconds"] / main["calls"], 3) if main["calls"] else None,
+        "estimated_seconds_saved": None,
+    }
+    if fast["calls"] and main["calls"]:
+        summary["estimated_seconds_saved"] = round(
+            fast["accepted"] * (main["seconds"] / main["calls"]) - fast["seconds"], 2
+        )
+    return summary
+
+
+def _persist_analysis(article, analysis_result, analysis_cost, model, run, prefilter_skipped=False):
+    """
+    Resolves the mentioned companies in one batch, then stores the analysis, its company
+    rows, the article status and the run counters atomically in a single
+    persist_article_analysis() call. `analysis_result` is None for articles
+    skipped by the relevance pre-classifier.
+    """
+    analysis_data, company_records = None, []
+    if analysis_result is not None and analysis_result.mode != "Ignore":
+        analysis_data = {
+            "model_type": model[0],
+            "model_name": model[1],
+            **analysis_result.dict(exclude={"company_sentiments"})
+        }
+        sentiments = analysis_result.company_sentiments or []
+        resolved = decide_many([sent.company_name.strip() for sent in sentiments])
+        for sent in sentiments:
+            id_ = resolved.get(sent.company_name.strip())
+
+            print("company : ", sent.company_name.strip(), "id:", id_)
+            company_records.append({
+                "company_id": id_['id'] if id_ else None,
+                **sent.dict()
+            })
+
+    persist_article_analysis(article['id'], run["pipeline_id"], analysis_data, company_records, analysis_cost, prefilter_skipped)
+    print(f"Article {article['id']} analyzed successfully")
+
+
+def _mark_analysis_failed(article, error):
+    print(f"Failed to analyze article {article['id']}: {error}")
+    try:
+        set_analysis_status([article['id']], "failed")
+    except Exception as e:
+        # Keep going with the rest of the unit; the article stays 'processing'.
+        print(f"Could not mark article {article['id']} as failed: {e}")
+
+
+def _analyze_articles(articles, run):
+    """
+    Analyzes a work unit of one or more articles and persists every result.
+    Articles resolved by the cache or the relevance pre-classifier never reach
+    the model. When more than one article remains they are sent as a single
+    batched request; any article missing from a malformed batch response falls
+    back to its own call.
+    Returns one outcome per article: "analyzed", "batched", "cached", "skipped" or "failed".
+    """
+    outcomes = []
+    to_extract = []
+    for article in articles:
+        try:
+            outcome, analysis_result = _prepare_article(article, run)
+            if outcome == "cached":
+                _persist_analysis(article, analysis_result, 0, run["models"]["main"], run)
+            elif outcome == "skipped":
+                _persist_analysis(article, None, 0, None, run, prefilter_skipped=True)
+            else:
+                to_extract.append(article)
+                continue
+            outcomes.append(outcome)
+        except Exception as e:
+            _mark_analysis_failed(article, e)
+            outcomes.append("failed")
+
+    if len(to_extract) > 1:
+        try:
+            batch_results = _extract_batch(to_extract, run)
+        except Exception as e:
+            print(f"Batched extraction of {len(to_extract)} articles failed, falling back to individual calls: {e}")
+            batch_results = {}
+        for article in to_extract:
+            if article['id'] not in batch_results:
+                continue
+            try:
+                _persist_analysis(article, *batch_results[article['id']], run)
+                outcomes.append("batched")
+            except Exception as e:
+                _mark_analysis_failed(article, e)
+                outcomes.append("failed")
+        to_extract = [article for article in to_extract if article['id'] not in batch_results]
+
+    for article in to_extract:
+        try:
+            _persist_analysis(article, *_extract_single(article, run), run)
+            outcomes.append("analyzed")
+        except Exception as e:
+            _mark_analysis_failed(article, e)
+            outcomes.append("failed")
+    return outcomes
+
+
+def _next_work_unit(remaining, run):
+    """
+    Takes the next unit of work from the `remaining` iterator. With batching
+    enabled, consecutive short articles are packed together until the run's
+    batch token budget or MAX_ARTICLES_PER_BATCH is reached; an article that
+    does not fit is pushed back and starts the next unit.
+    """
+    budget = run["options"]["batch_token_budget"]
+    unit, used = [], 0
+    for article in remaining:
+        if budget <= 0:
+            return [article]
+        if "prompt_text" not in article:
+            article["prompt_text"], article["prune_stats"] = prune_article_text(article['cleaned_text'], run["options"]["max_input_tokens"], run["model_name"])
+        tokens = article["prune_stats"]["pruned_tokens"]
+        if unit and (used + tokens > budget or len(unit) >= MAX_ARTICLES_PER_BATCH):
+            run["pushed_back"].append(article)
+            return unit
+        unit.append(article)
+        used += tokens
+        if used >= budget:
+            return unit
+    return unit
+
+
+def _do_entity_extraction(pipeline_id, stop_event, model_type: str, model_name: str, options=None):
+    """
+    Analyzes all pending articles, keeping up to `options["concurrency"]` work
+    units (single articles or packed batches) in flight. Each result is
+    persisted by its worker as soon as it finishes. On a stop request no new
+    work is started; in-flight units are allowed to complete and be saved
+    before InterruptedError is raised.
+    """
+    options = options or parse_analysis_options(None)
+    concurrency = options["concurrency"]
+    articles_to_analyze = fetch_articles_pending_analysis()
+    total = len(articles_to_analyze)
     with status_lock:
-        pipeline_status_tracker["total"] = len(articles_to_analyze)
+        pipeline_status_tracker["total"] = total
         pipeline_status_tracker["progress"] = 0
     if not articles_to_analyze:
         with status_lock:
             pipeline_status_tracker["details"]["message"] = "No new articles to analyze."
         return 0, 0
 
+    models = {"main": (model_type, model_name)}
+    if options["cascade_model_type"]:
+        models["fast"] = (options["cascade_model_type"], options["cascade_model_name"])
+    fallbacks = {}
+    if options["failover"]:
+        fallbacks = {tier: default_fallback(model[0]) for tier, model in models.items()}
+        if options["fallback_model_type"]:
+            fallbacks["main"] = (options["fallback_model_type"], options["fallback_model_name"])
     try:
-        extraction_chain = get_extraction_chain(model_type, model_name)
+        routes = {tier: _build_route(model, get_extraction_chain, fallbacks.get(tier)) for tier, model in models.items()}
+        if options["batch_token_budget"] > 0:
+            batch_tier = "fast" if "fast" in models else "main"
+            routes["batch"] = _build_route(models[batch_tier], get_batch_extraction_chain, fallbacks.get(batch_tier))
     except ValueError as e:
         print(f"Error: {e}")
         # Mark all as failed since the model provider is invalid for this run
-        for article in articles_to_analyze:
-             supabase.table("scraped_articles").update({"analysis_status": "failed"}).eq("id", article['id']).execute()
+        set_analysis_status([article['id'] for article in articles_to_analyze], "failed")
         raise e
 
-    for i, article in enumerate(articles_to_analyze):
+    relevance_classifier = None
+    if options["relevance_threshold"] > 0:
+        try:
+            # Retrained only once enough new LLM verdicts have accumulated.
+            relevance_classifier = get_relevance_classifier()
+        except Exception as e:
+            print(f"Warning: relevance pre-classifier unavailable, analysing every article: {e}")
+
+    run = {
+        "pipeline_id": pipeline_id,
+        "routes": routes,
+        "models": models,
+        "model_type": model_type,
+        "model_name": model_name,
+        "options": options,
+        "relevance_classifier": relevance_classifier,
+        "token_stats": {"original": 0, "sent": 0},
+        "discarded_calls": {"calls": 0, "cost": 0.0},
+        "tier_stats": {
+            "fast": {"calls": 0, "accepted": 0, "seconds": 0.0},
+            "main": {"calls": 0, "seconds": 0.0},
+            "escalations": Counter(),
+        },
+        "lock": threading.Lock(),
+        "pushed_back": [],
+    }
+
+    outcomes = Counter()
+    articles_iter = iter(articles_to_analyze)
+
+    def remaining():
+        # Articles pushed back by the batch packer are handed out again first.
+        for article in articles_iter:
+            yield article
+            while run["pushed_back"]:
+                yield run["pushed_back"].pop()
+
+    pending_articles = remaining()
+    in_flight = set()
+    # future -> the articles it analyses, to count them if the unit itself fails.
+    units = {}
+    stopped = False
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis") as executor:
+        while True:
+            if stop_event.is_set():
+                stopped = True
+            # Top up the worker pool so that `concurrency` units are always in flight.
+            while not stopped and len(in_flight) < concurrency:
+                unit = _next_work_unit(pending_articles, run)
+                if not unit:
+                    break
+                future = executor.submit(_analyze_articles, unit, run)
+                units[future] = unit
+                in_flight.add(future)
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit = units.pop(future)
+                try:
+                    outcomes.update(future.result())
+                except Exception as e:
+                    print(f"Analysis of articles {[article['id'] for article in unit]} failed: {e}")
+                    outcomes["failed"] += len(unit)
+            if done:
+                completed = sum(outcomes.values())
+                token_stats = run["token_stats"]
+                token_saving = 1 - token_stats["sent"] / token_stats["original"] if token_stats["original"] else 0
+                with status_lock:
+                    pipeline_status_tracker["progress"] = completed
+                    pipeline_status_tracker["details"]["message"] = (
+                        f"Analyzed {completed}/{total} with {model_type}:{model_name} "
+                        f"({len(in_flight)} in flight, concurrency {concurrency}; "
+                        f"batched {outcomes['batched']}, cached {outcomes['cached']}, "
+                        f"skipped {outcomes['skipped']}, failed {outcomes['failed']}; "
+                        f"input tokens pruned {token_saving:.0%})"
+                    )
+
+    analysis_stats = {
+        "outcomes": dict(outcomes),
+        "input_tokens": dict(run["token_stats"]),
+        "discarded_hedged_calls": dict(run["discarded_calls"]),
+        "cascade": _cascade_summary(run) if "fast" in models else None,
+    }
+    print(f"Analysis stats: {json.dumps(analysis_stats)}")
+    try:
+        update_pipeline_run(pipeline_id, analysis_stats=analysis_stats)
+    except Exception as e:
+        print(f"Warning: failed to store analysis stats: {e}")
+
+    if stopped:
+        raise InterruptedError("Stop requested")
+    total_failed = outcomes["failed"]
+    return sum(outcomes.values()) - total_failed, total_failed
+
+
+def _do_pruning_ab_test(pipeline_id, stop_event, model_type: str, model_name: str, sample_size: int = 20, max_input_tokens: int = PRUNING_AB_TOKEN_BUDGET):
+    """
+    Re-extracts a sample of already analysed articles twice, once with the full
+    text and once with the pruned text, and stores the token reduction and the
+    agreement between the two results in prompt_pruning_ab.
+    """
+    total_processed, total_failed = 0, 0
+    articles = fetch_analysed_articles_sample(sample_size * 3)
+    # Only articles that actually exceed the budget say anything about pruning.
+    candidates = []
+    for article in articles:
+        pruned_text, prune_stats = prune_article_text(article['cleaned_text'], max_input_tokens, model_name)
+        if prune_stats["pruned_tokens"] < prune_stats["original_tokens"]:
+            candidates.append((article, pruned_text, prune_stats))
+        if len(candidates) >= sample_size:
+            break
+
+    with status_lock:
+        pipeline_status_tracker["total"] = len(candidates)
+        pipeline_status_tracker["progress"] = 0
+    if not candidates:
+        with status_lock:
+            pipeline_status_tracker["details"]["message"] = "No articles exceed the token budget; nothing to compare."
+        return 0, 0
+
+    extraction_chain = get_extraction_chain(model_type, model_name)
+    for i, (article, pruned_text, prune_stats) in enumerate(candidates):
         if stop_event.is_set(): raise InterruptedError("Stop requested")
         with status_lock:
             pipeline_status_tracker["progress"] = i + 1
-            pipeline_status_tracker["details"]["message"] = f"Analyzing {i+1}/{len(articles_to_analyze)} with {model_type}:{model_name}"
+            pipeline_status_tracker["details"]["message"] = f"Comparing full vs pruned extraction {i+1}/{len(candidates)}"
         try:
-            analysis_result = extraction_chain.invoke({
-                "article_text": article['cleaned_text'],
+            full_result, pruned_result = [unpack_extraction_output(output)[0] for output in extraction_chain.batch([
+                {"article_text": article['cleaned_text']},
+                {"article_text": pruned_text},
+            ])]
+            agreement = compare_extractions(full_result, pruned_result)
+            insert_pruning_ab_result({
+                "article_id": article['id'],
                 "model_type": model_type,
-                "model_name": model_name
-                })
-            
-            analysis_cost = calculate_analysis_cost(analysis_result, article['cleaned_text'], model_type, model_name)
-
-            if analysis_result.mode == "Ignore":
-                supabase.table("scraped_articles").update({"analysis_status": "success"}).eq("id", article['id']).execute()
-            else:
-                analysis_data = analysis_result.dict(exclude={"company_sentiments"})
-                analysis_data_with_cost = {
-                    "article_id": article['id'],
-                    "cost": analysis_cost,
-                    **analysis_data
-                }
-                analysis_insert_res = supabase.table("article_analysis").insert({
-                    "article_id": article['id'],
-                    **analysis_data
-                }).execute()
-
-
-                analysis_id = analysis_insert_res.data[0]['id']
-                if analysis_result.company_sentiments:
-                    company_records = []
-                    for sent in analysis_result.company_sentiments:
-                        id_ = decide(sent.company_name.strip())
-
-                        print("company : ", sent.company_name.strip(), "id:", id_)
-                        company_records.append({
-                            "article_analysis_id": analysis_id,
-                            "company_id": id_['id'] if id_ else None,
-                            **sent.dict()
-                        })
-                    
-                    # company_records = [{"article_analysis_id": analysis_id, **sent.dict()} for sent in analysis_result.company_sentiments]
-                    supabase.table("company_analysis").insert(company_records).execute()
-                supabase.table("scraped_articles").update({"analysis_status": "success"}).eq("id", article['id']).execute()
-
+                "model_name": model_name,
+                "token_budget": max_input_tokens,
+                "full_tokens": prune_stats["original_tokens"],
+                "pruned_tokens": prune_stats["pruned_tokens"],
+                **agreement
+            })
             total_processed += 1
-            run_res = supabase.table("pipeline_runs").select("analysis_cost, total_cost,articles_analyzed").eq("id", pipeline_id).single().execute()
-            current_count = run_res.data.get("articles_analyzed", 0) or 0
-            print(f"Current count: {current_count}")
-            current_count += 1
-            current_analysis_cost = run_res.data.get("analysis_cost", 0) or 0
-            current_total_cost = run_res.data.get("total_cost", 0) or 0
-            print("current_count:", current_count)
-            supabase.table("pipeline_runs").update({
-                "articles_analyzed": current_count,
-                "analysis_cost": current_analysis_cost + analysis_cost,
-                "total_cost": current_total_cost + analysis_cost
-            }).eq("id", pipeline_id).execute()
-
-            print(f"Article {article['id']} analyzed successfully")    
-
-
         except Exception as e:
-            print(f"Failed to analyze article {article['id']}: {e}")
-            supabase.table("scraped_articles").update({"analysis_status": "failed"}).eq("id", article['id']).execute()
+            print(f"Pruning A/B comparison failed for article {article['id']}: {e}")
             total_failed += 1
-            print(f"Article {article['id']} analyzed with errors: {e}")    
     return total_processed, total_failed
 
+def _flush_embeddings(pipeline_id, pending, embedding_model):
+    """Stores buffered embeddings in one bulk write. Returns (saved, failed)."""
+    if not pending:
+        return 0, 0
+    try:
+        save_article_embeddings(pipeline_id, pending, embedding_model)
+        for article, _, _ in pending:
+            print(f"Article {article['id']} embedded successfully")
+        return len(pending), 0
+    except Exception as e:
+        print(f"Failed to store {len(pending)} embeddings: {e}")
+        set_embedding_status([article['id'] for article, _, _ in pending], "failed")
+        return 0, len(pending)
+    finally:
+        pending.clear()
+
+
 def _do_embedding_generation(pipeline_id, stop_event):
     total_processed, total_failed = 0, 0
     embedding_model = "text-embedding-3-small"
-    articles_res = supabase.table("scraped_articles").select("id, source, publication_date, cleaned_text").eq("embedding_status", "pending").not_.is_("cleaned_text", "null").execute()
-    articles_to_process = articles_res.data
+    articles_to_process = fetch_articles_pending_embedding()
     with status_lock:
         pipeline_status_tracker["total"] = len(articles_to_process)
         pipeline_status_tracker["progress"] = 0
@@ -115,40 +654,33 @@ def _do_embedding_generation(pipeline_id, stop_event):
         with status_lock:
             pipeline_status_tracker["details"]["message"] = "No new articles for embeddings."
         return 0, 0
-    for i, article in enumerate(articles_to_process):
-        if stop_event.is_set(): raise InterruptedError("Stop requested")
-        with status_lock:
-            pipeline_status_tracker["progress"] = i + 1
-            pipeline_status_tracker["details"]["message"] = f"Embedding {i+1}/{len(articles_to_process)}"
-        try:
-            embedding_response = client.embeddings.create(model=embedding_model, input=article['cleaned_text'])
-            embedding = embedding_response.data[0].embedding
-
-            embedding_cost = calculate_embedding_cost(article['cleaned_text'], embedding_model)
-
-            supabase.table("article_embeddings").insert({"article_id": article['id'], "source": article.get('source'), "publication_date": article.get('publication_date'), 
-                                                         "embedding": embedding, "model": embedding_model, "cost": embedding_cost}).execute()
-            supabase.table("scraped_articles").update({"embedding_status": "success"}).eq("id", article['id']).execute()
-            
-            total_processed += 1
-
-            run_res = supabase.table("pipeline_runs").select("embedding_cost, total_cost,articles_embedded").eq("id", pipeline_id).single().execute()
-            current_embedding_cost = run_res.data.get("embedding_cost", 0) or 0
-            current_total_cost = run_res.data.get("total_cost", 0) or 0
-            current_count = run_res.data.get("articles_embedded", 0) or 0 # Handle null value
+    # (article, embedding, cost) rows waiting to be written with one COPY.
+    pending = []
+    try:
+        for i, article in enumerate(articles_to_process):
+            if stop_event.is_set(): raise InterruptedError("Stop requested")
+            with status_lock:
+                pipeline_status_tracker["progress"] = i + 1
+                pipeline_status_tracker["details"]["message"] = f"Embedding {i+1}/{len(articles_to_process)}"
+            try:
+                embedding_response = client.embeddings.create(model=embedding_model, input=article['cleaned_text'])
+                embedding = embedding_response.data[0].embedding
 
-            supabase.table("pipeline_runs").update({
-                "articles_embedded": current_count + 1,
-                "embedding_cost": current_embedding_cost + embedding_cost,
-                "total_cost": current_total_cost + embedding_cost
-            }).eq("id", pipeline_id).execute()
+                usage_tokens = embedding_response.usage.prompt_tokens if embedding_response.usage else None
+                embedding_cost = calculate_embedding_cost(article['cleaned_text'], embedding_model, usage_tokens)
+                pending.append((article, embedding, embedding_cost))
+            except Exception as e:
+                print(f"Failed to process article {article['id']}: {e}")
+                set_embedding_status([article['id']], "failed")
+                total_failed += 1
 
-            print(f"Article {article['id']} embedded successfully")
-        
-        except Exception as e:
-            print(f"Failed to process article {article['id']}: {e}")
-            supabase.table("scraped_articles").update({"embedding_status": "failed"}).eq("id", article['id']).execute()
-            total_failed += 1
+            if len(pending) >= EMBEDDING_WRITE_BATCH_SIZE:
+                saved, failed = _flush_embeddings(pipeline_id, pending, embedding_model)
+                total_processed, total_failed = total_processed + saved, total_failed + failed
+    finally:
+        # Embeddings already paid for are kept even when the run is stopped.
+        saved, failed = _flush_embeddings(pipeline_id, pending, embedding_model)
+        total_processed, total_failed = total_processed + saved, total_failed + failed
     return total_processed, total_failed
 
 def _run_single_stage(task_function, stage_name, task_args=None):
@@ -161,12 +693,7 @@ def _run_single_stage(task_function, stage_name, task_args=None):
             return jsonify({"error": f"A process is already running: {pipeline_status_tracker['current_stage']}"}), 409
         
         start_time_iso = datetime.now(timezone.utc).isoformat()
-        insert_response = supabase.table("pipeline_runs").insert({
-            "start_time": start_time_iso,
-            "status": "RUNNING",
-            "details": f"Running standalone stage: {stage_name}"
-        }).execute()
-        pipeline_id = insert_response.data[0]['id']
+        pipeline_id = create_pipeline_run(start_time_iso, f"Running standalone stage: {stage_name}")
 
         pipeline_status_tracker.update({
             "is_running": True,
@@ -210,7 +737,9 @@ def _finalize_single_stage_run(pipeline_id, results, stage_name):
     processed, failed = results
     end_time_iso = datetime.now(timezone.utc).isoformat()
     details = f"Standalone '{stage_name}' completed. Processed: {processed}, Failed: {failed}."
-    supabase.table("pipeline_runs").update({"status": "COMPLETED", "end_time": end_time_iso, "details": details}).eq("id", pipeline_id).execute()
+    update_pipeline_run(pipeline_id, status="COMPLETED", end_time=end_time_iso, details=details)
+    # The stage committed new rows: cached dashboard responses are stale.
+    bump_generation()
     with status_lock:
         pipeline_status_tracker.update({"is_running": False, "current_stage": "Idle", "current_pipeline_id": None, "details": {"message": details}})
 
@@ -226,6 +755,91 @@ def run_analysis_only_endpoint():
     
     task_args = {
         'model_type': data.get("model_type"),
-        'model_name': data.get("model_name")
+        'model_name': data.get("model_name"),
+        'options': parse_analysis_options(data)
     }
-    return _run_single_stage(task_function=_do_entity_extraction, stage_name="Analyzing Articles", task_args=task_args)
\ No newline at end of file
+    return _run_single_stage(task_function=_do_entity_extraction, stage_name="Analyzing Articles", task_args=task_args)
+
+
+@analysis_bp.route('/relevance/evaluate', methods=['GET'])
+def evaluate_relevance_endpoint():
+    """
+    Reports precision/recall of the relevance pre-classifier against past LLM
+    'Ignore' verdicts. Optional query parameter: threshold (defaults to
+    RELEVANCE_SKIP_THRESHOLD).
+    """
+    try:
+        threshold = float(request.args.get('threshold', RELEVANCE_SKIP_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "Invalid 'threshold' parameter. Must be a number."}), 400
+    try:
+        return jsonify(evaluate_relevance_classifier(threshold)), 200
+    except Exception as e:
+        return jsonify({"error": "Failed to evaluate relevance classifier", "details": str(e)}), 500
+
+
+@analysis_bp.route('/relevance/retrain', methods=['POST'])
+def retrain_relevance_endpoint():
+    """Retrains the shared relevance pre-classifier on the current analysis history."""
+    try:
+        classifier = get_relevance_classifier(refresh=True)
+    except Exception as e:
+        return jsonify({"error": "Failed to retrain relevance classifier", "details": str(e)}), 500
+    if classifier is None:
+        return jsonify({"trained": False, "message": "Not enough labelled history to train the relevance classifier."}), 200
+    return jsonify({"trained": True, "trained_on": classifier.trained_on}), 200
+
+
+@analysis_bp.route('/pruning/ab-test', methods=['POST'])
+def run_pruning_ab_test_endpoint():
+    """
+    Starts a background comparison of full-text vs pruned-text extraction.
+    Expects 'model_type' and 'model_name'; optional 'sample_size' and 'max_input_tokens'.
+    """
+    data = request.get_json()
+    if not data or not data.get('model_type') or not data.get('model_name'):
+        return jsonify({"error": "Request body must include 'model_type' and 'model_name'."}), 400
+    try:
+        task_args = {
+            'model_type': data.get("model_type"),
+            'model_name': data.get("model_name"),
+            'sample_size': int(data.get("sample_size", 20)),
+            'max_input_tokens': int(data.get("max_input_tokens", PRUNING_AB_TOKEN_BUDGET))
+        }
+    except (TypeError, ValueError):
+        return jsonify({"error": "'sample_size' and 'max_input_tokens' must be integers."}), 400
+    return _run_single_stage(task_function=_do_pruning_ab_test, stage_name="Pruning A/B Test", task_args=task_args)
+
+
+@analysis_bp.route('/pruning/ab-test', methods=['GET'])
+def get_pruning_ab_stats():
+    """
+    Aggregates the stored A/B comparisons per model and token budget: token
+    reduction and agreement with full-text extraction.
+    """
+    try:
+        results = fetch_pruning_ab_results()
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch pruning A/B results", "details": str(e)}), 500
+
+    groups = {}
+    for row in results:
+        key = (row["model_type"], row["model_name"], row["token_budget"])
+        groups.setdefault(key, []).append(row)
+
+    summary = []
+    for (group_model_type, group_model_name, token_budget), rows in groups.items():
+        full_tokens = sum(r["full_tokens"] for r in rows)
+        pruned_tokens = sum(r["pruned_tokens"] for r in rows)
+        summary.append({
+            "model_type": group_model_type,
+            "model_name": group_model_name,
+            "token_budget": token_budget,
+            "articles": len(rows),
+            "token_reduction": round(1 - pruned_tokens / full_tokens, 4) if full_tokens else 0,
+            "mode_agreement": round(sum(1 for r in rows if r["mode_match"]) / len(rows), 4),
+            "avg_company_jaccard": round(sum(r["company_jaccard"] for r in rows) / len(rows), 4),
+            "avg_country_jaccard": round(sum(r["country_jaccard"] for r in rows) / len(rows), 4),
+            "avg_commodity_jaccard": round(sum(r["commodity_jaccard"] for r in rows) / len(rows), 4),
+        })
+    return jsonify(summary), 200
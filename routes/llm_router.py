@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# =======================================================================
+# HEDGED LLM CALLS WITH PROVIDER FAILOVER
+# =======================================================================
+# Every routed call goes to a primary provider/model first. If it has not
+# answered by the primary's observed p95 latency, a hedged duplicate is sent
+# to the secondary provider and whichever answers first wins. Errors and
+# rate limits (HTTP 429) on the primary fail over to the secondary at once,
+# and a rate-limited primary is bypassed for a cool-down period. Every call
+# has an overall deadline so a degraded endpoint can no longer stall a run.
+# A call that loses the race (or outlives the deadline) is still billed by
+# its provider; callers can pass `on_discarded` to account for its result.
+
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "90"))
+# Hedge delay used until enough primary latencies have been observed.
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))
+LLM_HEDGE_MIN_DELAY = 1.0
+LLM_RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN_SECONDS", "30"))
+MIN_LATENCY_SAMPLES = 20
+
+# Default secondary for each primary provider: the other provider we already use.
+DEFAULT_FALLBACK_MODELS = {
+    "openai": ("groq", "llama3-70b-8192"),
+    "groq": ("openai", "gpt-4o-mini"),
+}
+
+# Shared by all routers. Hedged calls that lose the race keep running here until
+# they finish, so the pool is sized for a few stragglers per concurrent caller.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_ROUTER_WORKERS", "64")), thread_name_prefix="llm-router")
+
+
+def _is_rate_limit(error) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+class LLMRouter:
+    """
+    Routes calls for one (primary, secondary) model pair and keeps the latency
+    history used to decide when to hedge.
+    """
+
+    def __init__(self, primary, secondary=None, deadline: float = LLM_CALL_DEADLINE_SECONDS):
+        self.primary = primary
+        self.secondary = secondary
+        self.deadline = deadline
+        self._latencies = deque(maxlen=200)
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedges_sent": 0, "hedge_wins": 0, "failovers": 0, "rate_limited": 0, "timeouts": 0,
+                       "discarded_results": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def hedge_delay(self) -> float:
+        """The primary's p95 latency, or the default while there are too few samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, samples[int(0.95 * (len(samples) - 1))])
+
+    def _timed_primary(self, primary_fn):
+        start = time.perf_counter()
+        result = primary_fn()
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def _discard(self, futures, on_discarded, winner=None):
+        """
+        Hands the results of calls that were not used (the losing side of a
+        hedge, or calls still running at the deadline) to `on_discarded` as
+        (result, model) once they finish.
+        """
+        def report(future, model):
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._count("discarded_results")
+            if on_discarded is not None:
+                try:
+                    on_discarded(future.result(), model)
+                except Exception as e:
+                    print(f"Warning: could not record discarded result from {model}: {e}")
+
+        for future, model in futures.items():
+            if future is not winner:
+                future.add_done_callback(lambda f, model=model: report(f, model))
+
+    def call(self, primary_fn, secondary_fn=None, on_discarded=None):
+        """
+        Runs `primary_fn` with hedging/failover to `secondary_fn` (both
+        zero-argument callables). Returns (result, model) where model is the
+        (model_type, model_name) pair that produced the result.
+        `on_discarded(result, model)` is called for every other attempt that
+        still completes, so its cost can be recorded.
+        Raises TimeoutError when nothing answered before the deadline, or the
+        last error when every attempt failed.
+        """
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline
+        if secondary_fn is None or self.secondary is None:
+            future = _executor.submit(self._timed_primary, primary_fn)
+            done, _ = wait([future], timeout=self.deadline)
+            if not done:
+                self._count("timeouts")
+                self._discard({future: self.primary}, on_discarded)
+                raise TimeoutError(f"{self.primary} did not answer within {self.deadline:.0f}s")
+            return future.result(), self.primary
+
+        if time.monotonic() < self._cooldown_until:
+            # The primary recently rate-limited us; go straight to the secondary.
+            self._count("failovers")
+            futures = {_executor.submit(secondary_fn): self.secondary}
+        else:
+            primary = _executor.submit(self._timed_primary, primary_fn)
+            futures = {primary: self.primary}
+            done, _ = wait([primary], timeout=min(self.hedge_delay(), self.deadline))
+            if done and primary.exception() is None:
+                return primary.result(), self.primary
+            if done:
+                error = primary.exception()
+                if _is_rate_limit(error):
+                    self._count("rate_limited")
+                    self._cooldown_until = time.monotonic() + LLM_RATE_LIMIT_COOLDOWN_SECONDS
+                print(f"Primary model {self.primary} failed, failing over to {self.secondary}: {error}")
+                self._count("failovers")
+                futures = {}
+            else:
+                self._count("hedges_sent")
+            futures[_executor.submit(secondary_fn)] = self.secondary
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] == self.secondary and self.primary in futures.values():
+                        self._count("hedge_wins")
+                    self._discard(futures, on_discarded, winner=future)
+                    return future.result(), futures[future]
+                last_error = future.exception()
+        if last_error is not None and not pending:
+            raise last_error
+        self._count("timeouts")
+        self._discard(futures, on_discarded)
+        raise TimeoutError(f"No model answered within {self.deadline:.0f}s ({self.primary} / {self.secondary})")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            samples = len(self._latencies)
+        stats.update({
+            "primary": "{}:{}".format(*self.primary),
+            "secondary": "{}:{}".format(*self.secondary) if self.secondary else None,
+            "latency_samples": samples,
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+        })
+        return stats
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(purpose: str, primary, secondary=None, deadline: float = LLM_CALL_DEADLINE_SECONDS) -> LLMRouter:
+    """
+    Returns the long-lived router for this purpose, model pair and deadline,
+    so latency history is shared across pipeline runs and requests.
+    """
+    primary = (primary[0].lower(), primary[1])
+    secondary = (secondary[0].lower(), secondary[1]) if secondary else None
+    key = (purpose, primary, secondary, deadline)
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = LLMRouter(primary, secondary, deadline)
+        return _routers[key]
+
+
+def default_fallback(model_type: str):
+    """The secondary (model_type, model_name) used when a request does not name one."""
+    return DEFAULT_FALLBACK_MODELS.get(model_type.lower())
+
+
+def router_stats():
+    with _routers_lock:
+        routers = list(_routers.items())
+    return [{"purpose": purpose, "deadline_seconds": deadline, **router.stats()} for (purpose, _, _, deadline), router in routers]
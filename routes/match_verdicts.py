@@ -0,0 +1,100 @@
+from psycopg.rows import dict_row
+
+from database import get_db_connection
+from .company_resolver import normalize_company_name
+
+# =======================================================================
+# MEMO OF LLM SAME-ENTITY VERDICTS
+# =======================================================================
+# The LLM check in NameMatch answers "is mention X the same company as
+# stored company Y?". Our sources repeat the same spellings every day, so
+# each answer is stored keyed by the normalised mention and the candidate
+# company id, and looked up before asking again.
+
+
+def mention_key(company_name: str) -> str:
+    return normalize_company_name(company_name) or company_name.strip().lower()
+
+
+def get_verdicts(pairs: list) -> dict:
+    """
+    Looks up stored verdicts for (company_name, company_id) pairs in one query.
+    Returns {(company_name, company_id): verdict} for the pairs that have one.
+    """
+    if not pairs:
+        return {}
+    keys = {(mention_key(name), company_id): (name, company_id) for name, company_id in pairs}
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT v.mention_key, v.company_id, v.verdict
+            FROM entity_match_verdicts v
+            JOIN unnest(%s::text[], %s::int[]) AS q(mention_key, company_id)
+              ON q.mention_key = v.mention_key AND q.company_id = v.company_id;
+            """,
+            ([key for key, _ in keys], [company_id for _, company_id in keys]),
+        )
+        rows = cur.fetchall()
+    return {keys[(key, company_id)]: verdict for key, company_id, verdict in rows}
+
+
+def store_verdicts(verdicts: list, model: str):
+    """Upserts (company_name, company_id, verdict) rows produced by `model`."""
+    if not verdicts:
+        return
+    rows = {(mention_key(name), company_id): verdict for name, company_id, verdict in verdicts}
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO entity_match_verdicts (mention_key, company_id, verdict, model)
+            SELECT v.mention_key, v.company_id, v.verdict, %s
+            FROM unnest(%s::text[], %s::int[], %s::boolean[]) AS v(mention_key, company_id, verdict)
+            ON CONFLICT (mention_key, company_id) DO UPDATE
+              SET verdict = EXCLUDED.verdict, model = EXCLUDED.model, created_at = CURRENT_TIMESTAMP;
+            """,
+            (
+                model,
+                [key for key, _ in rows],
+                [company_id for _, company_id in rows],
+                [bool(verdict) for verdict in rows.values()],
+            ),
+        )
+
+
+def _filters(company_name=None, company_id=None, model=None, alias=""):
+    clauses, params = [], []
+    if company_name:
+        clauses.append(f"{alias}mention_key = %s")
+        params.append(mention_key(company_name))
+    if company_id is not None:
+        clauses.append(f"{alias}company_id = %s")
+        params.append(company_id)
+    if model:
+        clauses.append(f"{alias}model = %s")
+        params.append(model)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def list_verdicts(company_name=None, company_id=None, model=None, limit: int = 100):
+    where, params = _filters(company_name, company_id, model, alias="v.")
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            f"""
+            SELECT v.mention_key, v.company_id, c.real_name, v.verdict, v.model, v.created_at
+            FROM entity_match_verdicts v
+            LEFT JOIN companies c ON c.id = v.company_id
+            {where}
+            ORDER BY v.created_at DESC
+            LIMIT %s;
+            """,
+            params + [limit],
+        )
+        return cur.fetchall()
+
+
+def invalidate_verdicts(company_name=None, company_id=None, model=None) -> int:
+    """Deletes the matching verdicts (all of them when no filter is given). Returns the count."""
+    where, params = _filters(company_name, company_id, model)
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DELETE FROM entity_match_verdicts{where};", params)
+        return cur.rowcount
@@ -1,18 +1,18 @@
 import threading
-import json
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timezone
 
-from database import supabase
 from .status import pipeline_status_tracker, status_lock
+from .pipeline_repository import create_pipeline_run, update_pipeline_run, fetch_pipeline_runs, fetch_pipeline_run
+from .response_cache import bump_generation
 
 # Import the processing functions from the other modules
 from .scraper import _do_link_scraping, _do_article_scraping
-from .embedding import _do_embedding_generation, _do_entity_extraction
+from .embedding import _do_embedding_generation, _do_entity_extraction, parse_analysis_options
 
 pipeline_bp = Blueprint('pipeline', __name__, url_prefix='/api/pipeline')
 
-def _run_full_pipeline(pipeline_id, scraper_names, stop_event, model_type, model_name):
+def _run_full_pipeline(pipeline_id, scraper_names, stop_event, model_type, model_name, analysis_options=None):
     """The master orchestrator for the entire ETL pipeline."""
     try:
         with status_lock:
@@ -20,7 +20,8 @@ def _run_full_pipeline(pipeline_id, scraper_names, stop_event, model_type, model
             pipeline_status_tracker["details"]["message"] = "Starting link scraping..."
         
         links_found, scraper_stats = _do_link_scraping(pipeline_id, scraper_names, stop_event)
-        supabase.table("pipeline_runs").update({"new_links_found": links_found, "scraper_stats": json.dumps(scraper_stats)}).eq("id", pipeline_id).execute()
+        # new_links_found is already counted by the link scraper as it inserts.
+        update_pipeline_run(pipeline_id, scraper_stats=scraper_stats)
         print(f"Links found: {links_found}")
 
         with status_lock:
@@ -30,11 +31,11 @@ def _run_full_pipeline(pipeline_id, scraper_names, stop_event, model_type, model
         
         with status_lock:
             pipeline_status_tracker["current_stage"] = "Analyzing Articles"
-        articles_analyzed, _ = _do_entity_extraction(pipeline_id, stop_event, model_type, model_name)
+        articles_analyzed, _ = _do_entity_extraction(pipeline_id, stop_event, model_type, model_name, analysis_options)
         print(f"Articles analyzed: {articles_analyzed}")
 
         end_time_iso = datetime.now(timezone.utc).isoformat()
-        supabase.table("pipeline_runs").update({"status": "COMPLETED", "end_time": end_time_iso, "details": "All stages completed successfully."}).eq("id", pipeline_id).execute()
+        update_pipeline_run(pipeline_id, status="COMPLETED", end_time=end_time_iso, details="All stages completed successfully.")
         with status_lock:
             pipeline_status_tracker["details"]["message"] = "Pipeline completed successfully."
 
@@ -43,10 +44,12 @@ def _run_full_pipeline(pipeline_id, scraper_names, stop_event, model_type, model
         status_code = "STOPPED" if isinstance(e, InterruptedError) else "FAILED"
         print(f"Pipeline failed at stage '{pipeline_status_tracker['current_stage']}': {error_message}")
         end_time_iso = datetime.now(timezone.utc).isoformat()
-        supabase.table("pipeline_runs").update({"status": status_code, "end_time": end_time_iso, "details": f"Failed at stage: {pipeline_status_tracker['current_stage']}. Error: {error_message}"}).eq("id", pipeline_id).execute()
+        update_pipeline_run(pipeline_id, status=status_code, end_time=end_time_iso, details=f"Failed at stage: {pipeline_status_tracker['current_stage']}. Error: {error_message}")
         with status_lock:
             pipeline_status_tracker["details"]["message"] = f"Error: {error_message}"
     finally:
+        # Stages commit as they go, so even a failed run may have changed the data.
+        bump_generation()
         with status_lock:
             pipeline_status_tracker["is_running"] = False
             pipeline_status_tracker["current_stage"] = "Idle"
@@ -66,10 +69,10 @@ def run_full_pipeline_endpoint():
         # Default to OpenAI if not provided, but allow user to override
         model_type = data.get('model_type', 'openai')
         model_name = data.get('model_name', 'gpt-4o')
+        analysis_options = parse_analysis_options(data)
 
         start_time_iso = datetime.now(timezone.utc).isoformat()
-        insert_response = supabase.table("pipeline_runs").insert({"start_time": start_time_iso, "status": "RUNNING"}).execute()
-        pipeline_id = insert_response.data[0]['id']
+        pipeline_id = create_pipeline_run(start_time_iso)
 
         pipeline_status_tracker.update({
             "is_running": True, "current_pipeline_id": pipeline_id, "current_stage": "Initializing", 
@@ -77,7 +80,7 @@ def run_full_pipeline_endpoint():
             "stop_event": threading.Event()
         })
 
-    thread = threading.Thread(target=_run_full_pipeline, args=(pipeline_id, scraper_names, pipeline_status_tracker["stop_event"], model_type, model_name))
+    thread = threading.Thread(target=_run_full_pipeline, args=(pipeline_id, scraper_names, pipeline_status_tracker["stop_event"], model_type, model_name, analysis_options))
     thread.start()
     return jsonify({"message": "Full pipeline process started in the background.", "pipeline_id": pipeline_id}), 202
 
@@ -85,8 +88,7 @@ def run_full_pipeline_endpoint():
 @pipeline_bp.route('/runs', methods=['GET'])
 def get_all_pipelines():
     try:
-        response = supabase.table("pipeline_runs").select("*").order("start_time", desc=True).execute()
-        return jsonify(response.data), 200
+        return jsonify(fetch_pipeline_runs()), 200
     except Exception as e:
         return jsonify({"error": "Failed to fetch pipeline runs", "details": str(e)}), 500
 
@@ -107,7 +109,9 @@ def get_specific_pipeline_status(pipeline_id):
 
     # If not running, fetch the final status from the database
     try:
-        response = supabase.table("pipeline_runs").select("*").eq("id", pipeline_id).single().execute()
-        return jsonify(response.data), 200
-    except Exception:
+        run = fetch_pipeline_run(pipeline_id)
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch pipeline run", "details": str(e)}), 500
+    if run is None:
         return jsonify({"error": "Pipeline run not found"}), 404
+    return jsonify(run), 200
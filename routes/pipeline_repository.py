@@ -0,0 +1,296 @@
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from database import get_db_connection
+
+# =======================================================================
+# PIPELINE DATA ACCESS
+# =======================================================================
+# The pipeline stages used to write through the Supabase REST client, one
+# HTTP round trip per statement with every 1536-float embedding encoded as
+# JSON text. These helpers write over the shared connection pool instead:
+# per-row statements are server-side prepared (the pooled connections are
+# long-lived, so each is planned once per connection; database.py turns this
+# off behind the transaction pooler), embeddings travel
+# as binary pgvector values, bulk loads go through COPY into a staging
+# table, and run counters are incremented in SQL rather than read and
+# written back, so concurrent workers never lose an update.
+
+RUN_COUNTERS = {
+    "new_links_found", "articles_scraped", "articles_embedded", "articles_analyzed",
+    "analysis_cost", "embedding_cost", "total_cost",
+}
+RUN_FIELDS = {"status", "end_time", "details", "scraper_stats", "analysis_stats"} | RUN_COUNTERS
+RUN_JSON_FIELDS = {"scraper_stats", "analysis_stats"}
+
+
+# --- pipeline_runs ---
+
+def create_pipeline_run(start_time: str, details: str = None) -> int:
+    """Inserts a RUNNING pipeline_runs row and returns its id."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO pipeline_runs (start_time, status, details) VALUES (%s, 'RUNNING', %s) RETURNING id;",
+            (start_time, details),
+        )
+        return cur.fetchone()[0]
+
+
+def update_pipeline_run(pipeline_id: int, **fields):
+    """Sets the given pipeline_runs columns; JSONB columns take dicts."""
+    unknown = set(fields) - RUN_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown pipeline_runs columns: {sorted(unknown)}")
+    if not fields:
+        return
+    columns = list(fields)
+    values = [Jsonb(fields[column]) if column in RUN_JSON_FIELDS else fields[column] for column in columns]
+    assignments = ", ".join(f"{column} = %s" for column in columns)
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"UPDATE pipeline_runs SET {assignments} WHERE id = %s;", values + [pipeline_id])
+
+
+def _run_as_json(row: dict) -> dict:
+    # Same shape the REST API returned: ISO timestamps and numeric costs as numbers.
+    return {
+        column: value.isoformat() if isinstance(value, datetime) else float(value) if isinstance(value, Decimal) else value
+        for column, value in row.items()
+    }
+
+
+def fetch_pipeline_runs() -> list:
+    """Every pipeline_runs row, newest first, ready for jsonify()."""
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute("SELECT * FROM pipeline_runs ORDER BY start_time DESC;")
+        return [_run_as_json(row) for row in cur.fetchall()]
+
+
+def fetch_pipeline_run(pipeline_id: int):
+    """One pipeline_runs row ready for jsonify(), or None."""
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute("SELECT * FROM pipeline_runs WHERE id = %s;", (pipeline_id,))
+        row = cur.fetchone()
+    return _run_as_json(row) if row else None
+
+
+def _increment_sql(deltas: dict):
+    unknown = set(deltas) - RUN_COUNTERS
+    if unknown:
+        raise ValueError(f"Unknown pipeline_runs counters: {sorted(unknown)}")
+    columns = sorted(deltas)
+    assignments = ", ".join(f"{column} = COALESCE({column}, 0) + %s" for column in columns)
+    return f"UPDATE pipeline_runs SET {assignments} WHERE id = %s;", [_sql_number(deltas[column]) for column in columns]
+
+
+def _sql_number(value):
+    # Floats go to NUMERIC columns as Decimal so no float8 rounding is added.
+    return Decimal(str(value)) if isinstance(value, float) else value
+
+
+def _increment(cur, pipeline_id, deltas: dict):
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if pipeline_id is None or not deltas:
+        return
+    query, params = _increment_sql(deltas)
+    cur.execute(query, params + [pipeline_id], prepare=True)
+
+
+def increment_run_counters(pipeline_id: int, **deltas):
+    """Atomically adds to pipeline_runs counters, e.g. articles_scraped=1."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        _increment(cur, pipeline_id, deltas)
+
+
+# --- article_links ---
+
+def insert_new_links(pipeline_id: int, links: list) -> int:
+    """
+    Bulk-loads (id, url, source) links with COPY and keeps those not already
+    stored as 'pending'. new_links_found is incremented in the same
+    transaction. Returns the number of links actually inserted.
+    """
+    if not links:
+        return 0
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE staging_links (id TEXT, url TEXT, source TEXT) ON COMMIT DROP;")
+        with cur.copy("COPY staging_links (id, url, source) FROM STDIN") as copy:
+            for link in links:
+                copy.write_row((link["id"], link["url"], link["source"]))
+        cur.execute(
+            """
+            INSERT INTO article_links (id, url, source, status)
+            SELECT DISTINCT ON (id) id, url, source, 'pending'
+            FROM staging_links
+            ON CONFLICT (id) DO NOTHING;
+            """
+        )
+        inserted = cur.rowcount
+        _increment(cur, pipeline_id, {"new_links_found": inserted})
+    return inserted
+
+
+def fetch_pending_links() -> list:
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute("SELECT id, url, source FROM article_links WHERE status = 'pending' ORDER BY scraped_date, id;")
+        return cur.fetchall()
+
+
+def set_link_status(link_id: str, status: str):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE article_links SET status = %s WHERE id = %s;", (status, link_id), prepare=True)
+
+
+# --- scraped_articles ---
+
+def save_scraped_article(pipeline_id: int, article: dict):
+    """Inserts a scraped article, marks its link done and counts it, in one transaction."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO scraped_articles (
+              link_id, source, url, title, author, publication_date, raw_text, cleaned_text,
+              embedding_status, analysis_status
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', 'pending');
+            """,
+            (
+                article["link_id"], article["source"], article["url"], article["title"], article["author"],
+                article["publication_date"], article["raw_text"], article["cleaned_text"],
+            ),
+            prepare=True,
+        )
+        cur.execute("UPDATE article_links SET status = 'success' WHERE id = %s;", (article["link_id"],), prepare=True)
+        _increment(cur, pipeline_id, {"articles_scraped": 1})
+
+
+def fetch_articles_pending_analysis() -> list:
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            "SELECT id, cleaned_text FROM scraped_articles "
+            "WHERE analysis_status = 'pending' AND cleaned_text IS NOT NULL ORDER BY id;"
+        )
+        return cur.fetchall()
+
+
+def fetch_articles_pending_embedding() -> list:
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            "SELECT id, source, publication_date, cleaned_text FROM scraped_articles "
+            "WHERE embedding_status = 'pending' AND cleaned_text IS NOT NULL ORDER BY id;"
+        )
+        return cur.fetchall()
+
+
+def set_analysis_status(article_ids: list, status: str):
+    if not article_ids:
+        return
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE scraped_articles SET analysis_status = %s WHERE id = ANY(%s::int[]);",
+            (status, list(article_ids)), prepare=True,
+        )
+
+
+def set_embedding_status(article_ids: list, status: str):
+    if not article_ids:
+        return
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE scraped_articles SET embedding_status = %s WHERE id = ANY(%s::int[]);",
+            (status, list(article_ids)), prepare=True,
+        )
+
+
+# --- article_embeddings ---
+
+def save_article_embeddings(pipeline_id: int, rows: list, model: str):
+    """
+    Stores (article, embedding, cost) rows in one transaction: a binary COPY
+    into a staging table, an upsert into article_embeddings, the articles'
+    embedding_status and the run's embedding counters.
+    """
+    if not rows:
+        return
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "CREATE TEMP TABLE staging_embeddings ON COMMIT DROP AS "
+            "SELECT article_id, source, publication_date, model, embedding, cost FROM article_embeddings WITH NO DATA;"
+        )
+        with cur.copy("COPY staging_embeddings (article_id, source, publication_date, model, embedding, cost) FROM STDIN WITH (FORMAT BINARY)") as copy:
+            copy.set_types(["int4", "varchar", "timestamptz", "varchar", "vector", "numeric"])
+            for article, embedding, cost in rows:
+                copy.write_row((
+                    article["id"], article.get("source"), article.get("publication_date"), model,
+                    np.asarray(embedding, dtype=np.float32), Decimal(str(cost)),
+                ))
+        cur.execute(
+            """
+            INSERT INTO article_embeddings (article_id, source, publication_date, model, embedding, cost)
+            SELECT article_id, source, publication_date, model, embedding, cost FROM staging_embeddings
+            ON CONFLICT (article_id) DO UPDATE
+              SET embedding = EXCLUDED.embedding, model = EXCLUDED.model, cost = EXCLUDED.cost;
+            """
+        )
+        cur.execute(
+            "UPDATE scraped_articles SET embedding_status = 'success' WHERE id = ANY(%s::int[]);",
+            ([article["id"] for article, _, _ in rows],),
+        )
+        batch_cost = sum(cost for _, _, cost in rows)
+        _increment(cur, pipeline_id, {"articles_embedded": len(rows), "embedding_cost": batch_cost, "total_cost": batch_cost})
+
+
+# --- article_analysis ---
+
+def persist_article_analysis(article_id: int, pipeline_id: int, analysis: dict, companies: list, cost: float, prefilter_skipped: bool = False):
+    """Calls the persist_article_analysis() function that stores an analysis atomically."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT persist_article_analysis(%s::int, %s::int, %s::jsonb, %s::jsonb, %s::numeric, %s::boolean);",
+            (
+                article_id, pipeline_id,
+                Jsonb(analysis) if analysis is not None else None,
+                Jsonb(companies or []),
+                _sql_number(float(cost or 0)), prefilter_skipped,
+            ),
+            prepare=True,
+        )
+        return cur.fetchone()[0]
+
+
+# --- prompt pruning A/B test ---
+
+PRUNING_AB_FIELDS = (
+    "article_id", "model_type", "model_name", "token_budget", "full_tokens", "pruned_tokens",
+    "mode_match", "company_jaccard", "country_jaccard", "commodity_jaccard",
+)
+
+
+def fetch_analysed_articles_sample(limit: int) -> list:
+    """The most recent successfully analysed articles with text, newest first."""
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            "SELECT id, cleaned_text FROM scraped_articles "
+            "WHERE analysis_status = 'success' AND cleaned_text IS NOT NULL ORDER BY id DESC LIMIT %s;",
+            (limit,),
+        )
+        return cur.fetchall()
+
+
+def insert_pruning_ab_result(result: dict):
+    """Stores one full-vs-pruned extraction comparison."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO prompt_pruning_ab ({', '.join(PRUNING_AB_FIELDS)}) "
+            f"VALUES ({', '.join(['%s'] * len(PRUNING_AB_FIELDS))});",
+            [result[field] for field in PRUNING_AB_FIELDS],
+        )
+
+
+def fetch_pruning_ab_results() -> list:
+    with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(f"SELECT {', '.join(PRUNING_AB_FIELDS)} FROM prompt_pruning_ab;")
+        return cur.fetchall()
@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from database import get_db_connection
+
+# =======================================================================
+# QUERY EMBEDDING CACHE
+# =======================================================================
+# Every dashboard search and chat question embeds its query text with the
+# OpenAI API before it touches the database, which adds a few hundred
+# milliseconds per keystroke-driven search. Query vectors are kept here in
+# a size-bounded LRU with a TTL, keyed by the normalised query, so a
+# repeated search only costs the database query. The cache is warmed at
+# startup with popular queries: the most-mentioned company names plus an
+# optional file of one query per line.
+
+QUERY_EMBEDDING_MODEL = "text-embedding-3-small"
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+QUERY_CACHE_WARM_FILE = os.getenv("QUERY_CACHE_WARM_FILE", "popular_queries.txt")
+QUERY_CACHE_WARM_COMPANIES = int(os.getenv("QUERY_CACHE_WARM_COMPANIES", "200"))
+WARM_BATCH_SIZE = 256
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Unicode form and whitespace differences map to the same key. Case is
+    kept: the key is the text that gets embedded, and stored company names
+    are embedded case-preserved.
+    """
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object and caches embed_query() results. Vectors
+    are stored as float32 arrays (6 KB for 1536 dimensions), so memory is
+    bounded by `max_entries`. embed_documents() is passed straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_EMBEDDING_CACHE_TTL_SECONDS):
+        self._embeddings = embeddings
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            vector, stored_at = entry
+            if time.monotonic() - stored_at > self._ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return vector
+
+    def _put(self, key, vector):
+        with self._lock:
+            self._entries[key] = (np.asarray(vector, dtype=np.float32), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def embed_query(self, text: str) -> list:
+        key = normalize_query(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self._embeddings.embed_query(key)
+            self._put(key, vector)
+        return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+
+    def embed_queries(self, texts: list) -> list:
+        """embed_query() for many texts: cache misses are embedded in batched requests."""
+        keys = [normalize_query(text) for text in texts]
+        vectors = {key: self._get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        for start in range(0, len(missing), WARM_BATCH_SIZE):
+            batch = missing[start:start + WARM_BATCH_SIZE]
+            for key, vector in zip(batch, self._embeddings.embed_documents(batch)):
+                self._put(key, vector)
+                vectors[key] = vector
+        return [vectors[key].tolist() if isinstance(vectors[key], np.ndarray) else list(vectors[key]) for key in keys]
+
+    def embed_documents(self, texts: list) -> list:
+        return self._embeddings.embed_documents(texts)
+
+    def warm(self, queries) -> int:
+        """Embeds the queries not cached yet, in batched requests. Returns how many were added."""
+        with self._lock:
+            missing = list(dict.fromkeys(
+                key for key in (normalize_query(query) for query in queries) if key and key not in self._entries
+            ))
+        # Never warm more than fits; the first queries are the most popular.
+        missing = missing[:self._max_entries]
+        for start in range(0, len(missing), WARM_BATCH_SIZE):
+            batch = missing[start:start + WARM_BATCH_SIZE]
+            for key, vector in zip(batch, self._embeddings.embed_documents(batch)):
+                self._put(key, vector)
+        return len(missing)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            }
+
+
+query_embeddings = CachedQueryEmbeddings(OpenAIEmbeddings(model=QUERY_EMBEDDING_MODEL))
+
+
+def popular_queries(limit: int = QUERY_CACHE_WARM_COMPANIES) -> list:
+    """Queries from QUERY_CACHE_WARM_FILE, then the most-mentioned company names."""
+    queries = []
+    if QUERY_CACHE_WARM_FILE and os.path.exists(QUERY_CACHE_WARM_FILE):
+        with open(QUERY_CACHE_WARM_FILE, encoding="utf-8") as f:
+            queries.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if limit > 0:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.real_name
+                FROM companies c
+                JOIN company_analysis ca ON ca.company_id = c.id
+                GROUP BY c.id, c.real_name
+                ORDER BY COUNT(*) DESC
+                LIMIT %s;
+                """,
+                (limit,),
+            )
+            queries.extend(row[0] for row in cur.fetchall())
+    return queries
+
+
+def _warm_query_cache():
+    try:
+        added = query_embeddings.warm(popular_queries())
+        print(f"Query embedding cache warmed with {added} queries.")
+    except Exception as e:
+        print(f"Warning: query embedding cache warm-up failed: {e}")
+
+
+def start_query_cache_warmup():
+    """Warms the cache in a background thread so startup is not held up."""
+    threading.Thread(target=_warm_query_cache, name="query-cache-warmup", daemon=True).start()
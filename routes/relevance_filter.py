@@ -0,0 +1,238 @@
+import os
+import re
+import math
+import zlib
+import threading
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+from database import get_db_connection
+
+# =======================================================================
+# LOCAL RELEVANCE PRE-CLASSIFIER
+# =======================================================================
+# A small TF-IDF + logistic regression model trained on our own analysis
+# history. Articles that the LLM analysed successfully but that produced no
+# article_analysis row were classified 'Ignore'; articles with a row were
+# relevant ('Tender' or 'Sentiment'). The model runs on the CPU in well under
+# a millisecond per article and lets the pipeline skip clearly irrelevant
+# articles before paying for an extraction call.
+
+# Articles whose relevance probability falls below this value are skipped.
+# A value of 0 disables the gate. Off by default until the numbers from
+# GET /api/analysis/relevance/evaluate have been reviewed; a run can opt in
+# with `relevance_threshold`.
+RELEVANCE_SKIP_THRESHOLD = float(os.getenv("RELEVANCE_SKIP_THRESHOLD", "0"))
+# The shared model is retrained once this many new labelled articles exist.
+RELEVANCE_RETRAIN_MIN_NEW_LABELS = int(os.getenv("RELEVANCE_RETRAIN_MIN_NEW_LABELS", "200"))
+MIN_SAMPLES_PER_CLASS = 30
+MAX_TRAINING_ARTICLES = 5000
+EVALUATION_THRESHOLDS = [0.05, 0.1, 0.2, 0.3, 0.5]
+
+_TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9\-]{2,}")
+_STOP_WORDS = {
+    "the", "and", "for", "that", "with", "this", "from", "are", "was", "were", "has", "have",
+    "had", "its", "said", "will", "which", "their", "they", "been", "also", "but", "not",
+    "more", "than", "into", "about", "over", "after", "who", "would", "can", "our", "all",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOP_WORDS]
+
+
+class RelevanceClassifier:
+    """
+    Binary TF-IDF logistic regression predicting whether an article is worth
+    sending to the extraction model (1 = Tender/Sentiment, 0 = Ignore).
+    """
+
+    def __init__(self, max_features: int = 2000, l2: float = 1e-3, epochs: int = 300, learning_rate: float = 2.0):
+        self.max_features = max_features
+        self.l2 = l2
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.vocabulary = {}
+        self.idf = None
+        self.weights = None
+        self.bias = 0.0
+        self.trained_on = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.weights is not None
+
+    def _vectorize(self, token_lists) -> np.ndarray:
+        matrix = np.zeros((len(token_lists), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(token_lists):
+            for token, count in Counter(tokens).items():
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    matrix[row, column] = 1.0 + math.log(count)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def fit(self, texts: List[str], labels: List[int]) -> "RelevanceClassifier":
+        token_lists = [_tokenize(text) for text in texts]
+        document_frequency = Counter()
+        for tokens in token_lists:
+            document_frequency.update(set(tokens))
+
+        candidates = [token for token, df in document_frequency.items() if df >= 3]
+        candidates.sort(key=lambda token: document_frequency[token], reverse=True)
+        self.vocabulary = {token: i for i, token in enumerate(candidates[:self.max_features])}
+
+        n_docs = len(token_lists)
+        self.idf = np.array(
+            [math.log((1 + n_docs) / (1 + document_frequency[token])) + 1 for token in self.vocabulary],
+            dtype=np.float32,
+        )
+
+        features = self._vectorize(token_lists)
+        targets = np.asarray(labels, dtype=np.float32)
+
+        # Class-balanced weights so that a skewed history does not push every
+        # article towards the majority class.
+        positives = max(targets.sum(), 1.0)
+        negatives = max(len(targets) - targets.sum(), 1.0)
+        sample_weights = np.where(targets == 1, len(targets) / (2 * positives), len(targets) / (2 * negatives)).astype(np.float32)
+
+        weights = np.zeros(features.shape[1], dtype=np.float32)
+        bias = 0.0
+        for _ in range(self.epochs):
+            predictions = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+            error = (predictions - targets) * sample_weights
+            weights -= self.learning_rate * (features.T @ error / len(targets) + self.l2 * weights)
+            bias -= self.learning_rate * float(error.mean())
+
+        self.weights = weights
+        self.bias = bias
+        self.trained_on = n_docs
+        return self
+
+    def score(self, text: str) -> float:
+        """Returns the probability that the article is relevant."""
+        features = self._vectorize([_tokenize(text)])[0]
+        return float(1.0 / (1.0 + math.exp(-(float(features @ self.weights) + self.bias))))
+
+
+def fetch_labelled_history(limit: int = MAX_TRAINING_ARTICLES):
+    """
+    Loads past LLM verdicts as (article_id, cleaned_text, label) tuples.
+    Articles skipped by this pre-classifier are excluded so the model never
+    trains on its own decisions.
+    """
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT sa.id, sa.cleaned_text, aa.id IS NOT NULL AS relevant
+            FROM scraped_articles sa
+            LEFT JOIN article_analysis aa ON aa.article_id = sa.id
+            WHERE sa.analysis_status = 'success'
+              AND NOT sa.prefilter_skipped
+              AND sa.cleaned_text IS NOT NULL
+            ORDER BY sa.id DESC
+            LIMIT %s;
+            """,
+            (limit,),
+        )
+        return [(row[0], row[1], int(row[2])) for row in cur.fetchall()]
+
+
+def count_labelled_history() -> int:
+    """Number of articles fetch_labelled_history() could train on, without loading their text."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT COUNT(*)
+            FROM scraped_articles sa
+            WHERE sa.analysis_status = 'success'
+              AND NOT sa.prefilter_skipped
+              AND sa.cleaned_text IS NOT NULL;
+            """
+        )
+        return cur.fetchone()[0]
+
+
+def _has_enough_samples(labels) -> bool:
+    positives = sum(labels)
+    return positives >= MIN_SAMPLES_PER_CLASS and len(labels) - positives >= MIN_SAMPLES_PER_CLASS
+
+
+_classifier: Optional[RelevanceClassifier] = None
+# Labelled history size at the last training attempt (None: never trained).
+_classifier_history_size: Optional[int] = None
+_classifier_lock = threading.Lock()
+
+
+def get_relevance_classifier(refresh: bool = False) -> Optional[RelevanceClassifier]:
+    """
+    Returns the shared classifier. It is trained from the analysis history on
+    first use and retrained only when at least RELEVANCE_RETRAIN_MIN_NEW_LABELS
+    new labelled articles have appeared since (or when refresh=True). Returns
+    None while there is not enough labelled history for both classes, in
+    which case the gate stays open.
+    """
+    global _classifier, _classifier_history_size
+    with _classifier_lock:
+        history_size = count_labelled_history()
+        if (
+            not refresh
+            and _classifier_history_size is not None
+            and history_size - _classifier_history_size < RELEVANCE_RETRAIN_MIN_NEW_LABELS
+        ):
+            return _classifier
+        history = fetch_labelled_history()
+        _classifier_history_size = history_size
+        labels = [label for _, _, label in history]
+        if not _has_enough_samples(labels):
+            print(f"Relevance pre-classifier disabled: need {MIN_SAMPLES_PER_CLASS} labelled articles per class.")
+            _classifier = None
+            return None
+        _classifier = RelevanceClassifier().fit([text for _, text, _ in history], labels)
+        print(f"Relevance pre-classifier trained on {_classifier.trained_on} articles.")
+        return _classifier
+
+
+def evaluate_relevance_classifier(threshold: float = RELEVANCE_SKIP_THRESHOLD, holdout_fraction: float = 0.2):
+    """
+    Trains on part of the labelled history and reports how well the gate would
+    have predicted the LLM's 'Ignore' verdicts on the held-out articles.
+    The split is deterministic per article id so repeated runs are comparable.
+    """
+    history = fetch_labelled_history()
+    buckets = int(holdout_fraction * 100)
+    train = [(text, label) for article_id, text, label in history if zlib.crc32(str(article_id).encode()) % 100 >= buckets]
+    test = [(text, label) for article_id, text, label in history if zlib.crc32(str(article_id).encode()) % 100 < buckets]
+
+    if not _has_enough_samples([label for _, label in train]) or not test:
+        return {"error": "Not enough labelled history to evaluate the relevance classifier.", "labelled_articles": len(history)}
+
+    classifier = RelevanceClassifier().fit([text for text, _ in train], [label for _, label in train])
+    scored = [(classifier.score(text), label) for text, label in test]
+
+    def metrics_at(cutoff):
+        # "Positive" here is a predicted skip, i.e. an article the gate calls Ignore.
+        true_skips = sum(1 for score, label in scored if score < cutoff and label == 0)
+        false_skips = sum(1 for score, label in scored if score < cutoff and label == 1)
+        ignored = sum(1 for _, label in scored if label == 0)
+        skipped = true_skips + false_skips
+        return {
+            "threshold": cutoff,
+            "ignore_precision": round(true_skips / skipped, 4) if skipped else None,
+            "ignore_recall": round(true_skips / ignored, 4) if ignored else None,
+            "skip_rate": round(skipped / len(scored), 4),
+            "relevant_articles_lost": false_skips,
+        }
+
+    return {
+        "train_size": len(train),
+        "test_size": len(test),
+        "test_ignore_count": sum(1 for _, label in test if label == 0),
+        "selected": metrics_at(threshold),
+        "curve": [metrics_at(cutoff) for cutoff in EVALUATION_THRESHOLDS],
+    }
@@ -0,0 +1,122 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+# =======================================================================
+# DASHBOARD RESPONSE CACHE
+# =======================================================================
+# The dashboard endpoints recompute whole-table aggregates on every page
+# load, yet the data behind them only changes when a pipeline stage
+# writes. Successful responses are kept in memory, keyed by endpoint and
+# query arguments and tagged with the data generation they
+# were computed at. A finished pipeline run or stage calls
+# bump_generation(), which drops every entry and recomputes the recently
+# requested ones in the background, so dashboard loads between runs are
+# served from memory. The generation is per process, like the pipeline
+# threads that bump it.
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+# How many of the most recently used keys are recomputed after a bump.
+RESPONSE_CACHE_WARM_KEYS = int(os.getenv("RESPONSE_CACHE_WARM_KEYS", "64"))
+
+_lock = threading.Lock()
+_generation = 0
+# (path, args) -> (generation, body, status, mimetype), least recently used first.
+_entries = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "warmed": 0}
+_app = None
+
+
+def _cache_key():
+    """
+    Request path plus the raw query arguments the view reads. Only the order
+    of different argument names is normalised; values are kept verbatim so
+    two requests share an entry only if the view sees the same input.
+    """
+    return request.path, tuple(sorted((key, tuple(values)) for key, values in request.args.lists()))
+
+
+def cached_response(view):
+    """Serves a GET view from the cache while the data generation is unchanged."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = _cache_key()
+        with _lock:
+            generation = _generation
+            entry = _entries.get(key)
+            if entry is not None and entry[0] == generation:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                body, status, mimetype = entry[1:]
+                return current_app.response_class(body, status=status, mimetype=mimetype)
+            _stats["misses"] += 1
+
+        response = view(*args, **kwargs)
+        flask_response = current_app.make_response(response)
+        if flask_response.status_code == 200:
+            with _lock:
+                # Skip the store if a pipeline run finished while this was computed.
+                if generation == _generation:
+                    _entries[key] = (generation, flask_response.get_data(), 200, flask_response.mimetype)
+                    _entries.move_to_end(key)
+                    while len(_entries) > RESPONSE_CACHE_SIZE:
+                        _entries.popitem(last=False)
+        return flask_response
+    return wrapper
+
+
+def _warm(keys):
+    warmed = 0
+    for path, args in keys:
+        query_string = [(key, value) for key, values in args for value in values]
+        try:
+            with _app.test_request_context(path, query_string=query_string):
+                view = _app.view_functions[request.url_rule.endpoint]
+                view(**request.view_args)
+            warmed += 1
+        except Exception as e:
+            print(f"Warning: could not warm cached response for {path}: {e}")
+    with _lock:
+        _stats["warmed"] += warmed
+    print(f"Response cache warmed with {warmed} responses.")
+
+
+def _start_warmup(keys):
+    if _app is not None and keys:
+        threading.Thread(target=_warm, args=(keys,), name="response-cache-warmup", daemon=True).start()
+
+
+def bump_generation():
+    """
+    Marks the cached responses stale after a pipeline write and recomputes
+    the most recently used ones in a background thread.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+        keys = list(_entries)[-RESPONSE_CACHE_WARM_KEYS:]
+        _entries.clear()
+        _stats["invalidations"] += 1
+    _start_warmup(list(reversed(keys)))
+
+
+def init_response_cache(app, warm_paths=()):
+    """Binds the cache to the app and warms `warm_paths` (with no query arguments) in the background."""
+    global _app
+    _app = app
+    _start_warmup([(path, ()) for path in warm_paths])
+
+
+def response_cache_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "generation": _generation,
+            "entries": len(_entries),
+            "max_entries": RESPONSE_CACHE_SIZE,
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else None,
+        }
@@ -1,7 +1,6 @@
 from flask import jsonify, Blueprint, request
 from scrapers import scraper_manager
 from utils.utils import hash_url
-from database import supabase
 from collections import defaultdict
 import threading
 from datetime import datetime, timezone
@@ -9,6 +8,11 @@ import json
 
 # --- Local Imports ---
 from .status import pipeline_status_tracker, status_lock
+from .response_cache import bump_generation
+from .pipeline_repository import (
+    create_pipeline_run, update_pipeline_run, increment_run_counters,
+    insert_new_links, fetch_pending_links, set_link_status, save_scraped_article,
+)
 
 # Blueprint is updated for better namespacing
 scraper_bp = Blueprint('scraper', __name__, url_prefix='/api/scraper')
@@ -49,24 +53,13 @@ def _do_link_scraping(pipeline_id, scraper_names, stop_event):
             if not urls:
                 continue
 
-            url_hashes = [hash_url(url) for url in urls]
-            response = supabase.table("article_links").select("id").in_("id", url_hashes).execute()
-            existing_hashes = {item['id'] for item in response.data}
-            
-            new_links_for_source = [{"id": hash_url(url), "url": url, "source": source_name, "status": "pending"} for url in urls if hash_url(url) not in existing_hashes]
-
-            print(f"Source: {source_name}, Found new links: {len(new_links_for_source)}")
-            
-            if new_links_for_source:
-                supabase.table("article_links").insert(new_links_for_source).execute()
-                num_found = len(new_links_for_source)
-                total_new_links_found += num_found
-                scraper_stats[source_name] += num_found
-                
-                # Increment the counter by reading and then writing the new value
-                run_res = supabase.table("pipeline_runs").select("new_links_found").eq("id", pipeline_id).single().execute()
-                current_count = run_res.data.get("new_links_found", 0) or 0
-                supabase.table("pipeline_runs").update({"new_links_found": current_count + num_found}).eq("id", pipeline_id).execute()
+            new_links_for_source = [{"id": hash_url(url), "url": url, "source": source_name} for url in urls]
+            # Links already stored are skipped by the insert itself.
+            num_found = insert_new_links(pipeline_id, new_links_for_source)
+
+            print(f"Source: {source_name}, Found new links: {num_found}")
+            total_new_links_found += num_found
+            scraper_stats[source_name] += num_found
 
         except Exception as e:
             print(f"Warning: Scraper for '{source_name}' failed and will be skipped. Error: {e}")
@@ -82,8 +75,7 @@ def _do_article_scraping(pipeline_id, stop_event):
     total_scraped = 0
     total_failed = 0
     
-    response = supabase.table("article_links").select("id, url, source").eq("status", "pending").execute()
-    links_to_scrape = response.data
+    links_to_scrape = fetch_pending_links()
     
     with status_lock:
         pipeline_status_tracker["total"] = len(links_to_scrape)
@@ -106,7 +98,7 @@ def _do_article_scraping(pipeline_id, stop_event):
 
         scraper_module = scraper_modules.get(link['source'])
         if not scraper_module:
-            supabase.table("article_links").update({"status": "failed"}).eq("id", link['id']).execute()
+            set_link_status(link['id'], "failed")
             total_failed += 1
             continue
         
@@ -116,7 +108,8 @@ def _do_article_scraping(pipeline_id, stop_event):
             # Make sure content_data is not None
             if not content_data:
                 print(f"Scraping failed for URL: {link['url']}")
-                supabase.table("article_links").update({"status": "failed"}).eq("id", link['id']).execute()
+                set_link_status(link['id'], "failed")
+                increment_run_counters(pipeline_id, articles_scraped=1)
             else:
                 # Clean up fields: replace "N/A" or None with NULL-friendly values
                 def clean_field(value):
@@ -133,23 +126,17 @@ def _do_article_scraping(pipeline_id, stop_event):
                     "publication_date": clean_field(content_data.get('publication_date')),
                     "raw_text": clean_field(content_data.get('raw_text')),
                     "cleaned_text": clean_field(content_data.get('cleaned_text')),
-                    "embedding_status": "pending",
-                    "analysis_status": "pending"
                 }
 
                 print("publication date:", cleaned_content['publication_date'])
 
-                supabase.table("scraped_articles").insert(cleaned_content).execute()
-                supabase.table("article_links").update({"status": "success"}).eq("id", link['id']).execute()        
+                save_scraped_article(pipeline_id, cleaned_content)
 
             total_scraped += 1
-            run_res = supabase.table("pipeline_runs").select("articles_scraped").eq("id", pipeline_id).single().execute()
-            current_count = run_res.data.get("articles_scraped", 0) or 0
-            supabase.table("pipeline_runs").update({"articles_scraped": current_count + 1}).eq("id", pipeline_id).execute()
 
         except Exception as e:
             print(f"Failed to scrape {link['url']}: {e}")
-            supabase.table("article_links").update({"status": "failed"}).eq("id", link['id']).execute()
+            set_link_status(link['id'], "failed")
             total_failed += 1
 
     return total_scraped, total_failed
@@ -168,8 +155,7 @@ def _run_single_stage(task_function, stage_name, task_args=None):
             return jsonify({"error": f"A process is already running: {pipeline_status_tracker['current_stage']}"}), 409
         
         start_time_iso = datetime.now(timezone.utc).isoformat()
-        insert_response = supabase.table("pipeline_runs").insert({"start_time": start_time_iso, "status": "RUNNING", "details": f"Running standalone stage: {stage_name}"}).execute()
-        pipeline_id = insert_response.data[0]['id']
+        pipeline_id = create_pipeline_run(start_time_iso, f"Running standalone stage: {stage_name}")
 
         pipeline_status_tracker.update({"is_running": True, "current_pipeline_id": pipeline_id, "current_stage": stage_name, "progress": 0, "total": 0, "details": {"message": "Initializing..."}, "stop_event": threading.Event()})
 
@@ -193,12 +179,14 @@ def _finalize_single_stage_run(pipeline_id, results, stage_name):
     if stage_name == "Finding Links":
         processed, stats_dict = results
         details = f"Standalone stage '{stage_name}' completed. Found: {processed} new links. Stats: {json.dumps(stats_dict)}"
-        supabase.table("pipeline_runs").update({"scraper_stats": json.dumps(stats_dict)}).eq("id", pipeline_id).execute()
+        update_pipeline_run(pipeline_id, scraper_stats=stats_dict)
     else:
         processed, failed = results
         details = f"Standalone stage '{stage_name}' completed. Scraped: {processed}, Failed: {failed}."
     
-    supabase.table("pipeline_runs").update({"status": "COMPLETED", "end_time": end_time_iso, "details": details}).eq("id", pipeline_id).execute()
+    update_pipeline_run(pipeline_id, status="COMPLETED", end_time=end_time_iso, details=details)
+    # The stage committed new rows: cached dashboard responses are stale.
+    bump_generation()
 
     with status_lock:
         pipeline_status_tracker["is_running"] = False
@@ -1,17 +1,18 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
 from CustomSupabaseVectorStore.CompanyNameVectorStore import CompanyNameVectorStore
 from CustomSupabaseVectorStore.ArticleVectorStore import ArticleVectorStore
 from CustomSupabaseVectorStore.TenderVectorStore import TenderVectorStore
 from database import DB_CONNECTION_STRING
+from .query_embeddings import query_embeddings
 
 load_dotenv()
 
 if not DB_CONNECTION_STRING:
     raise ValueError("SUPABASE_DB_URL not found in .env file.")
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# Repeated queries are answered from the in-process embedding cache.
+embeddings = query_embeddings
 
 company_vector_store = CompanyNameVectorStore(
     db_connection_string=DB_CONNECTION_STRING,
@@ -29,49 +30,33 @@ tender_vector_store = TenderVectorStore(
 )
 
 
-def search_similar_companies(query: str, similarity_threshold: float = 0.5, k: int = 4):
-    print(f"Searching for companies similar to '{query}' with a distance threshold of < {similarity_threshold}...\n")
+def search_article_records(query: str, k: int = 4, fields=None, filters=None, ef_search: int = None, hybrid: bool = False):
+    """
+    Nearest articles as dicts projected to `fields`, fetched in one query.
+    With `hybrid`, vector and full-text rankings are fused (RRF).
+    """
+    kwargs = {"filters": filters, "ef_search": ef_search, "hybrid": hybrid}
+    if fields:
+        kwargs["fields"] = fields
+    return article_vector_store.similarity_search_records(query, k, **kwargs)
 
-    # Perform the similarity search
-    similar_companies = company_vector_store.similarity_search(
-        query=query,
-        k=k  
-    )
 
-    #sort the result based on distance less to hight
-    similar_companies = sorted(similar_companies, key=lambda x: x.metadata.get('distance', float('inf')))
-    print("similar_companies : ", similar_companies)
-    company_ids = [doc.metadata.get('id', 'N/A') for doc in similar_companies]
-    print(f"Found {company_ids} similar companies.")
-    return company_ids
+def search_tender_records(query: str, k: int = 4, fields=None, filters=None, ef_search: int = None, hybrid: bool = False):
+    """Like search_article_records, restricted to Tender-mode articles."""
+    kwargs = {"filters": filters, "ef_search": ef_search, "hybrid": hybrid}
+    if fields:
+        kwargs["fields"] = fields
+    return tender_vector_store.similarity_search_records(query, k, **kwargs)
 
-def search_articles(query: str, similarity_threshold: float = 0.5, k: int = 4):
-    print(f"Searching for articles similar to '{query}' with a distance threshold of < {similarity_threshold}...\n")
 
-    # Perform the similarity search
-    similar_articles = article_vector_store.similarity_search(
-        query=query,
-        k=k  
-    )
-
-    #sort the result based on distance less to hight
-    similar_articles = sorted(similar_articles, key=lambda x: x.metadata.get('distance', float('inf')))
-    article_ids = [doc.metadata.get('id', 'N/A') for doc in similar_articles]
-    print(f"Found {article_ids} similar articles.")
-    return article_ids
-
-
-def search_tenders(query: str, similarity_threshold: float = 0.5, k: int = 4):
-    # Perform the similarity search
-    similar_articles = tender_vector_store.similarity_search(
-        query=query,
-        k=k  
-    )
-
-    similar_articles = sorted(similar_articles, key=lambda x: x.metadata.get('distance', float('inf')))
-    print("similar art : ",similar_articles)
-    tenders_ids = [doc.metadata.get('id', 'N/A') for doc in similar_articles]
-    print(f"Found {tenders_ids} similar tenders")
-    return tenders_ids
+def nearest_companies_sql(query: str, k: int = 4):
+    """(sql, params) for a subquery of the k companies nearest to `query`, as (id, rank)."""
+    return company_vector_store.nearest_companies_sql(embeddings.embed_query(query), k)
 
 
+def nearest_companies_batch_sql(queries: list, k: int = 4):
+    """
+    (sql, params) for a subquery of the k companies nearest to each query,
+    as (query_ord, id, rank, distance); all queries are embedded together.
+    """
+    return company_vector_store.nearest_companies_batch_sql(embeddings.embed_queries(queries), k)
@@ -1,10 +1,13 @@
 import os
-import psycopg2
+import psycopg
+from psycopg.rows import dict_row
 from flask import Blueprint, jsonify,request
-from database import DB_CONNECTION_STRING
-from psycopg2 import extras
+from database import DB_CONNECTION_STRING, get_db_connection
 import logging
-from .search import search_similar_companies,search_articles,search_tenders
+from .search import search_article_records, search_tender_records, nearest_companies_sql, nearest_companies_batch_sql
+from CustomSupabaseVectorStore.SearchFilters import SearchFilters
+from .query_embeddings import query_embeddings
+from .response_cache import cached_response, response_cache_stats
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from groq import Groq
@@ -70,9 +73,42 @@ def summarize_reasons_with_ai(reasons: list[str]) -> str:
 
 logging.basicConfig(level=logging.INFO)
 
+# Columns each search endpoint returns, fetched with the vector search itself.
+ARTICLE_SEARCH_FIELDS = ("id", "title", "author", "url", "description", "publication_date")
+TENDER_SEARCH_FIELDS = (
+    "url", "cleaned_text", "source", "analysis_mode", "countries", "commodities", "contract_value", "deadline",
+)
+DEFAULT_SEARCH_K = 4
+MAX_SEARCH_K = 100
+COMPANY_SEARCH_K = 4
+# Batch company search: names per request and the cap on matches per name.
+MAX_BATCH_COMPANY_QUERIES = 500
+MAX_BATCH_COMPANY_K = 10
+
+
+def _parse_search_k(args) -> int:
+    """The `k` request argument as an int in [1, MAX_SEARCH_K]; raises ValueError."""
+    k = int(args.get('k') or DEFAULT_SEARCH_K)
+    if k < 1:
+        raise ValueError("k must be a positive integer")
+    return min(k, MAX_SEARCH_K)
+
+
+def _has_nearest_companies(cur, nearest_sql, nearest_params) -> bool:
+    """Whether the nearest-companies subquery matched anything (checked only for empty results)."""
+    cur.execute("SELECT EXISTS (" + nearest_sql + ") AS found;", nearest_params)
+    return cur.fetchone()["found"]
+
+
+def _parse_hybrid(args) -> bool:
+    """Hybrid (vector + full-text) search is the default; `hybrid=false` opts out."""
+    return str(args.get('hybrid', 'true')).strip().lower() not in ('0', 'false', 'no', 'off')
+
+
 stats_bp = Blueprint('stats', __name__, url_prefix='/api/stats')
 
 @stats_bp.route('/insights', methods=['GET'])
+@cached_response
 def get_article_stats():
     """
     GET /api/stats/insights
@@ -82,10 +118,8 @@ def get_article_stats():
         logging.error("DATABASE_URL environment variable not set.")
         return jsonify({"error": "Database connection string is not configured."}), 500
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor() as cur:
+        with get_db_connection() as conn, conn.cursor() as cur:
             sql = """
                 WITH scraped_count AS (
                     SELECT COUNT(*) as total FROM scraped_articles
@@ -99,18 +133,19 @@ def get_article_stats():
                 company_count AS (
                     SELECT COUNT(*) as total FROM companies
                 ),
+                -- Distinct values and sentiment totals come from the trigger-maintained rollups.
                 country_count AS (
-                    SELECT COUNT(DISTINCT unnest) as total FROM article_analysis, unnest(countries)
+                    SELECT COUNT(*) as total FROM country_registry
                 ),
                 commodity_count AS (
-                    SELECT COUNT(DISTINCT unnest) as total FROM article_analysis, unnest(commodities)
+                    SELECT COUNT(*) as total FROM commodity_registry
                 ),
                 sentiment_counts AS (
                     SELECT
-                        COUNT(*) FILTER (WHERE sentiment = 'Positive') as positive,
-                        COUNT(*) FILTER (WHERE sentiment = 'Negative') as negative,
-                        COUNT(*) FILTER (WHERE sentiment = 'Neutral') as neutral
-                    FROM company_analysis
+                        SUM(positive)::bigint as positive,
+                        SUM(negative)::bigint as negative,
+                        SUM(neutral)::bigint as neutral
+                    FROM company_sentiment_rollup
                 )
                 SELECT
                     (SELECT total FROM scraped_count) as total_articles_scraped,
@@ -145,15 +180,12 @@ def get_article_stats():
 
         return jsonify(stats), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @stats_bp.route('/search/companies1', methods=['GET'])
 def search_companies():
@@ -174,11 +206,8 @@ def search_companies():
     if not company_name:
         return jsonify({"error": "The 'name' query parameter is required."}), 400
 
-    # Get matching company IDs using your vector store
-    company_ids = search_similar_companies(company_name)
-
-    if not company_ids:
-        return jsonify({"message": "No similar companies found."}), 200
+    # Nearest companies as a subquery of the hydration query below.
+    nearest_sql, nearest_params = nearest_companies_sql(company_name, COMPANY_SEARCH_K)
 
     filters = {
         'sentiment': request.args.get('sentiment'),
@@ -186,12 +215,8 @@ def search_companies():
         'mode': request.args.get('mode')
     }
 
-    print(company_ids)
-
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             sql = """
                 SELECT
                     c.real_name AS company_name,
@@ -208,9 +233,9 @@ def search_companies():
                 JOIN companies c ON ca.company_id = c.id
                 JOIN article_analysis aa ON ca.article_analysis_id = aa.id
                 JOIN scraped_articles sa ON aa.article_id = sa.id
-                WHERE ca.company_id = ANY (%(company_ids)s)
+                WHERE ca.company_id IN (SELECT id FROM (""" + nearest_sql + """) nearest)
             """
-            params = {'company_ids': company_ids}
+            params = dict(nearest_params)
 
             for key, value in filters.items():
                 if value:
@@ -225,18 +250,122 @@ def search_companies():
 
             cur.execute(sql, params)
             results = cur.fetchall()
+            # As before: no similar company at all is reported as a message,
+            # while similar companies without matching mentions give [].
+            if not results and not _has_nearest_companies(cur, nearest_sql, nearest_params):
+                return jsonify({"message": "No similar companies found."}), 200
 
         return jsonify(results), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error during company search: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred during company search: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+
+@stats_bp.route('/search/companies/batch', methods=['POST'])
+def search_companies_batch():
+    """
+    POST /api/stats/search/companies/batch
+    {
+        "names": ["Acme Mining", "Globex", ...],   (required, up to 500)
+        "k": 4,                                     (matches per name, up to 10)
+        "max_distance": 0.5,                        (optional cosine distance cutoff)
+        "sentiment": "Negative",                    (optional filters, as in /search/companies)
+        "risk_type": "...",
+        "mode": "Tender"
+    }
+    Screens a list of suppliers in one request: every name is embedded in
+    one batched call, the nearest companies for all names are found in the
+    same query, and their mentions are aggregated once per matched company.
+    Returns one entry per name, in input order, with its matched companies
+    and their sentiment counts.
+    """
+    if not DB_CONNECTION_STRING:
+        logging.error("DATABASE_URL environment variable not set.")
+        return jsonify({"error": "Database connection string is not configured."}), 500
+
+    data = request.json or {}
+    names = data.get('names')
+    if not isinstance(names, list) or not names or not all(isinstance(name, str) and name.strip() for name in names):
+        return jsonify({"error": "'names' must be a non-empty list of strings."}), 400
+    if len(names) > MAX_BATCH_COMPANY_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_COMPANY_QUERIES} names per request."}), 400
+    try:
+        k = min(int(data.get('k') or COMPANY_SEARCH_K), MAX_BATCH_COMPANY_K)
+        max_distance = float(data['max_distance']) if data.get('max_distance') is not None else None
+        if k < 1:
+            raise ValueError("k must be a positive integer")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    nearest_sql, params = nearest_companies_batch_sql(names, k)
+    params = dict(params)
+    mention_filters = ""
+    for key, table_alias in (('sentiment', 'ca'), ('risk_type', 'ca'), ('mode', 'aa')):
+        if data.get(key):
+            mention_filters += f" AND {table_alias}.{key} = %({key})s"
+            params[key] = data[key]
+    distance_filter = ""
+    if max_distance is not None:
+        distance_filter = "WHERE n.distance < %(max_distance)s"
+        params['max_distance'] = max_distance
+
+    try:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                """
+                WITH nearest AS MATERIALIZED (""" + nearest_sql + """),
+                mentions AS (
+                    -- Each matched company is aggregated once, however many names matched it.
+                    SELECT
+                        ca.company_id,
+                        COUNT(*) AS mentions,
+                        COUNT(*) FILTER (WHERE ca.sentiment = 'Positive') AS positive,
+                        COUNT(*) FILTER (WHERE ca.sentiment = 'Negative') AS negative,
+                        COUNT(*) FILTER (WHERE ca.sentiment = 'Neutral') AS neutral,
+                        MAX(sa.publication_date) AS last_mentioned
+                    FROM company_analysis ca
+                    JOIN article_analysis aa ON ca.article_analysis_id = aa.id
+                    JOIN scraped_articles sa ON aa.article_id = sa.id
+                    WHERE ca.company_id IN (SELECT DISTINCT id FROM nearest)""" + mention_filters + """
+                    GROUP BY ca.company_id
+                )
+                SELECT
+                    n.query_ord,
+                    c.id AS company_id,
+                    c.real_name AS company_name,
+                    n.distance,
+                    COALESCE(m.mentions, 0) AS mentions,
+                    COALESCE(m.positive, 0) AS positive,
+                    COALESCE(m.negative, 0) AS negative,
+                    COALESCE(m.neutral, 0) AS neutral,
+                    m.last_mentioned
+                FROM nearest n
+                JOIN companies c ON c.id = n.id
+                LEFT JOIN mentions m ON m.company_id = n.id
+                """ + distance_filter + """
+                ORDER BY n.query_ord, n.rank;
+                """,
+                params,
+            )
+            rows = cur.fetchall()
+
+        results = [{"query": name, "matches": []} for name in names]
+        for row in rows:
+            query_ord = row.pop('query_ord')
+            if row['last_mentioned']:
+                row['last_mentioned'] = row['last_mentioned'].isoformat()
+            results[query_ord - 1]["matches"].append(row)
+        return jsonify(results), 200
+
+    except psycopg.Error as e:
+        logging.error(f"Database error during batch company search: {e}")
+        return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
+    except Exception as e:
+        logging.error(f"An unexpected error occurred during batch company search: {e}")
+        return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
 
 @stats_bp.route('/search/commo', methods=['GET'])
 def get_commo():
@@ -249,8 +378,7 @@ def get_commo():
         return jsonify({"error": "Missing required parameter: company_id"}), 400
 
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             sql = """
                 SELECT 
                     aa.commodities,
@@ -276,49 +404,30 @@ def get_commo():
         logging.error(f"Error fetching data: {e}")
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if conn:
-            conn.close()
 
 
 @stats_bp.route('/search/tender', methods=['GET'])
 def search_tender():
     """
-    GET /api/stats/search/tender
+    GET /api/stats/search/tender?query=...&k=...
+    Optional filters: source, country, commodity (comma separated), date_from, date_to.
+    hybrid=false ranks by embedding distance only.
     """
     if not DB_CONNECTION_STRING:
         logging.error("DATABASE_URL environment variable not set.")
         return jsonify({"error": "Database connection string is not configured."}), 500
 
     query = request.args.get('query')
-    k = request.args.get('k')
     if not query:
         return jsonify({"error": "The 'query' parameter is required."}), 400
+    try:
+        k = _parse_search_k(request.args)
+        filters = SearchFilters.from_args(request.args, mode="Tender")
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
 
-    article_id = search_tenders(query=query, k=k)  # your search logic
-
-    conn = psycopg2.connect(DB_CONNECTION_STRING)
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
-        sql = """
-            SELECT 
-            sa.url,
-            sa.cleaned_text,
-            sa.source,
-            aa.mode AS analysis_mode,
-            aa.countries,
-            aa.commodities,
-            aa.contract_value,
-            aa.deadline
-            FROM 
-            scraped_articles sa
-            LEFT JOIN 
-            article_analysis aa ON sa.id = aa.article_id
-            WHERE 
-            sa.id = ANY(%s)
-        """
-        cur.execute(sql, (article_id,))
-        result = cur.fetchall()
-    conn.close()
+    # One query: nearest Tender-mode articles joined with their analysis.
+    result = search_tender_records(query, k, fields=TENDER_SEARCH_FIELDS, filters=filters, hybrid=_parse_hybrid(request.args))
     return jsonify(result)
 
 
@@ -330,6 +439,7 @@ def search_companies1():
     """
     GET /api/stats/search/companies1
     Returns grouped company insights with additional commodity, country, contract value, and risk stats.
+    Each mention counts once; urls are the 20 most recently analysed articles.
     """
     if not DB_CONNECTION_STRING:
         logging.error("DATABASE_URL environment variable not set.")
@@ -339,10 +449,8 @@ def search_companies1():
     if not company_name:
         return jsonify({"error": "The 'name' query parameter is required."}), 400
 
-    company_ids = search_similar_companies(company_name)
-
-    if not company_ids:
-        return jsonify({"message": "No similar companies found."}), 200
+    # Nearest companies as a subquery of the profile lookup below.
+    nearest_sql, nearest_params = nearest_companies_sql(company_name, COMPANY_SEARCH_K)
 
     filters = {
         'sentiment': request.args.get('sentiment'),
@@ -350,98 +458,53 @@ def search_companies1():
         'mode': request.args.get('mode')
     }
 
-    conn = None
+    # Unfiltered searches read the trigger-maintained company_profiles rows;
+    # filtered ones aggregate just the matching mentions of the nearest companies.
+    params = dict(nearest_params)
+    if any(filters.values()):
+        profiles_sql = """
+            aggregate_company_profiles(
+                (SELECT array_agg(id) FROM nearest)::int[],
+                %(sentiment)s::sentiment_type, %(risk_type)s::risk_classification, %(mode)s::analysis_mode
+            )
+        """
+        params.update({key: value or None for key, value in filters.items()})
+    else:
+        profiles_sql = "company_profiles"
+
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             sql = """
-                WITH base_data AS (
-                    SELECT
-                        c.id AS company_id,
-                        c.real_name AS company_name,
-                        ca.sentiment,
-                        ca.reason_for_sentiment,
-                        sa.url,
-                        unnest(aa.commodities) AS commodity,
-                        unnest(aa.countries) AS country,
-                        aa.contract_value,
-                        ca.risk_type
-                    FROM company_analysis ca
-                    JOIN companies c ON ca.company_id = c.id
-                    JOIN article_analysis aa ON ca.article_analysis_id = aa.id
-                    JOIN scraped_articles sa ON aa.article_id = sa.id
-                    WHERE ca.company_id = ANY (%(company_ids)s)
-            """
-
-            params = {'company_ids': company_ids}
-
-            where_clauses = []
-
-            for key, value in filters.items():
-                if value:
-                    if key in ['sentiment', 'risk_type']:
-                        table_alias = 'ca'
-                    else:
-                        table_alias = 'aa'
-                    where_clauses.append(f"{table_alias}.{key} = %({key})s")
-                    params[key] = value
-
-            if where_clauses:
-                sql += " AND " + " AND ".join(where_clauses)
-
-            sql += """
-                )
+                WITH nearest AS (""" + nearest_sql + """)
                 SELECT
-                    company_id,
-                    company_name,
-                    COUNT(*) AS total_occurrences,
-                    COUNT(*) FILTER (WHERE sentiment = 'Positive') AS positive_count,
-                    COUNT(*) FILTER (WHERE sentiment = 'Negative') AS negative_count,
-                    COUNT(*) FILTER (WHERE sentiment = 'Neutral') AS neutral_count,
-                    ARRAY_AGG(DISTINCT url) AS all_article_urls,
-                    ARRAY_AGG(reason_for_sentiment) AS all_reasons,
-                    
-                    COUNT(DISTINCT commodity) AS total_unique_commodities,
-                    ARRAY_AGG(commodity) AS all_commodities,
-                    
-                    COUNT(DISTINCT country) AS total_unique_countries,
-                    ARRAY_AGG(country) AS all_countries,
-                    
-                    COUNT(DISTINCT contract_value) AS total_unique_contract_values,
-                    
-                    JSONB_OBJECT_AGG(risk_type, ct) FILTER (WHERE risk_type IS NOT NULL) AS risk_type_counts
-                FROM (
-                    SELECT
-                        *,
-                        COUNT(*) OVER (PARTITION BY risk_type) AS ct
-                    FROM base_data
-                ) sub
-                GROUP BY company_id, company_name
-                ORDER BY array_position(%(company_ids)s, company_id);
+                    p.company_id,
+                    c.real_name AS company_name,
+                    p.positive_count,
+                    p.negative_count,
+                    p.neutral_count,
+                    p.recent_urls,
+                    p.latest_reason,
+                    (SELECT COUNT(*) FROM jsonb_object_keys(p.commodity_counts)) AS total_unique_commodities,
+                    jsonb_top_counts(p.commodity_counts, 3) AS top_commodities,
+                    (SELECT COUNT(*) FROM jsonb_object_keys(p.country_counts)) AS total_unique_countries,
+                    jsonb_top_counts(p.country_counts, 3) AS top_countries,
+                    (SELECT COUNT(*) FROM jsonb_object_keys(p.contract_value_counts)) AS total_unique_contract_values,
+                    p.risk_type_counts
+                FROM nearest
+                JOIN """ + profiles_sql + """ p ON p.company_id = nearest.id
+                JOIN companies c ON c.id = p.company_id
+                ORDER BY nearest.rank;
             """
 
             cur.execute(sql, params)
             rows = cur.fetchall()
+            if not rows and not _has_nearest_companies(cur, nearest_sql, nearest_params):
+                return jsonify({"message": "No similar companies found."}), 200
 
         results = []
         for row in rows:
             # summarized_reason = summarize_reasons_with_ai(row["all_reasons"] or [])
-            if row["all_reasons"]:
-                summarized_reason = row["all_reasons"][0]+"....read more"
-
-            # Get top 3 commodities
-            commodities = [c for c in row["all_commodities"] if c]
-            commodities_count = {}
-            for c in commodities:
-                commodities_count[c] = commodities_count.get(c, 0) + 1
-            top_commodities = sorted(commodities_count.items(), key=lambda x: x[1], reverse=True)[:3]
-
-            # Get top 3 countries
-            countries = [c for c in row["all_countries"] if c]
-            countries_count = {}
-            for c in countries:
-                countries_count[c] = countries_count.get(c, 0) + 1
-            top_countries = sorted(countries_count.items(), key=lambda x: x[1], reverse=True)[:3]
+            summarized_reason = row["latest_reason"] + "....read more" if row["latest_reason"] else None
 
             results.append({
                 "company_id": row["company_id"],
@@ -451,15 +514,15 @@ def search_companies1():
                     "negative": row["negative_count"] or 0,
                     "neutral": row["neutral_count"] or 0
                 },
-                "urls": row["all_article_urls"] or [],
+                "urls": row["recent_urls"] or [],
                 "reason": summarized_reason,
                 "commodities": {
                     "total_unique": row["total_unique_commodities"],
-                    "top_3": [{"name": k, "count": v} for k, v in top_commodities]
+                    "top_3": row["top_commodities"]
                 },
                 "countries": {
                     "total_unique": row["total_unique_countries"],
-                    "top_3": [{"name": k, "count": v} for k, v in top_countries]
+                    "top_3": row["top_countries"]
                 },
                 "contract_values": {
                     "total_unique": row["total_unique_contract_values"]
@@ -469,19 +532,17 @@ def search_companies1():
 
         return jsonify(results), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error during grouped company search: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred during grouped company search: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 
 @stats_bp.route('/company-sentiment-summary', methods=['GET'])
+@cached_response
 def get_company_sentiment_summary():
     """
     GET /api/stats/company-sentiment-summary
@@ -510,21 +571,19 @@ def get_company_sentiment_summary():
     }
     order_by_column = allowed_ordering.get(order_by_param, 'total_sentiments')
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            # company_sentiment_rollup holds per-company counts by mode and risk type.
             sql = """
                 SELECT
                     c.id as company_id,
                     c.real_name AS company_name,
-                    COUNT(ca.sentiment) FILTER (WHERE ca.sentiment = 'Positive') AS positive,
-                    COUNT(ca.sentiment) FILTER (WHERE ca.sentiment = 'Negative') AS negative,
-                    COUNT(ca.sentiment) FILTER (WHERE ca.sentiment = 'Neutral') AS neutral,
-                    COUNT(ca.sentiment) AS total_sentiments
-                FROM company_analysis ca
-                JOIN companies c ON ca.company_id = c.id
-                JOIN article_analysis aa ON ca.article_analysis_id = aa.id
+                    SUM(r.positive)::bigint AS positive,
+                    SUM(r.negative)::bigint AS negative,
+                    SUM(r.neutral)::bigint AS neutral,
+                    SUM(r.positive + r.negative + r.neutral)::bigint AS total_sentiments
+                FROM company_sentiment_rollup r
+                JOIN companies c ON r.company_id = c.id
             """
 
             where_clauses = []
@@ -535,11 +594,11 @@ def get_company_sentiment_summary():
                 params['company_name'] = f"%{filters['name']}%"
 
             if filters['risk_type']:
-                where_clauses.append("ca.risk_type = %(risk_type)s")
+                where_clauses.append("r.risk_type = %(risk_type)s")
                 params['risk_type'] = filters['risk_type']
 
             if filters['mode']:
-                where_clauses.append("aa.mode = %(mode)s")
+                where_clauses.append("r.mode = %(mode)s")
                 params['mode'] = filters['mode']
 
             if where_clauses:
@@ -556,17 +615,15 @@ def get_company_sentiment_summary():
 
         return jsonify(results), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error during company sentiment summary: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred during company sentiment summary: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @stats_bp.route('/tenders', methods=['GET'])
+@cached_response
 def get_latest_tenders():
     """
     GET /api/stats/tenders
@@ -583,10 +640,8 @@ def get_latest_tenders():
     except ValueError:
         return jsonify({"error": "Invalid 'limit' parameter. Must be an integer."}), 400
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             # This query joins article_analysis with scraped_articles to get tender details
             sql = """
                 SELECT
@@ -609,15 +664,12 @@ def get_latest_tenders():
 
         return jsonify(results), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error while fetching tenders: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred while fetching tenders: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 @stats_bp.route('/companies/shuffled', methods=['GET'])
@@ -630,10 +682,8 @@ def get_shuffled_companies():
         logging.error("DATABASE_URL environment variable not set.")
         return jsonify({"error": "Database connection string is not configured."}), 500
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             # Correct: Use subquery to select DISTINCT, then ORDER BY RANDOM()
             sql = """
                 SELECT DISTINCT ON (company_name) *
@@ -652,15 +702,12 @@ def get_shuffled_companies():
 
         return jsonify(results), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error while fetching shuffled companies: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"An unexpected error occurred while fetching shuffled companies: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 
@@ -685,10 +732,8 @@ def get_company_sentiments():
     if not company_id:
         return jsonify({"error": "The 'company_id' query parameter is required."}), 400
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             sql = """
                 SELECT
                     c.real_name,
@@ -736,15 +781,12 @@ def get_company_sentiments():
 
         return jsonify(result), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error while fetching company sentiments: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"Unexpected error while fetching company sentiments: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @stats_bp.route('/company/article-count', methods=['GET'])
 def get_company_article_count():
@@ -760,10 +802,8 @@ def get_company_article_count():
     if not company_id:
         return jsonify({"error": "The 'company_id' query parameter is required."}), 400
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
             sql = """
                 SELECT
                     c.real_name,
@@ -794,17 +834,15 @@ def get_company_article_count():
 
         return jsonify(result), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error while fetching company article count: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"Unexpected error while fetching company article count: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @stats_bp.route('/risk-factors/counts', methods=['GET'])
+@cached_response
 def get_risk_factors_counts_all_dates():
     """
     GET /api/stats/risk-factors/counts?company_id=123
@@ -816,30 +854,26 @@ def get_risk_factors_counts_all_dates():
 
     company_id = request.args.get('company_id')
 
-    conn = None
     try:
-        conn = psycopg2.connect(DB_CONNECTION_STRING)
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            # risk_daily_counts is maintained by trigger as company analyses are written.
             sql = """
                 SELECT
-                    DATE(sa.scraped_at) AS date,
-                    ca.risk_type,
-                    COUNT(*) AS count
-                FROM company_analysis ca
-                JOIN article_analysis aa ON ca.article_analysis_id = aa.id
-                JOIN scraped_articles sa ON aa.article_id = sa.id
-                WHERE ca.risk_type IS NOT NULL
+                    r.day AS date,
+                    r.risk_type,
+                    SUM(r.count)::bigint AS count
+                FROM risk_daily_counts r
             """
 
             params = {}
 
             if company_id:
-                sql += " AND ca.company_id = %(company_id)s"
+                sql += " WHERE r.company_id = %(company_id)s"
                 params['company_id'] = company_id
 
             sql += """
-                GROUP BY date, ca.risk_type
-                ORDER BY date DESC, ca.risk_type;
+                GROUP BY r.day, r.risk_type
+                ORDER BY r.day DESC, r.risk_type;
             """
 
             cur.execute(sql, params)
@@ -858,20 +892,19 @@ def get_risk_factors_counts_all_dates():
             "risk_counts_by_date": date_risk_counts
         }), 200
 
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logging.error(f"Database error while fetching risk factor counts: {e}")
         return jsonify({"error": "A database error occurred.", "details": str(e)}), 500
     except Exception as e:
         logging.error(f"Unexpected error while fetching risk factor counts: {e}")
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @stats_bp.route('/search/articles', methods=['GET'])
 def search_news_articles():
     """
     Searches for articles similar to the given query using the ArticleVectorStore.
+    Optional filters: source, country, commodity (comma separated), date_from, date_to, mode.
+    Exact-token matches are fused in by full-text search; hybrid=false disables that.
     Returns article details: id, title, author, url, description, publication_date.
     """
     if not DB_CONNECTION_STRING:
@@ -879,35 +912,16 @@ def search_news_articles():
         return jsonify({"error": "Database connection string is not configured."}), 500
 
     query = request.args.get('query')
-    k = int(request.args.get('k', 4))
-
-    # Vector search — returns list of IDs
-    article_ids = search_articles(query, k)
-
-    if not article_ids:
-        return jsonify([])
-
-    # Connect to DB
-    conn = psycopg2.connect(DB_CONNECTION_STRING)
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
-        sql = """
-            SELECT 
-                id,
-                title,
-                author,
-                url,
-                cleaned_text AS description,
-                publication_date
-            FROM 
-                scraped_articles
-            WHERE 
-                id = ANY(%s)
-        """
-        cur.execute(sql, (article_ids,))
-        rows = cur.fetchall()
+    if not query:
+        return jsonify({"error": "The 'query' parameter is required."}), 400
+    try:
+        k = _parse_search_k(request.args)
+        filters = SearchFilters.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
 
-    # Close the connection
-    conn.close()
+    # One query: nearest articles, already projected to the response columns.
+    rows = search_article_records(query, k, fields=ARTICLE_SEARCH_FIELDS, filters=filters, hybrid=_parse_hybrid(request.args))
 
     # Format the dates as ISO strings
     for row in rows:
@@ -917,6 +931,23 @@ def search_news_articles():
     return jsonify(rows)
 
 
+@stats_bp.route('/search/embedding-cache', methods=['GET'])
+def get_query_embedding_cache_stats():
+    """
+    GET /api/stats/search/embedding-cache
+    Hit/miss counters and size of the in-process query embedding cache.
+    """
+    return jsonify(query_embeddings.stats()), 200
+
+
+@stats_bp.route('/response-cache', methods=['GET'])
+def get_response_cache_stats():
+    """
+    GET /api/stats/response-cache
+    Hit rate, entry count and data generation of the dashboard response cache.
+    """
+    return jsonify(response_cache_stats()), 200
+
 @stats_bp.route('/summarize/article', methods=['POST'])
 def summarize_article():
     """
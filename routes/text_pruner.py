@@ -0,0 +1,143 @@
+import os
+import re
+
+from .cost_calculator import num_tokens_from_string
+
+# =======================================================================
+# RELEVANCE-PRUNED EXTRACTION INPUT
+# =======================================================================
+# Scraped articles carry a lot of paragraphs that never influence the
+# extraction result (bylines, related-story teasers, generic background).
+# Before the text goes into the extraction prompt we keep only the paragraphs
+# that mention organisations, money, dates, countries or procurement
+# vocabulary, highest-signal first, until the token budget is spent. The
+# surviving paragraphs are emitted in their original order.
+
+# Maximum number of article tokens sent to the extraction model. 0 disables
+# pruning. Off by default until the A/B comparison (POST
+# /api/analysis/pruning/ab-test) shows the pruned extraction agrees with the full
+# one; a run can opt in with `max_input_tokens`.
+EXTRACTION_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", "0"))
+# Budget the A/B comparison prunes to when the request does not name one.
+PRUNING_AB_TOKEN_BUDGET = int(os.getenv("PRUNING_AB_TOKEN_BUDGET", "1500"))
+
+_ORGANISATION_PATTERN = re.compile(
+    r"\b(?:[A-Z][\w&'-]+\s+){0,4}(?:Company|Co\.|Corp\.?|Corporation|LLC|PJSC|PSC|QPSC|SAOG|Ltd\.?|Limited|"
+    r"Inc\.?|PLC|Group|Holding|Holdings|Bank|Authority|Ministry|Fund|Investments?|Partners|Aramco|ADNOC)\b"
+)
+_PROPER_NOUN_RUN_PATTERN = re.compile(r"\b[A-Z][a-zA-Z&-]+(?:\s+[A-Z][a-zA-Z&-]+)+\b")
+_MONEY_PATTERN = re.compile(
+    r"(?:[$€£]\s?\d|\b(?:USD|AED|SAR|QAR|EGP|KWD|OMR|BHD|JOD|MAD|EUR|GBP|Dh|Dhs|SR)\s?\d|"
+    r"\b\d[\d,.]*\s?(?:million|billion|mn|bn|m\b|trillion)|\b(?:dirhams?|riyals?|dinars?|pounds)\b)",
+    re.IGNORECASE,
+)
+_DATE_PATTERN = re.compile(
+    r"\b(?:January|February|March|April|May|June|July|August|September|October|November|December|"
+    r"Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)\b|\b(?:19|20)\d{2}\b|\bQ[1-4]\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b"
+)
+_COUNTRY_PATTERN = re.compile(
+    r"\b(?:UAE|United Arab Emirates|Saudi(?: Arabia)?|KSA|Qatar|Kuwait|Oman|Bahrain|Egypt|Jordan|Morocco|"
+    r"Algeria|Tunisia|Libya|Iraq|Iran|Lebanon|Syria|Yemen|Israel|Palestine|Turkey|GCC|MENA|Dubai|Abu Dhabi|"
+    r"Sharjah|Riyadh|Jeddah|Doha|Muscat|Manama|Cairo|Amman|Casablanca|China|India|Pakistan|Japan|Korea|"
+    r"United States|US|USA|UK|United Kingdom|Europe|EU|Germany|France|Italy|Spain|Russia|Africa)\b"
+)
+_PROCUREMENT_PATTERN = re.compile(
+    r"\b(?:tenders?|contracts?|bids?|bidding|awarded|award|RFP|RFQ|procurement|suppl(?:y|ier|iers)|"
+    r"vendors?|deal|agreement|MoU|partnership|acquisition|acquire[sd]?|merger|joint venture|project|"
+    r"construction|EPC|concession|investment|invest(?:s|ed)?|deadline|sanctions?|tariffs?|exports?|imports?|"
+    r"earnings|profit|revenue|losses?|shares|stake|IPO|bankruptcy|lawsuit|fine[sd]?|investigation)\b",
+    re.IGNORECASE,
+)
+
+# (pattern, weight): procurement vocabulary and money are the strongest signals.
+_SIGNALS = [
+    (_PROCUREMENT_PATTERN, 3.0),
+    (_MONEY_PATTERN, 3.0),
+    (_ORGANISATION_PATTERN, 2.0),
+    (_COUNTRY_PATTERN, 1.5),
+    (_DATE_PATTERN, 1.0),
+    (_PROPER_NOUN_RUN_PATTERN, 0.5),
+]
+
+
+def score_paragraph(paragraph: str) -> float:
+    """Sums the weighted, capped signal matches found in a paragraph."""
+    return sum(weight * min(len(pattern.findall(paragraph)), 3) for pattern, weight in _SIGNALS)
+
+
+def _truncate_to_budget(text: str, budget: int, model_name: str) -> str:
+    words = text.split()
+    # Shrink by word count until the text fits; tokens are ~0.75 words so start there.
+    limit = int(budget * 0.75)
+    while limit > 0:
+        candidate = " ".join(words[:limit])
+        if num_tokens_from_string(candidate, model_name) <= budget:
+            return candidate
+        limit = int(limit * 0.9)
+    return ""
+
+
+def prune_article_text(text: str, token_budget: int = EXTRACTION_TOKEN_BUDGET, model_name: str = "gpt-4o"):
+    """
+    Returns (pruned_text, stats) where pruned_text keeps only the relevant
+    paragraphs of `text` within `token_budget` tokens. The lede paragraph is
+    always kept. Texts already inside the budget are returned unchanged.
+    """
+    original_tokens = num_tokens_from_string(text, model_name)
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    stats = {
+        "original_tokens": original_tokens,
+        "pruned_tokens": original_tokens,
+        "total_paragraphs": len(paragraphs),
+        "kept_paragraphs": len(paragraphs),
+    }
+    if token_budget <= 0 or original_tokens <= token_budget or not paragraphs:
+        return text, stats
+
+    paragraph_tokens = [num_tokens_from_string(p, model_name) for p in paragraphs]
+    scores = [score_paragraph(p) for p in paragraphs]
+
+    selected = set()
+    used = 0
+    # The lede usually names the parties and the event, so it always goes first.
+    candidates = [0] + sorted(
+        (i for i in range(1, len(paragraphs)) if scores[i] > 0),
+        key=lambda i: (scores[i] / max(paragraph_tokens[i], 1), scores[i]),
+        reverse=True,
+    )
+    for i in candidates:
+        if used + paragraph_tokens[i] <= token_budget:
+            selected.add(i)
+            used += paragraph_tokens[i]
+
+    if not selected:
+        # Even the lede does not fit, so fall back to a hard truncation.
+        pruned = _truncate_to_budget(text, token_budget, model_name)
+        stats.update(pruned_tokens=num_tokens_from_string(pruned, model_name), kept_paragraphs=0)
+        return pruned, stats
+
+    pruned = "\n".join(paragraphs[i] for i in sorted(selected))
+    stats.update(pruned_tokens=used, kept_paragraphs=len(selected))
+    return pruned, stats
+
+
+def _normalised_set(values):
+    return {str(value).strip().lower() for value in (values or []) if value and str(value).strip()}
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def compare_extractions(full_result, pruned_result):
+    """Agreement between the full-text and pruned-text extraction of the same article."""
+    full_companies = _normalised_set(s.company_name for s in (full_result.company_sentiments or []))
+    pruned_companies = _normalised_set(s.company_name for s in (pruned_result.company_sentiments or []))
+    return {
+        "mode_match": full_result.mode == pruned_result.mode,
+        "company_jaccard": round(_jaccard(full_companies, pruned_companies), 4),
+        "country_jaccard": round(_jaccard(_normalised_set(full_result.countries), _normalised_set(pruned_result.countries)), 4),
+        "commodity_jaccard": round(_jaccard(_normalised_set(full_result.commodities), _normalised_set(pruned_result.commodities)), 4),
+    }
@@ -0,0 +1,65 @@
+from flask import Blueprint, jsonify, request
+from CustomSupabaseVectorStore.VectorIndex import (
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, build_vector_indexes, vector_index_status,
+)
+from .status import pipeline_status_tracker, status_lock
+from .embedding import _run_single_stage
+
+vector_indexes_bp = Blueprint('vector_indexes', __name__, url_prefix='/api/vector-indexes')
+
+
+def _do_build_vector_indexes(pipeline_id, stop_event, m, ef_construction, rebuild, maintenance_work_mem):
+    with status_lock:
+        pipeline_status_tracker["details"]["message"] = "Building HNSW vector indexes..."
+    built = build_vector_indexes(m, ef_construction, rebuild=rebuild, maintenance_work_mem=maintenance_work_mem)
+    print(f"Vector indexes built: {built or 'none (all present)'}")
+    return len(built), 0
+
+
+@vector_indexes_bp.route('', methods=['GET'])
+def get_vector_indexes():
+    """
+    GET /api/vector-indexes
+    Lists the HNSW/ivfflat indexes with their size, validity and scan count,
+    plus the build and search settings in effect.
+    """
+    try:
+        return jsonify({
+            "indexes": vector_index_status(),
+            "settings": {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH},
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@vector_indexes_bp.route('/build', methods=['POST'])
+def build_vector_indexes_endpoint():
+    """
+    POST /api/vector-indexes/build
+    {
+        "m": 16,                        (optional)
+        "ef_construction": 64,          (optional)
+        "rebuild": false,               (drop and rebuild existing indexes)
+        "maintenance_work_mem": "1GB"   (optional, speeds up large builds)
+    }
+    Builds missing HNSW cosine indexes concurrently and drops the legacy
+    ivfflat index, as a background stage.
+    """
+    data = request.json or {}
+    try:
+        m = int(data.get("m", HNSW_M))
+        ef_construction = int(data.get("ef_construction", HNSW_EF_CONSTRUCTION))
+    except (TypeError, ValueError):
+        return jsonify({"error": "m and ef_construction must be integers"}), 400
+    if not 2 <= m <= 100 or not 4 <= ef_construction <= 1000 or ef_construction < 2 * m:
+        return jsonify({"error": "Use 2 <= m <= 100 and 2*m <= ef_construction <= 1000"}), 400
+    return _run_single_stage(
+        task_function=_do_build_vector_indexes,
+        stage_name="Building Vector Indexes",
+        task_args={
+            "m": m,
+            "ef_construction": ef_construction,
+            "rebuild": bool(data.get("rebuild", False)),
+            "maintenance_work_mem": data.get("maintenance_work_mem") or None,
+        },
+    )
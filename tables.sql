@@ -233,3 +233,910 @@ FOREIGN KEY (company_id) REFERENCES companies(id);
 ALTER TABLE company_analysis
 ALTER COLUMN company_id SET NOT NULL;
 
+
+
+-- =======================================================================
+-- LLM extraction result cache
+-- =======================================================================
+-- Structured ArticleAnalysis outputs keyed by the article text hash, the model
+-- and a fingerprint of the extraction prompt + schema (PROMPT_VERSION in
+-- routes/agent_manager.py). Re-analysing identical text is served from here.
+CREATE TABLE IF NOT EXISTS analysis_cache (
+  text_hash CHAR(64) NOT NULL,
+  model_type TEXT NOT NULL,
+  model_name TEXT NOT NULL,
+  prompt_version CHAR(64) NOT NULL,
+  result JSONB NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (text_hash, model_type, model_name, prompt_version)
+);
+
+
+-- Set when the local relevance pre-classifier marked the article as 'Ignore'
+-- without calling the LLM. Such articles are excluded from its training data.
+ALTER TABLE scraped_articles
+ADD COLUMN IF NOT EXISTS prefilter_skipped BOOLEAN NOT NULL DEFAULT FALSE;
+
+
+-- =======================================================================
+-- Prompt pruning A/B results
+-- =======================================================================
+-- One row per article re-extracted with both the full and the pruned text
+-- (POST /api/analysis/pruning/ab-test). Used to check that pruning cuts
+-- input tokens without changing the extracted result.
+CREATE TABLE IF NOT EXISTS prompt_pruning_ab (
+  id SERIAL PRIMARY KEY,
+  article_id INTEGER NOT NULL REFERENCES scraped_articles(id) ON DELETE CASCADE,
+  model_type TEXT NOT NULL,
+  model_name TEXT NOT NULL,
+  token_budget INTEGER NOT NULL,
+  full_tokens INTEGER NOT NULL,
+  pruned_tokens INTEGER NOT NULL,
+  mode_match BOOLEAN NOT NULL,
+  company_jaccard REAL NOT NULL,
+  country_jaccard REAL NOT NULL,
+  commodity_jaccard REAL NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Self-reported extraction confidence (used by the model cascade) and
+-- per-run analysis statistics: outcome counts, token reduction, tier traffic.
+ALTER TABLE article_analysis
+ADD COLUMN IF NOT EXISTS confidence REAL;
+
+ALTER TABLE pipeline_runs
+ADD COLUMN IF NOT EXISTS analysis_stats JSONB;
+
+
+-- =======================================================================
+-- Transactional persistence of one analysed article
+-- =======================================================================
+-- Writes everything an analysed article produces in one round trip and one
+-- transaction: the article_analysis row, its company_analysis rows, the
+-- scraped_articles status and the pipeline_runs counters. p_analysis is the
+-- ArticleAnalysis JSON without company_sentiments, or NULL for articles that
+-- were classified 'Ignore' (by the LLM or the relevance pre-classifier).
+-- p_companies is a JSON array of company_analysis rows including company_id.
+-- Returns the new article_analysis id, or NULL when nothing was stored.
+CREATE OR REPLACE FUNCTION persist_article_analysis(
+  p_article_id INTEGER,
+  p_pipeline_id INTEGER,
+  p_analysis JSONB,
+  p_companies JSONB DEFAULT '[]'::jsonb,
+  p_cost NUMERIC DEFAULT 0,
+  p_prefilter_skipped BOOLEAN DEFAULT FALSE
+) RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_analysis_id INTEGER;
+BEGIN
+  IF p_analysis IS NOT NULL THEN
+    INSERT INTO article_analysis (
+      article_id, mode, countries, commodities, contract_value, deadline,
+      model_type, model_name, confidence, cost
+    )
+    VALUES (
+      p_article_id,
+      (p_analysis->>'mode')::analysis_mode,
+      CASE WHEN jsonb_typeof(p_analysis->'countries') = 'array'
+           THEN ARRAY(SELECT jsonb_array_elements_text(p_analysis->'countries')) END,
+      CASE WHEN jsonb_typeof(p_analysis->'commodities') = 'array'
+           THEN ARRAY(SELECT jsonb_array_elements_text(p_analysis->'commodities')) END,
+      p_analysis->>'contract_value',
+      p_analysis->>'deadline',
+      p_analysis->>'model_type',
+      p_analysis->>'model_name',
+      (p_analysis->>'confidence')::REAL,
+      p_cost
+    )
+    RETURNING id INTO v_analysis_id;
+
+    INSERT INTO company_analysis (
+      article_analysis_id, company_name, sentiment, risk_type, reason_for_sentiment, company_id
+    )
+    SELECT
+      v_analysis_id,
+      c->>'company_name',
+      (c->>'sentiment')::sentiment_type,
+      (c->>'risk_type')::risk_classification,
+      c->>'reason_for_sentiment',
+      (c->>'company_id')::INTEGER
+    FROM jsonb_array_elements(COALESCE(p_companies, '[]'::jsonb)) AS c
+    -- The row triggers upsert per-company rollup rows; taking them in
+    -- company_id order keeps concurrent workers from deadlocking.
+    ORDER BY (c->>'company_id')::INTEGER;
+  END IF;
+
+  UPDATE scraped_articles
+  SET analysis_status = 'success',
+      prefilter_skipped = prefilter_skipped OR p_prefilter_skipped
+  WHERE id = p_article_id;
+
+  UPDATE pipeline_runs
+  SET articles_analyzed = COALESCE(articles_analyzed, 0) + 1,
+      analysis_cost = COALESCE(analysis_cost, 0) + p_cost,
+      total_cost = COALESCE(total_cost, 0) + p_cost
+  WHERE id = p_pipeline_id;
+
+  RETURN v_analysis_id;
+END;
+$$;
+
+
+-- =======================================================================
+-- Entity resolution verdict memo
+-- =======================================================================
+-- One row per LLM "same company?" answer, keyed by the normalised mention
+-- (routes/company_resolver.normalize_company_name) and the candidate company.
+-- NameMatch consults it before asking the LLM again. Rows can be listed and
+-- invalidated through /api/companies/match-verdicts.
+CREATE TABLE IF NOT EXISTS entity_match_verdicts (
+  mention_key TEXT NOT NULL,
+  company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+  verdict BOOLEAN NOT NULL,
+  model TEXT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (mention_key, company_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_entity_match_verdicts_company_id ON entity_match_verdicts(company_id);
+
+
+-- =======================================================================
+-- Company aliases (deduplication)
+-- =======================================================================
+-- Spellings folded into a canonical company by the company dedup job
+-- (POST /api/companies/dedup). The duplicate companies rows are deleted
+-- after their company_analysis rows are repointed; the in-process company
+-- resolver still recognises their names through this table.
+CREATE TABLE IF NOT EXISTS company_aliases (
+  alias_name TEXT PRIMARY KEY,
+  company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+  merged_from_id INTEGER,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_company_aliases_company_id ON company_aliases(company_id);
+
+
+-- =======================================================================
+-- HNSW vector indexes (cosine)
+-- =======================================================================
+-- Every search orders by `<=>` (cosine distance), which the ivfflat index
+-- above (vector_l2_ops) cannot serve, so searches were sequential scans.
+-- These replace it. On a populated database prefer
+-- CustomSupabaseVectorStore/VectorIndex.build_vector_indexes() (or
+-- POST /api/vector-indexes/build), which builds them CONCURRENTLY.
+-- hnsw.ef_search is set per query by the vector stores (default 40).
+DROP INDEX IF EXISTS article_embeddings_vector_idx;
+
+CREATE INDEX IF NOT EXISTS article_embeddings_embedding_hnsw_idx
+  ON article_embeddings USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX IF NOT EXISTS companies_embedding_hnsw_idx
+  ON companies USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+
+-- =======================================================================
+-- Filter columns on article_embeddings
+-- =======================================================================
+-- Vector search filters (CustomSupabaseVectorStore/SearchFilters.py) run
+-- against article_embeddings alone, so they can be checked inside the
+-- HNSW scan instead of after a join. source and publication_date are
+-- already there; mode, countries and commodities are copied from
+-- article_analysis by the triggers below.
+ALTER TABLE article_embeddings
+ADD COLUMN IF NOT EXISTS mode analysis_mode,
+ADD COLUMN IF NOT EXISTS countries TEXT[],
+ADD COLUMN IF NOT EXISTS commodities TEXT[];
+
+CREATE OR REPLACE FUNCTION sync_embedding_filters_from_analysis()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE article_embeddings
+  SET mode = NEW.mode, countries = NEW.countries, commodities = NEW.commodities
+  WHERE article_id = NEW.article_id
+    AND (mode, countries, commodities) IS DISTINCT FROM (NEW.mode, NEW.countries, NEW.commodities);
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS article_analysis_sync_embedding_filters ON article_analysis;
+CREATE TRIGGER article_analysis_sync_embedding_filters
+AFTER INSERT OR UPDATE OF mode, countries, commodities ON article_analysis
+FOR EACH ROW EXECUTE FUNCTION sync_embedding_filters_from_analysis();
+
+-- Articles analysed before they were embedded.
+CREATE OR REPLACE FUNCTION fill_embedding_filters()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  SELECT aa.mode, aa.countries, aa.commodities
+  INTO NEW.mode, NEW.countries, NEW.commodities
+  FROM article_analysis aa
+  WHERE aa.article_id = NEW.article_id;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS article_embeddings_fill_filters ON article_embeddings;
+CREATE TRIGGER article_embeddings_fill_filters
+BEFORE INSERT ON article_embeddings
+FOR EACH ROW EXECUTE FUNCTION fill_embedding_filters();
+
+UPDATE article_embeddings ae
+SET mode = aa.mode, countries = aa.countries, commodities = aa.commodities
+FROM article_analysis aa
+WHERE aa.article_id = ae.article_id;
+
+-- Pre-filter paths the planner can pick for selective filters.
+CREATE INDEX IF NOT EXISTS idx_article_embeddings_source ON article_embeddings(source);
+CREATE INDEX IF NOT EXISTS idx_article_embeddings_publication_date ON article_embeddings(publication_date);
+CREATE INDEX IF NOT EXISTS idx_article_embeddings_countries ON article_embeddings USING gin (countries);
+CREATE INDEX IF NOT EXISTS idx_article_embeddings_commodities ON article_embeddings USING gin (commodities);
+
+-- Per-mode partial HNSW indexes (also built by build_vector_indexes()).
+CREATE INDEX IF NOT EXISTS article_embeddings_tender_hnsw_idx
+  ON article_embeddings USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64) WHERE mode = 'Tender';
+
+CREATE INDEX IF NOT EXISTS article_embeddings_sentiment_hnsw_idx
+  ON article_embeddings USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64) WHERE mode = 'Sentiment';
+
+-- =======================================================================
+-- Lexical search on scraped_articles
+-- =======================================================================
+-- Embeddings blur exact tokens (tender numbers, tickers, place names), so
+-- hybrid search (ArticleVectorStore.hybrid_search_records) also ranks
+-- articles by full-text match and title trigram similarity and fuses the
+-- two rankings. Title terms are weighted above body terms. Adding a
+-- stored generated column rewrites the table once.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE scraped_articles
+  ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(cleaned_text, '')), 'B')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_scraped_articles_search_tsv ON scraped_articles USING gin (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_scraped_articles_title_trgm ON scraped_articles USING gin (title gin_trgm_ops);
+
+-- =======================================================================
+-- Dashboard rollups
+-- =======================================================================
+-- /api/stats/insights, /company-sentiment-summary and /risk-factors/counts
+-- used to aggregate the whole analysis history on every call. These rollup
+-- tables are kept current by triggers as analyses are written, deleted or
+-- repointed by company dedup, so the endpoints read O(result) rows.
+--
+-- company_analysis carries the mode and scrape date of its article (copied
+-- by trigger, like the article_embeddings filter columns) so the rollup
+-- triggers never look up parent rows, which are already gone when a
+-- delete cascades down from scraped_articles or article_analysis.
+ALTER TABLE company_analysis
+  ADD COLUMN IF NOT EXISTS article_mode analysis_mode,
+  ADD COLUMN IF NOT EXISTS article_scraped_date DATE;
+
+CREATE OR REPLACE FUNCTION fill_company_analysis_article_keys()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  SELECT aa.mode, sa.scraped_at::date
+  INTO NEW.article_mode, NEW.article_scraped_date
+  FROM article_analysis aa
+  JOIN scraped_articles sa ON sa.id = aa.article_id
+  WHERE aa.id = NEW.article_analysis_id;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS company_analysis_fill_article_keys ON company_analysis;
+CREATE TRIGGER company_analysis_fill_article_keys
+BEFORE INSERT ON company_analysis
+FOR EACH ROW EXECUTE FUNCTION fill_company_analysis_article_keys();
+
+UPDATE company_analysis ca
+SET article_mode = aa.mode, article_scraped_date = sa.scraped_at::date
+FROM article_analysis aa
+JOIN scraped_articles sa ON sa.id = aa.article_id
+WHERE aa.id = ca.article_analysis_id;
+
+-- A re-classified article moves its company rows to the new mode.
+CREATE OR REPLACE FUNCTION sync_company_analysis_article_mode()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE company_analysis
+  SET article_mode = NEW.mode
+  WHERE article_analysis_id = NEW.id AND article_mode IS DISTINCT FROM NEW.mode;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS article_analysis_sync_company_mode ON article_analysis;
+CREATE TRIGGER article_analysis_sync_company_mode
+AFTER UPDATE OF mode ON article_analysis
+FOR EACH ROW EXECUTE FUNCTION sync_company_analysis_article_mode();
+
+-- Sentiment counts per company, split by mode and risk type so the summary
+-- filters still apply ('' stands for NULL, which a primary key cannot hold).
+CREATE TABLE IF NOT EXISTS company_sentiment_rollup (
+  company_id INTEGER NOT NULL,
+  mode TEXT NOT NULL DEFAULT '',
+  risk_type TEXT NOT NULL DEFAULT '',
+  positive BIGINT NOT NULL DEFAULT 0,
+  negative BIGINT NOT NULL DEFAULT 0,
+  neutral BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (company_id, mode, risk_type)
+);
+
+-- Risk-typed mentions per scrape day and company.
+CREATE TABLE IF NOT EXISTS risk_daily_counts (
+  day DATE NOT NULL,
+  company_id INTEGER NOT NULL,
+  risk_type risk_classification NOT NULL,
+  count BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, company_id, risk_type)
+);
+CREATE INDEX IF NOT EXISTS idx_risk_daily_counts_company ON risk_daily_counts(company_id, day);
+
+-- Distinct countries / commodities named by any analysis, with how many
+-- analyses name them. A value is dropped when its count reaches zero.
+CREATE TABLE IF NOT EXISTS country_registry (
+  country TEXT PRIMARY KEY,
+  article_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS commodity_registry (
+  commodity TEXT PRIMARY KEY,
+  article_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- Adds (p_delta = 1) or removes (p_delta = -1) one company_analysis row.
+CREATE OR REPLACE FUNCTION apply_company_analysis_rollups(
+  p_company_id INTEGER,
+  p_mode analysis_mode,
+  p_risk_type risk_classification,
+  p_sentiment sentiment_type,
+  p_day DATE,
+  p_delta INTEGER
+) RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_company_id IS NULL THEN
+    RETURN;
+  END IF;
+
+  IF p_sentiment IS NOT NULL THEN
+    INSERT INTO company_sentiment_rollup AS r (company_id, mode, risk_type, positive, negative, neutral)
+    VALUES (
+      p_company_id, COALESCE(p_mode::text, ''), COALESCE(p_risk_type::text, ''),
+      CASE WHEN p_sentiment = 'Positive' THEN p_delta ELSE 0 END,
+      CASE WHEN p_sentiment = 'Negative' THEN p_delta ELSE 0 END,
+      CASE WHEN p_sentiment = 'Neutral' THEN p_delta ELSE 0 END
+    )
+    ON CONFLICT (company_id, mode, risk_type) DO UPDATE
+    SET positive = r.positive + EXCLUDED.positive,
+        negative = r.negative + EXCLUDED.negative,
+        neutral = r.neutral + EXCLUDED.neutral;
+
+    DELETE FROM company_sentiment_rollup
+    WHERE company_id = p_company_id
+      AND mode = COALESCE(p_mode::text, '')
+      AND risk_type = COALESCE(p_risk_type::text, '')
+      AND positive + negative + neutral <= 0;
+  END IF;
+
+  IF p_risk_type IS NOT NULL AND p_day IS NOT NULL THEN
+    INSERT INTO risk_daily_counts AS r (day, company_id, risk_type, count)
+    VALUES (p_day, p_company_id, p_risk_type, p_delta)
+    ON CONFLICT (day, company_id, risk_type) DO UPDATE
+    SET count = r.count + EXCLUDED.count;
+
+    DELETE FROM risk_daily_counts
+    WHERE day = p_day AND company_id = p_company_id AND risk_type = p_risk_type AND count <= 0;
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION company_analysis_rollups_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_company_analysis_rollups(
+      OLD.company_id, OLD.article_mode, OLD.risk_type, OLD.sentiment, OLD.article_scraped_date, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_company_analysis_rollups(
+      NEW.company_id, NEW.article_mode, NEW.risk_type, NEW.sentiment, NEW.article_scraped_date, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS company_analysis_rollups ON company_analysis;
+CREATE TRIGGER company_analysis_rollups
+AFTER INSERT OR DELETE OR UPDATE OF company_id, sentiment, risk_type, article_mode, article_scraped_date
+ON company_analysis
+FOR EACH ROW EXECUTE FUNCTION company_analysis_rollups_trigger();
+
+-- Adds or removes the distinct countries/commodities of one analysis.
+-- Registry rows are shared by every article, so they are upserted in a
+-- fixed (sorted) order to avoid lock-order deadlocks between workers.
+CREATE OR REPLACE FUNCTION apply_article_analysis_registries(
+  p_countries TEXT[],
+  p_commodities TEXT[],
+  p_delta INTEGER
+) RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO country_registry AS r (country, article_count)
+  SELECT DISTINCT value, p_delta FROM unnest(p_countries) AS value WHERE value IS NOT NULL
+  ORDER BY value
+  ON CONFLICT (country) DO UPDATE SET article_count = r.article_count + EXCLUDED.article_count;
+
+  INSERT INTO commodity_registry AS r (commodity, article_count)
+  SELECT DISTINCT value, p_delta FROM unnest(p_commodities) AS value WHERE value IS NOT NULL
+  ORDER BY value
+  ON CONFLICT (commodity) DO UPDATE SET article_count = r.article_count + EXCLUDED.article_count;
+
+  IF p_delta < 0 THEN
+    DELETE FROM country_registry WHERE country = ANY(p_countries) AND article_count <= 0;
+    DELETE FROM commodity_registry WHERE commodity = ANY(p_commodities) AND article_count <= 0;
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION article_analysis_registries_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM apply_article_analysis_registries(OLD.countries, OLD.commodities, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM apply_article_analysis_registries(NEW.countries, NEW.commodities, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS article_analysis_registries ON article_analysis;
+CREATE TRIGGER article_analysis_registries
+AFTER INSERT OR DELETE OR UPDATE OF countries, commodities
+ON article_analysis
+FOR EACH ROW EXECUTE FUNCTION article_analysis_registries_trigger();
+
+-- Recomputes every rollup from the base tables. Used to backfill here and
+-- to repair the rollups if they are ever suspected to have drifted.
+CREATE OR REPLACE FUNCTION rebuild_dashboard_rollups()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  LOCK TABLE company_analysis, article_analysis IN SHARE MODE;
+  TRUNCATE company_sentiment_rollup, risk_daily_counts, country_registry, commodity_registry;
+
+  INSERT INTO company_sentiment_rollup (company_id, mode, risk_type, positive, negative, neutral)
+  SELECT
+    company_id, COALESCE(article_mode::text, ''), COALESCE(risk_type::text, ''),
+    COUNT(*) FILTER (WHERE sentiment = 'Positive'),
+    COUNT(*) FILTER (WHERE sentiment = 'Negative'),
+    COUNT(*) FILTER (WHERE sentiment = 'Neutral')
+  FROM company_analysis
+  WHERE company_id IS NOT NULL AND sentiment IS NOT NULL
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO risk_daily_counts (day, company_id, risk_type, count)
+  SELECT article_scraped_date, company_id, risk_type, COUNT(*)
+  FROM company_analysis
+  WHERE company_id IS NOT NULL AND risk_type IS NOT NULL AND article_scraped_date IS NOT NULL
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO country_registry (country, article_count)
+  SELECT value, COUNT(DISTINCT aa.id)
+  FROM article_analysis aa, unnest(aa.countries) AS value
+  WHERE value IS NOT NULL
+  GROUP BY value;
+
+  INSERT INTO commodity_registry (commodity, article_count)
+  SELECT value, COUNT(DISTINCT aa.id)
+  FROM article_analysis aa, unnest(aa.commodities) AS value
+  WHERE value IS NOT NULL
+  GROUP BY value;
+END;
+$$;
+
+SELECT rebuild_dashboard_rollups();
+
+-- =======================================================================
+-- Company profiles read model
+-- =======================================================================
+-- /api/stats/search/companies1 used to unnest countries and commodities
+-- in the same SELECT, so every mention counted once per (country,
+-- commodity) pair and the totals were inflated. company_profiles holds one
+-- row per company with its sentiment counts, per-commodity / per-country /
+-- per-contract-value / per-risk-type counts (JSON objects value -> number
+-- of mentions), its 20 most recently analysed article URLs and latest
+-- reason. A new mention is applied as a delta; deletes and updates (dedup
+-- merges, re-analysis) recompute the affected companies once per statement.
+--
+-- company_analysis also carries its article's countries, commodities and
+-- contract value, copied by the same trigger as article_mode.
+ALTER TABLE company_analysis
+  ADD COLUMN IF NOT EXISTS article_countries TEXT[],
+  ADD COLUMN IF NOT EXISTS article_commodities TEXT[],
+  ADD COLUMN IF NOT EXISTS article_contract_value TEXT;
+
+CREATE OR REPLACE FUNCTION fill_company_analysis_article_keys()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  SELECT aa.mode, sa.scraped_at::date, aa.countries, aa.commodities, aa.contract_value
+  INTO NEW.article_mode, NEW.article_scraped_date, NEW.article_countries, NEW.article_commodities, NEW.article_contract_value
+  FROM article_analysis aa
+  JOIN scraped_articles sa ON sa.id = aa.article_id
+  WHERE aa.id = NEW.article_analysis_id;
+  RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION sync_company_analysis_article_keys()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE company_analysis
+  SET article_mode = NEW.mode,
+      article_countries = NEW.countries,
+      article_commodities = NEW.commodities,
+      article_contract_value = NEW.contract_value
+  WHERE article_analysis_id = NEW.id
+    AND (article_mode, article_countries, article_commodities, article_contract_value)
+        IS DISTINCT FROM (NEW.mode, NEW.countries, NEW.commodities, NEW.contract_value);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS article_analysis_sync_company_mode ON article_analysis;
+DROP FUNCTION IF EXISTS sync_company_analysis_article_mode();
+DROP TRIGGER IF EXISTS article_analysis_sync_company_keys ON article_analysis;
+CREATE TRIGGER article_analysis_sync_company_keys
+AFTER UPDATE OF mode, countries, commodities, contract_value ON article_analysis
+FOR EACH ROW EXECUTE FUNCTION sync_company_analysis_article_keys();
+
+UPDATE company_analysis ca
+SET article_countries = aa.countries,
+    article_commodities = aa.commodities,
+    article_contract_value = aa.contract_value
+FROM article_analysis aa
+WHERE aa.id = ca.article_analysis_id;
+
+CREATE TABLE IF NOT EXISTS company_profiles (
+  company_id INTEGER PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+  total_occurrences BIGINT NOT NULL DEFAULT 0,
+  positive_count BIGINT NOT NULL DEFAULT 0,
+  negative_count BIGINT NOT NULL DEFAULT 0,
+  neutral_count BIGINT NOT NULL DEFAULT 0,
+  commodity_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+  country_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+  contract_value_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+  risk_type_counts JSONB NOT NULL DEFAULT '{}'::jsonb,
+  recent_urls TEXT[] NOT NULL DEFAULT '{}',
+  latest_reason TEXT,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Adds p_delta to the count of each distinct key; drops keys that reach zero.
+CREATE OR REPLACE FUNCTION jsonb_add_counts(p_counts JSONB, p_keys TEXT[], p_delta INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT COALESCE(jsonb_object_agg(key, total) FILTER (WHERE total > 0), '{}'::jsonb)
+  FROM (
+    SELECT key, SUM(value) AS total
+    FROM (
+      SELECT key, value::bigint AS value FROM jsonb_each_text(COALESCE(p_counts, '{}'::jsonb))
+      UNION ALL
+      SELECT DISTINCT k, p_delta::bigint FROM unnest(p_keys) AS k WHERE k IS NOT NULL
+    ) deltas
+    GROUP BY key
+  ) totals;
+$$;
+
+-- The p_limit largest counts as [{"name": ..., "count": ...}], largest first.
+CREATE OR REPLACE FUNCTION jsonb_top_counts(p_counts JSONB, p_limit INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT COALESCE(jsonb_agg(jsonb_build_object('name', key, 'count', value::bigint) ORDER BY value::bigint DESC, key), '[]'::jsonb)
+  FROM (
+    SELECT key, value FROM jsonb_each_text(p_counts)
+    ORDER BY value::bigint DESC, key
+    LIMIT p_limit
+  ) top;
+$$;
+
+-- Company profiles computed from company_analysis, optionally for some
+-- companies only and over the mentions matching the given filters. Used to
+-- rebuild and repair company_profiles, and by filtered profile searches.
+CREATE OR REPLACE FUNCTION aggregate_company_profiles(
+  p_company_ids INTEGER[] DEFAULT NULL,
+  p_sentiment sentiment_type DEFAULT NULL,
+  p_risk_type risk_classification DEFAULT NULL,
+  p_mode analysis_mode DEFAULT NULL
+) RETURNS TABLE (
+  company_id INTEGER,
+  total_occurrences BIGINT,
+  positive_count BIGINT,
+  negative_count BIGINT,
+  neutral_count BIGINT,
+  commodity_counts JSONB,
+  country_counts JSONB,
+  contract_value_counts JSONB,
+  risk_type_counts JSONB,
+  recent_urls TEXT[],
+  latest_reason TEXT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH mentions AS (
+    SELECT ca.*
+    FROM company_analysis ca
+    WHERE ca.company_id IS NOT NULL
+      AND (p_company_ids IS NULL OR ca.company_id = ANY(p_company_ids))
+      AND (p_sentiment IS NULL OR ca.sentiment = p_sentiment)
+      AND (p_risk_type IS NULL OR ca.risk_type = p_risk_type)
+      AND (p_mode IS NULL OR ca.article_mode = p_mode)
+  ),
+  totals AS (
+    SELECT
+      m.company_id,
+      COUNT(*) AS total,
+      COUNT(*) FILTER (WHERE m.sentiment = 'Positive') AS positive,
+      COUNT(*) FILTER (WHERE m.sentiment = 'Negative') AS negative,
+      COUNT(*) FILTER (WHERE m.sentiment = 'Neutral') AS neutral
+    FROM mentions m
+    GROUP BY m.company_id
+  ),
+  commodities AS (
+    SELECT t.company_id, jsonb_object_agg(t.value, t.n) AS counts
+    FROM (
+      SELECT m.company_id, value, COUNT(DISTINCT m.id) AS n
+      FROM mentions m, unnest(m.article_commodities) AS value
+      WHERE value IS NOT NULL
+      GROUP BY 1, 2
+    ) t
+    GROUP BY t.company_id
+  ),
+  countries AS (
+    SELECT t.company_id, jsonb_object_agg(t.value, t.n) AS counts
+    FROM (
+      SELECT m.company_id, value, COUNT(DISTINCT m.id) AS n
+      FROM mentions m, unnest(m.article_countries) AS value
+      WHERE value IS NOT NULL
+      GROUP BY 1, 2
+    ) t
+    GROUP BY t.company_id
+  ),
+  contract_values AS (
+    SELECT t.company_id, jsonb_object_agg(t.value, t.n) AS counts
+    FROM (
+      SELECT m.company_id, m.article_contract_value AS value, COUNT(*) AS n
+      FROM mentions m
+      WHERE m.article_contract_value IS NOT NULL
+      GROUP BY 1, 2
+    ) t
+    GROUP BY t.company_id
+  ),
+  risks AS (
+    SELECT t.company_id, jsonb_object_agg(t.value, t.n) AS counts
+    FROM (
+      SELECT m.company_id, m.risk_type::text AS value, COUNT(*) AS n
+      FROM mentions m
+      WHERE m.risk_type IS NOT NULL
+      GROUP BY 1, 2
+    ) t
+    GROUP BY t.company_id
+  ),
+  urls AS (
+    SELECT t.company_id, array_agg(t.url ORDER BY t.last_id DESC) AS urls
+    FROM (
+      SELECT
+        m.company_id,
+        sa.url,
+        MAX(m.id) AS last_id,
+        row_number() OVER (PARTITION BY m.company_id ORDER BY MAX(m.id) DESC) AS rn
+      FROM mentions m
+      JOIN article_analysis aa ON aa.id = m.article_analysis_id
+      JOIN scraped_articles sa ON sa.id = aa.article_id
+      WHERE sa.url IS NOT NULL
+      GROUP BY m.company_id, sa.url
+    ) t
+    WHERE t.rn <= 20
+    GROUP BY t.company_id
+  ),
+  reasons AS (
+    SELECT DISTINCT ON (m.company_id) m.company_id, m.reason_for_sentiment
+    FROM mentions m
+    WHERE m.reason_for_sentiment IS NOT NULL
+    ORDER BY m.company_id, m.id DESC
+  )
+  SELECT
+    t.company_id,
+    t.total,
+    t.positive,
+    t.negative,
+    t.neutral,
+    COALESCE(cm.counts, '{}'::jsonb),
+    COALESCE(co.counts, '{}'::jsonb),
+    COALESCE(cv.counts, '{}'::jsonb),
+    COALESCE(r.counts, '{}'::jsonb),
+    COALESCE(u.urls, '{}'),
+    re.reason_for_sentiment
+  FROM totals t
+  LEFT JOIN commodities cm ON cm.company_id = t.company_id
+  LEFT JOIN countries co ON co.company_id = t.company_id
+  LEFT JOIN contract_values cv ON cv.company_id = t.company_id
+  LEFT JOIN risks r ON r.company_id = t.company_id
+  LEFT JOIN urls u ON u.company_id = t.company_id
+  LEFT JOIN reasons re ON re.company_id = t.company_id;
+$$;
+
+-- Recomputes the profiles of the given companies (NULL: all of them).
+CREATE OR REPLACE FUNCTION refresh_company_profiles(p_company_ids INTEGER[] DEFAULT NULL)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO company_profiles AS p (
+    company_id, total_occurrences, positive_count, negative_count, neutral_count,
+    commodity_counts, country_counts, contract_value_counts, risk_type_counts,
+    recent_urls, latest_reason, updated_at
+  )
+  SELECT a.*, now() FROM aggregate_company_profiles(p_company_ids) a
+  ON CONFLICT (company_id) DO UPDATE
+  SET total_occurrences = EXCLUDED.total_occurrences,
+      positive_count = EXCLUDED.positive_count,
+      negative_count = EXCLUDED.negative_count,
+      neutral_count = EXCLUDED.neutral_count,
+      commodity_counts = EXCLUDED.commodity_counts,
+      country_counts = EXCLUDED.country_counts,
+      contract_value_counts = EXCLUDED.contract_value_counts,
+      risk_type_counts = EXCLUDED.risk_type_counts,
+      recent_urls = EXCLUDED.recent_urls,
+      latest_reason = EXCLUDED.latest_reason,
+      updated_at = EXCLUDED.updated_at;
+
+  DELETE FROM company_profiles p
+  WHERE (p_company_ids IS NULL OR p.company_id = ANY(p_company_ids))
+    AND NOT EXISTS (SELECT 1 FROM company_analysis ca WHERE ca.company_id = p.company_id);
+END;
+$$;
+
+-- A new mention: add its counts to the company's profile.
+CREATE OR REPLACE FUNCTION company_analysis_profile_insert_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_url TEXT;
+BEGIN
+  IF NEW.company_id IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  SELECT sa.url INTO v_url
+  FROM article_analysis aa
+  JOIN scraped_articles sa ON sa.id = aa.article_id
+  WHERE aa.id = NEW.article_analysis_id;
+
+  INSERT INTO company_profiles AS p (
+    company_id, total_occurrences, positive_count, negative_count, neutral_count,
+    commodity_counts, country_counts, contract_value_counts, risk_type_counts,
+    recent_urls, latest_reason, updated_at
+  )
+  VALUES (
+    NEW.company_id,
+    1,
+    CASE WHEN NEW.sentiment = 'Positive' THEN 1 ELSE 0 END,
+    CASE WHEN NEW.sentiment = 'Negative' THEN 1 ELSE 0 END,
+    CASE WHEN NEW.sentiment = 'Neutral' THEN 1 ELSE 0 END,
+    jsonb_add_counts('{}'::jsonb, NEW.article_commodities, 1),
+    jsonb_add_counts('{}'::jsonb, NEW.article_countries, 1),
+    jsonb_add_counts('{}'::jsonb, ARRAY[NEW.article_contract_value], 1),
+    jsonb_add_counts('{}'::jsonb, ARRAY[NEW.risk_type::text], 1),
+    CASE WHEN v_url IS NULL THEN '{}' ELSE ARRAY[v_url] END,
+    NEW.reason_for_sentiment,
+    now()
+  )
+  ON CONFLICT (company_id) DO UPDATE
+  SET total_occurrences = p.total_occurrences + 1,
+      positive_count = p.positive_count + EXCLUDED.positive_count,
+      negative_count = p.negative_count + EXCLUDED.negative_count,
+      neutral_count = p.neutral_count + EXCLUDED.neutral_count,
+      commodity_counts = jsonb_add_counts(p.commodity_counts, NEW.article_commodities, 1),
+      country_counts = jsonb_add_counts(p.country_counts, NEW.article_countries, 1),
+      contract_value_counts = jsonb_add_counts(p.contract_value_counts, ARRAY[NEW.article_contract_value], 1),
+      risk_type_counts = jsonb_add_counts(p.risk_type_counts, ARRAY[NEW.risk_type::text], 1),
+      recent_urls = CASE
+        WHEN v_url IS NULL THEN p.recent_urls
+        ELSE (array_prepend(v_url, array_remove(p.recent_urls, v_url)))[1:20]
+      END,
+      latest_reason = COALESCE(NEW.reason_for_sentiment, p.latest_reason),
+      updated_at = now();
+  RETURN NULL;
+END;
+$$;
+
+-- Deleted or changed mentions: recompute each affected company once.
+-- Updates that leave every profile input unchanged (e.g. the article_mode
+-- sync after a re-classification) are skipped.
+CREATE OR REPLACE FUNCTION company_analysis_profile_refresh_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_company_ids INTEGER[];
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    SELECT array_agg(DISTINCT company_id) INTO v_company_ids FROM old_rows WHERE company_id IS NOT NULL;
+  ELSE
+    SELECT array_agg(DISTINCT changed.company_id) INTO v_company_ids
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    CROSS JOIN LATERAL (VALUES (o.company_id), (n.company_id)) AS changed(company_id)
+    WHERE changed.company_id IS NOT NULL
+      AND (o.company_id, o.article_analysis_id, o.sentiment, o.risk_type, o.reason_for_sentiment,
+           o.article_countries, o.article_commodities, o.article_contract_value)
+          IS DISTINCT FROM
+          (n.company_id, n.article_analysis_id, n.sentiment, n.risk_type, n.reason_for_sentiment,
+           n.article_countries, n.article_commodities, n.article_contract_value);
+  END IF;
+  IF v_company_ids IS NOT NULL THEN
+    PERFORM refresh_company_profiles(v_company_ids);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS company_analysis_profile_insert ON company_analysis;
+CREATE TRIGGER company_analysis_profile_insert
+AFTER INSERT ON company_analysis
+FOR EACH ROW EXECUTE FUNCTION company_analysis_profile_insert_trigger();
+
+DROP TRIGGER IF EXISTS company_analysis_profile_delete ON company_analysis;
+CREATE TRIGGER company_analysis_profile_delete
+AFTER DELETE ON company_analysis
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_analysis_profile_refresh_trigger();
+
+-- Transition tables cannot be combined with an UPDATE OF column list (or a
+-- WHEN clause on NEW/OLD), so the function filters unchanged rows itself.
+DROP TRIGGER IF EXISTS company_analysis_profile_update ON company_analysis;
+CREATE TRIGGER company_analysis_profile_update
+AFTER UPDATE ON company_analysis
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_analysis_profile_refresh_trigger();
+
+SELECT refresh_company_profiles();